@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright and related rights waived via CC0
+# https://creativecommons.org/publicdomain/zero/1.0/legalcode
+
+# Replaying recorded terminal sessions through the text pipeline to measure it
+
+# for reading asciinema casts
+import json
+# for the peak memory use
+import resource
+# for timing the stages and playing in real time
+import time
+
+# for the stages of the pipeline
+from papertty.pipeline import FramePipeline
+
+
+def read_cast(path):
+    """Read an asciinema v2 cast file, return its header and a list of its
+       (time, type, data) events"""
+    with open(path, encoding='utf-8') as cast:
+        header = json.loads(cast.readline())
+        if header.get('version') != 2:
+            raise ValueError("{} is not an asciinema v2 cast".format(path))
+        events = [tuple(json.loads(line)) for line in cast if line.strip()]
+    return header, events
+
+
+def percentile(values, fraction):
+    """Return the nearest rank percentile of a sorted list"""
+    if not values:
+        return 0
+    return values[min(int(fraction * len(values)), len(values) - 1)]
+
+
+class Timings:
+    """Collects the durations of the stages of the pipeline"""
+
+    def __init__(self):
+        self.durations = {}
+
+    def add(self, stage, seconds):
+        self.durations.setdefault(stage, []).append(seconds)
+
+    def marks(self, stages):
+        """Return how many durations each stage has so far, for since()"""
+        return {stage: len(self.durations.get(stage, ())) for stage in stages}
+
+    def since(self, marks):
+        """Return the total of the durations added to the stages after marks()"""
+        return sum(sum(self.durations.get(stage, [])[count:]) for stage, count in marks.items())
+
+    def stats(self, stage):
+        """Return the number of calls, the total and the 50th, 90th and 99th percentile
+           and the longest duration (in ms) of a stage"""
+        durations = sorted(self.durations.get(stage, []))
+        return {
+            'calls': len(durations),
+            'total': sum(durations) * 1000,
+            'p50': percentile(durations, 0.5) * 1000,
+            'p90': percentile(durations, 0.9) * 1000,
+            'p99': percentile(durations, 0.99) * 1000,
+            'max': (durations[-1] if durations else 0) * 1000,
+        }
+
+
+class TransferMeter:
+    """Counts and times what a driver would send to the panel"""
+
+    def __init__(self, driver, timings):
+        self.timings = timings
+        self.driver = driver
+        self.draws = 0
+        self.pixels = 0
+        self.bytes = 0
+        draw = driver.draw
+        draw_multi = getattr(driver, 'draw_multi', None)
+
+        def metered_draw(x, y, image, *args, **kwargs):
+            self.count(image)
+            start = time.perf_counter()
+            draw(x, y, image, *args, **kwargs)
+            self.timings.add('draw', time.perf_counter() - start)
+
+        def metered_draw_multi(images, *args, **kwargs):
+            for item in images:
+                self.count(item['image'])
+            start = time.perf_counter()
+            draw_multi(images, *args, **kwargs)
+            self.timings.add('draw', time.perf_counter() - start)
+
+        driver.draw = metered_draw
+        if draw_multi:
+            driver.draw_multi = metered_draw_multi
+
+    def count(self, image):
+        # as many bits per pixel as the driver sends, the same as plan_draws assumes
+        self.draws += 1
+        self.pixels += image.width * image.height
+        self.bytes += image.width * image.height * self.driver.transfer_bits(image.mode) // 8
+
+
+def emulate_multi_draw(driver):
+    """Let a driver that draws one area at a time take several at once, like the IT8951"""
+    draw = driver.draw
+
+    def draw_multi(images):
+        for item in images:
+            draw(item['x'], item['y'], item['image'])
+
+    driver.draw_multi = draw_multi
+    driver.supports_multi_draw = True
+
+
+def peak_rss():
+    """Return the peak resident set size of the process in KiB"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def replay(ptty, screen, events, scheduler, speed=0, **textargs):
+    """Play the output events of a cast through the terminal emulator and render it
+       like the pty command would. With a speed, the events are played at that rate
+       of the recorded time, otherwise as fast as possible with the recorded times
+       deciding which frames are coalesced. Returns the timings, the transfer meter
+       and the number of frames drawn."""
+    timings = Timings()
+    meter = TransferMeter(ptty.driver, timings)
+    # time the stages of the text pipeline as well
+    ptty.stage_hook = timings.add
+    ptty.text_pipeline = ptty.image_pipeline = None
+    state = {'oldbuff': None, 'oldimage': None, 'oldcursor': None, 'frames': 0}
+
+    def draw(now):
+        frame_start = time.perf_counter()
+        buff = screen.snapshot()
+        cursor = buff.cursor if screen.cursor_visible else None
+        timings.add('snapshot', time.perf_counter() - frame_start)
+        if state['oldbuff'] is None or buff.changed or cursor != state['oldcursor']:
+            marks = timings.marks(FramePipeline.STAGES)
+            start = time.perf_counter()
+            state['oldimage'] = ptty.showtext(buff, fill=ptty.black, cursor=cursor,
+                                              oldimage=state['oldimage'],
+                                              oldtext=state['oldbuff'],
+                                              oldcursor=state['oldcursor'],
+                                              **textargs)
+            elapsed = time.perf_counter() - start
+            # leave out the stages of the pipeline, the driver is timed within sending
+            timings.add('render', elapsed - timings.since(marks))
+            state['oldcursor'] = cursor
+            state['frames'] += 1
+        state['oldbuff'] = buff
+        scheduler.drawn(now)
+        timings.add('frame', time.perf_counter() - frame_start)
+
+    pending = False
+    start = time.monotonic()
+    for timestamp, kind, data in events:
+        if speed:
+            # wait for the event, drawing the pending output once it's due; the
+            # scheduler goes by the time of the cast, as if it was played at 1x
+            while True:
+                now = (time.monotonic() - start) * speed
+                if pending and not scheduler.delay(now):
+                    draw(now)
+                    pending = False
+                if now >= timestamp:
+                    break
+                wait = min(timestamp - now, scheduler.delay(now)) if pending else timestamp - now
+                time.sleep(wait / speed)
+        else:
+            now = timestamp
+            if pending and not scheduler.delay(now):
+                draw(now)
+                pending = False
+        if kind == 'o':
+            parse_start = time.perf_counter()
+            screen.feed(data)
+            timings.add('parse', time.perf_counter() - parse_start)
+        elif kind == 'r':
+            cols, rows = (int(value) for value in data.split('x'))
+            screen.resize(rows, cols)
+            ptty.rows, ptty.cols = rows, cols
+            # the next frame is drawn from scratch
+            state['oldbuff'] = None
+        else:
+            continue
+        scheduler.changed(now)
+        pending = True
+        if not scheduler.delay(now):
+            draw(now)
+            pending = False
+    if pending:
+        draw((time.monotonic() - start) * speed if speed else events[-1][0])
+    return timings, meter, state['frames']
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright and related rights waived via CC0
+# https://creativecommons.org/publicdomain/zero/1.0/legalcode
+
+# Measuring how long drawing takes on the display at hand, and keeping the results
+# in a profile that is loaded at startup
+
+# for reading and writing the profiles
+import json
+# for the profile directory
+import os
+# for timing
+import time
+
+# for the test images
+from PIL import Image
+
+# Where the profiles are kept, one per driver
+PROFILE_DIR = os.path.join('~', '.config', 'papertty')
+
+# Sizes of the writes the bus is timed with, in bytes
+CHUNK_SIZES = (64, 512, 4096, 32768)
+# How many bytes to write at each chunk size
+BUS_BYTES = 65536
+# The chunk size the drivers send image data in (ie. the IT8951 driver)
+TRANSFER_CHUNK = 4096
+# How many areas to draw at once when timing draw_multi
+MULTI_COUNTS = (1, 2, 4, 8)
+
+
+def profile_path(driver):
+    """Return the path of the profile of a driver (by its name)"""
+    return os.path.expanduser(os.path.join(PROFILE_DIR, '{}.json'.format(driver)))
+
+
+def load_profile(path):
+    """Return the profile in a file, or None if there's none (or it's broken)"""
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        print("Ignoring calibration profile {}: {}".format(path, e))
+        return None
+
+
+def save_profile(profile, path):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(profile, f, indent=2)
+        f.write('\n')
+
+
+def apply_profile(driver, profile):
+    """Use the cost model of a profile for planning the draws on a driver"""
+    for name, value in profile.get('cost', {}).items():
+        if name in ('draw_overhead', 'byte_cost', 'refresh_cost'):
+            setattr(driver, name, float(value))
+
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+
+def fit_line(points):
+    """Least squares fit of y = a + b * x to (x, y) points, return (a, b)"""
+    n = len(points)
+    mean_x = sum(x for x, _ in points) / n
+    mean_y = sum(y for _, y in points) / n
+    spread = sum((x - mean_x) ** 2 for x, _ in points)
+    if not spread:
+        return mean_y, 0.0
+    slope = sum((x - mean_x) * (y - mean_y) for x, y in points) / spread
+    return mean_y - slope * mean_x, slope
+
+
+def timed(action, repeat):
+    """Return the median duration of an action in seconds"""
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        action()
+        durations.append(time.perf_counter() - start)
+    return median(durations)
+
+
+class Calibration:
+    """Times the bus, the update modes and the refreshes of an initialized driver,
+       drawing only white so that the display stays blank"""
+
+    def __init__(self, driver, xdiv=8, ydiv=1, repeat=3, log=print):
+        self.driver = driver
+        self.xdiv = xdiv
+        self.ydiv = ydiv
+        self.repeat = repeat
+        self.log = log
+
+    def white(self, width, height):
+        return Image.new('1', (width, height), self.driver.white)
+
+    def small_area(self):
+        """The smallest area that can be drawn with the alignment"""
+        return self.white(max(self.xdiv, 8), max(self.ydiv, 8))
+
+    def draw(self, image, x=0, y=0, mode=None):
+        if mode is None:
+            self.driver.draw(x, y, image)
+        else:
+            self.driver.draw(x, y, image, mode)
+        self.driver.wait_for_update()
+
+    def bus(self):
+        """Return the throughput (bytes/s) by chunk size and the overhead of a write (s),
+           or None if the driver can't write to the bus by itself"""
+        if not self.driver.bus_write([0]):
+            return None
+        rates = {}
+        points = []
+        for size in CHUNK_SIZES:
+            chunk = [0] * size
+            count = max(BUS_BYTES // size, 1)
+
+            def write():
+                for _ in range(count):
+                    self.driver.bus_write(chunk)
+
+            seconds = timed(write, self.repeat)
+            rates[str(size)] = size * count / seconds if seconds else 0
+            points.append((size, seconds / count))
+            self.log("Bus: {:>6} byte writes {:>10.0f} bytes/s".format(size, rates[str(size)]))
+        overhead, _ = fit_line(points)
+        return {'chunks': rates, 'write_overhead': max(overhead, 0)}
+
+    def modes(self):
+        """Return how long each update mode the driver can be told to use takes, for a
+           small area and for the whole display"""
+        results = {}
+        full = self.white(self.driver.width, self.driver.height)
+        small = self.small_area()
+        for name, mode in sorted(self.driver.update_modes().items()):
+            results[name] = {
+                'small': timed(lambda: self.draw(small, mode=mode), self.repeat),
+                'full': timed(lambda: self.draw(full, mode=mode), self.repeat),
+            }
+            self.log("Mode {}: {:.3f} s for a small area, {:.3f} s for the whole display".format(
+                name, results[name]['small'], results[name]['full']))
+        return results
+
+    def full_refresh(self, reinit):
+        """Return how long drawing the whole display with a full refresh takes. Panels
+           with a partial refresh LUT are switched to the full one with reinit(partial)."""
+        full = self.white(self.driver.width, self.driver.height)
+        switch = self.driver.supports_partial and self.driver.partial_refresh is not None
+        if switch:
+            reinit(False)
+        seconds = timed(lambda: self.draw(full), self.repeat)
+        if switch:
+            reinit(True)
+        self.log("Full refresh: {:.3f} s".format(seconds))
+        return seconds
+
+    def partial_refresh(self):
+        """Return the fixed time of a partial update (s) and the time per byte sent (s),
+           from drawing areas of growing height across the display"""
+        width = self.driver.width
+        bits = self.driver.transfer_bits('1')
+        points = []
+        for fraction in (16, 4, 1):
+            height = max(self.driver.height // fraction // self.ydiv * self.ydiv, self.ydiv)
+            seconds = timed(lambda: self.draw(self.white(width, height)), self.repeat)
+            points.append((width * height * bits / 8, seconds))
+        fixed, per_byte = fit_line(points)
+        self.log("Partial refresh: {:.3f} s + {:.3f} us per byte".format(fixed, per_byte * 1e6))
+        return max(fixed, 0), max(per_byte, 0)
+
+    def multi_overhead(self):
+        """Return how much each more area adds to a draw_multi (s)"""
+        small = self.small_area()
+        points = []
+        for count in MULTI_COUNTS:
+            # side by side along the top of the display
+            images = [{"x": i * small.width, "y": 0, "image": small} for i in range(count)
+                      if (i + 1) * small.width <= self.driver.width]
+
+            def draw():
+                self.driver.draw_multi(images)
+                self.driver.wait_for_update()
+
+            points.append((len(images), timed(draw, self.repeat)))
+        _, per_area = fit_line(points)
+        self.log("Multi draw: {:.3f} ms per area".format(per_area * 1000))
+        return max(per_area, 0)
+
+    def run(self, reinit):
+        """Measure everything the driver allows, return the results and the cost model
+           that follows from them"""
+        driver = self.driver
+        results = {'bus': self.bus(), 'modes': self.modes(), 'full_refresh': self.full_refresh(reinit)}
+        cost = {
+            'draw_overhead': driver.draw_overhead,
+            'byte_cost': driver.byte_cost,
+            'refresh_cost': driver.refresh_cost,
+        }
+        if results['bus']:
+            cost['draw_overhead'] = results['bus']['write_overhead']
+            rate = results['bus']['chunks'][str(TRANSFER_CHUNK)]
+            if rate:
+                cost['byte_cost'] = 1 / rate
+        if driver.supports_multi_draw:
+            results['multi_overhead'] = cost['draw_overhead'] = self.multi_overhead()
+        if driver.supports_partial:
+            fixed, per_byte = self.partial_refresh()
+            results['partial_refresh'] = {'fixed': fixed, 'byte': per_byte}
+            cost['refresh_cost'] = max(fixed - cost['draw_overhead'], 0)
+            if not results['bus']:
+                cost['byte_cost'] = per_byte
+        else:
+            cost['refresh_cost'] = results['full_refresh']
+        results['cost'] = cost
+        return results
@@ -0,0 +1,482 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright and related rights waived via CC0
+# https://creativecommons.org/publicdomain/zero/1.0/legalcode
+
+# Reading the Linux virtual console devices (/dev/vcsa*, /dev/vcs*, /dev/vcsu*),
+# or stand-ins for them
+
+# for decoding the text buffer
+import codecs
+# for opening and reading the device files
+import os
+# for telling devices from files and FIFOs
+import stat
+# for choosing the native UTF-32 codec
+import sys
+# for playing frames at a rate
+import time
+
+# Optional dependency - fall back to memoryviews if NumPy is not available
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# vcsu holds one native endian 32-bit codepoint per cell
+UTF32 = 'utf_32_le' if sys.byteorder == 'little' else 'utf_32_be'
+
+
+def vcsu_errors(error):
+    """Codec error handler for vcsu rows: some kernels return 0x20202020 instead of
+       0x20 for blank cells, decode those as spaces and anything else invalid as U+FFFD.
+       The decoder reports whole 4-byte cells, so unlike a bytes.replace() over the
+       buffer this can't match across cell boundaries."""
+    if isinstance(error, UnicodeDecodeError):
+        cell = error.object[error.start:error.start + 4]
+        return (' ' if cell == b'\x20\x20\x20\x20' else '\ufffd'), error.start + 4
+    raise error
+
+
+codecs.register_error('papertty_vcsu', vcsu_errors)
+
+
+def first_difference(a, b):
+    """Return the index of the first differing item of two sequences (or the length
+       of the shorter one if it's a prefix of the other). Bisects with slice
+       comparisons, which run at memcmp speed instead of a Python loop per item."""
+    n = min(len(a), len(b))
+    lo, hi = 0, n
+    if a[:n] == b[:n]:
+        return n
+    # invariant: a[:lo] == b[:lo] and the first difference is in a[lo:hi]
+    while hi - lo > 1:
+        mid = (lo + hi) // 2
+        if a[lo:mid] == b[lo:mid]:
+            lo = mid
+        else:
+            hi = mid
+    return lo
+
+
+def last_difference(a, b):
+    """Return the index of the last differing item of two sequences of equal
+       length, or -1 if they are equal"""
+    lo, hi = 0, len(a)
+    if a == b:
+        return -1
+    # invariant: a[hi:] == b[hi:] and the last difference is in a[lo:hi]
+    while hi - lo > 1:
+        mid = (lo + hi) // 2
+        if a[mid:hi] == b[mid:hi]:
+            hi = mid
+        else:
+            lo = mid
+    return lo
+
+
+def pread_into(fd, buffer, offset=0):
+    """Read from fd at offset into a preallocated buffer without allocating a new one,
+       return the number of bytes read"""
+    if hasattr(os, 'preadv'):
+        return os.preadv(fd, [buffer], offset)
+    # Python < 3.7 has no preadv, so copy over from a temporary
+    data = os.pread(fd, len(buffer), offset)
+    buffer[:len(data)] = data
+    return len(data)
+
+
+class ConsoleSnapshot:
+    """A snapshot of the console text. The buffer is viewed as an array of codepoints
+       (or bytes in 8-bit mode) with a view per row, and rows are decoded into strings
+       only when they are actually asked for. Behaves like a sequence of row strings."""
+
+    def __init__(self, rows, cols, x, y, buffer, character_width, encoding, vcsa=None):
+        self.rows = rows
+        self.cols = cols
+        self.buffer = buffer
+        self.vcsa = vcsa
+        self.character_width = character_width
+        self.raw = memoryview(buffer)[:rows * cols * character_width]
+        if character_width == 4:
+            self.encoding = UTF32
+            self.errors = 'papertty_vcsu'
+            if numpy:
+                self.cells = numpy.frombuffer(buffer, dtype=numpy.uint32, count=rows * cols).reshape(rows, cols)
+            else:
+                self.cells = self.raw.cast('I')
+        else:
+            self.encoding = encoding
+            self.errors = 'replace'
+            if numpy:
+                self.cells = numpy.frombuffer(buffer, dtype=numpy.uint8, count=rows * cols).reshape(rows, cols)
+            else:
+                self.cells = self.raw
+        # the attribute bytes are interleaved with the characters in the contents of vcsa
+        if vcsa is None:
+            self.attrs = None
+        elif numpy:
+            self.attrs = numpy.frombuffer(vcsa, dtype=numpy.uint8, count=rows * cols * 2,
+                                          offset=VirtualConsole.header_size)[1::2].reshape(rows, cols)
+        else:
+            start = VirtualConsole.header_size + 1
+            self.attrs = memoryview(vcsa)[start:start + rows * cols * 2:2]
+        self.decoded = [None] * rows
+        self._digests = None
+        # find character under cursor (in case using a non-fixed width font)
+        self.cursor = (x, y, self.decode(self.cell_range(y, x, x + 1)))
+
+    def cell_range(self, row, start, end):
+        """Return a view to the raw bytes of cells start...end-1 on a row"""
+        offset = row * self.cols
+        width = self.character_width
+        return self.raw[(offset + start) * width:(offset + end) * width]
+
+    def decode(self, raw):
+        return codecs.decode(raw, self.encoding, self.errors)
+
+    def row_cells(self, row):
+        """Return a (zero-copy) view to the codepoints of a row"""
+        if numpy:
+            return self.cells[row]
+        return self.cells[row * self.cols:(row + 1) * self.cols]
+
+    @property
+    def digests(self):
+        """Per-row digests of the raw cells, computed once per snapshot"""
+        if self._digests is None:
+            size = self.cols * self.character_width
+            raw = self.raw
+            self._digests = [hash(raw[offset:offset + size].tobytes())
+                             for offset in range(0, self.rows * size, size)]
+            if self.attrs is not None:
+                # attribute only changes (ie. a moving selection bar) are changes too
+                self._digests = [hash((digest, self.row_attrs(row))) for row, digest in enumerate(self._digests)]
+        return self._digests
+
+    def sample(self):
+        """Return the snapshot for comparing later snapshots with: the digests are
+           computed now, while the buffer still holds this snapshot, as the next read
+           that doesn't keep it reuses the buffer"""
+        self.digests
+        return self
+
+    def comparable(self, other):
+        """Check if the rows of another snapshot can be compared cell by cell with these"""
+        return isinstance(other, ConsoleSnapshot) and \
+            (self.rows, self.cols, self.character_width) == (other.rows, other.cols, other.character_width) and \
+            (self.attrs is None) == (other.attrs is None)
+
+    def scroll_from(self, other):
+        """Return how many rows the text has scrolled up since another snapshot if that
+           is known without comparing them, otherwise None"""
+        return None
+
+    def row_changed(self, other, row, other_row=None):
+        """Check whether a row differs from the same row (or other_row, ie. when the
+           console has scrolled) of a comparable snapshot"""
+        return self.digests[row] != other.digests[row if other_row is None else other_row]
+
+    def changed_span(self, other, row, other_row=None):
+        """Return the indexes of the first and last changed cell on a row compared to the
+           same row (or other_row) of a comparable snapshot, or None if it's unchanged"""
+        if other_row is None:
+            other_row = row
+        if not self.row_changed(other, row, other_row):
+            return None
+        if numpy:
+            changed = self.cells[row] != other.cells[other_row]
+            if self.attrs is not None:
+                changed |= self.attrs[row] != other.attrs[other_row]
+            changed = numpy.flatnonzero(changed)
+            if not len(changed):
+                return None
+            return int(changed[0]), int(changed[-1])
+        width = self.character_width
+        spans = [(self.cell_range(row, 0, self.cols).tobytes(), other.cell_range(other_row, 0, self.cols).tobytes(), width)]
+        if self.attrs is not None:
+            spans.append((self.row_attrs(row), other.row_attrs(other_row), 1))
+        first, last = self.cols, -1
+        for new, old, size in spans:
+            changed = last_difference(new, old)
+            if changed >= 0:
+                first = min(first, first_difference(new, old) // size)
+                last = max(last, changed // size)
+        return (first, last) if last >= 0 else None
+
+    def row_attrs(self, row):
+        """Return the attribute bytes of a row, or None if attributes weren't read"""
+        if self.attrs is None:
+            return None
+        if numpy:
+            return self.attrs[row].tobytes()
+        return self.attrs[row * self.cols:(row + 1) * self.cols].tobytes()
+
+    def __len__(self):
+        return self.rows
+
+    def __getitem__(self, row):
+        if row < 0:
+            row += self.rows
+        if not 0 <= row < self.rows:
+            raise IndexError('row out of range')
+        text = self.decoded[row]
+        if text is None:
+            text = self.decoded[row] = self.decode(self.cell_range(row, 0, self.cols))
+        return text
+
+    def __iter__(self):
+        return (self[row] for row in range(self.rows))
+
+    def __eq__(self, other):
+        if not isinstance(other, ConsoleSnapshot):
+            return NotImplemented
+        return self.comparable(other) and self.cursor == other.cursor and self.digests == other.digests
+
+    __hash__ = None
+
+    def __str__(self):
+        return '\n'.join(self)
+
+
+class ConsoleSource:
+    """Where the terminal command gets its console snapshots from"""
+
+    # vcsa starts with a header of rows, columns, cursor x, cursor y (one byte each)
+    header_size = 4
+
+    # a file descriptor that signals changes with POLLPRI, or None if it has to be sampled
+    poll_fd = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def poll_fds(self):
+        """Return all the file descriptors that signal changes with POLLPRI"""
+        return [] if self.poll_fd is None else [self.poll_fd]
+
+    def read(self, keep=None):
+        """Take a snapshot of the console. Snapshots may share buffers with the source,
+           so pass the previous snapshot that is still in use as `keep` to avoid
+           overwriting it."""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class VirtualConsole(ConsoleSource):
+    """Keeps the vcsa and text (vcs/vcsu) devices of a virtual console open for the
+       whole session and reads snapshots of them into preallocated buffers"""
+
+    def __init__(self, vcsa, textdev, character_width, encoding='utf-8', attributes=False):
+        self.vcsa = vcsa
+        self.textdev = textdev
+        self.character_width = character_width
+        self.encoding = encoding
+        self.attributes = attributes
+        self.rows = 0
+        self.cols = 0
+        self.header = bytearray(self.header_size)
+        # two buffers, so that the previous snapshot stays intact while reading a new one
+        self.buffers = [bytearray(), bytearray()]
+        self.vcsa_fd = os.open(vcsa, os.O_RDONLY)
+        self.text_fd = os.open(textdev, os.O_RDONLY)
+        self.poll_fd = self.vcsa_fd
+
+    def close(self):
+        """Close the device files"""
+        os.close(self.vcsa_fd)
+        os.close(self.text_fd)
+
+    def resize(self, rows, cols):
+        """Reallocate the text buffers for a console of a new size - snapshots
+           still referring to the old buffers keep them alive"""
+        self.rows = rows
+        self.cols = cols
+        size = rows * cols * self.character_width
+        self.buffers = [bytearray(size), bytearray(size)]
+        if self.attributes:
+            # the whole vcsa: header and (character, attribute) pairs
+            size = self.header_size + rows * cols * 2
+            self.vcsa_buffers = [bytearray(size), bytearray(size)]
+
+    def read(self, keep=None):
+        index = 1 if keep is not None and getattr(keep, 'buffer', None) is self.buffers[0] else 0
+        if self.attributes:
+            # read the header and the attributes with a single call, unless the console was resized
+            vcsa = self.vcsa_buffers[index] if self.rows else self.header
+            pread_into(self.vcsa_fd, vcsa)
+            rows, cols, x, y = vcsa[:self.header_size]
+            if (rows, cols) != (self.rows, self.cols):
+                self.resize(rows, cols)
+                vcsa = self.vcsa_buffers[index]
+                pread_into(self.vcsa_fd, vcsa)
+                # should it have been resized again in between, the next read will catch up
+                x, y = vcsa[2], vcsa[3]
+        else:
+            vcsa = None
+            pread_into(self.vcsa_fd, self.header)
+            rows, cols, x, y = self.header
+            # the console was resized (or this is the first read)
+            if (rows, cols) != (self.rows, self.cols):
+                self.resize(rows, cols)
+        buffer = self.buffers[index]
+        pread_into(self.text_fd, buffer)
+        return ConsoleSnapshot(rows, cols, x, y, buffer, self.character_width, self.encoding, vcsa)
+
+
+class SyntheticConsole(ConsoleSource):
+    """A stand-in for a virtual console that plays frames in the format of vcsa (the
+       header and (character, attribute) pairs) from any iterable, ie. a recording or
+       a generator, so the terminal command can run without a console.
+
+       With a rate, the frames are played at that many frames per second, skipping the
+       ones that weren't read in time like a real console would. Otherwise each read
+       takes the next frame. The last frame stays on when they run out."""
+
+    def __init__(self, frames, rate=0, encoding='latin_1', attributes=False):
+        self.frames = iter(frames)
+        self.rate = rate
+        self.encoding = encoding
+        self.attributes = attributes
+        self.index = -1
+        self.start = None
+        self.snapshot = None
+        self.finished = False
+
+    def advance(self):
+        """Move on to the frame that is due, return True if there was a new one"""
+        if self.rate:
+            now = time.monotonic()
+            if self.start is None:
+                self.start = now
+            due = int((now - self.start) * self.rate)
+        else:
+            due = self.index + 1
+        frame = None
+        while self.index < due and not self.finished:
+            try:
+                frame = next(self.frames)
+                self.index += 1
+            except StopIteration:
+                self.finished = True
+        if frame is None:
+            return False
+        rows, cols, x, y = frame[:self.header_size]
+        text = bytes(frame[self.header_size:self.header_size + rows * cols * 2:2])
+        self.snapshot = ConsoleSnapshot(rows, cols, x, y, text, 1, self.encoding,
+                                        frame if self.attributes else None)
+        return True
+
+    def read(self, keep=None):
+        self.advance()
+        if self.snapshot is None:
+            raise EOFError("No frames to show")
+        return self.snapshot
+
+    def close(self):
+        """Close the frames if they come from a file"""
+        if hasattr(self.frames, 'close'):
+            self.frames.close()
+
+
+class ActiveConsole(ConsoleSource):
+    """Follows the virtual console in the foreground (ie. switched to with Alt-Fn), as
+       told by /sys/class/tty/tty0/active. Each console is opened the first time it
+       comes to the foreground and then kept open with its buffers, so switching back
+       and forth doesn't reopen anything. The snapshots of different consoles can be
+       compared row by row, so a switch only redraws the rows that differ from what
+       the previous console left on the display."""
+
+    active_path = '/sys/class/tty/tty0/active'
+
+    def __init__(self, open_console):
+        # opens the console source of a vcsa device, or returns None if it can't
+        self.open_console = open_console
+        self.active_fd = os.open(self.active_path, os.O_RDONLY)
+        self.consoles = {}
+        self.name = None
+        self.console = None
+        self.switch()
+        if self.console is None:
+            self.close()
+            raise OSError("Can't open the active console {}".format(self.name))
+
+    @property
+    def vcsa(self):
+        return self.console.vcsa
+
+    @property
+    def poll_fd(self):
+        return self.console.poll_fd
+
+    def poll_fds(self):
+        # sysfs signals changes to the active console with POLLPRI as well
+        return self.console.poll_fds() + [self.active_fd]
+
+    def active(self):
+        """Return the name of the console in the foreground, ie. tty2"""
+        return os.pread(self.active_fd, 32, 0).decode().strip()
+
+    def switch(self):
+        """Move on to the console in the foreground, return True if it changed. A console
+           that can't be opened is skipped, the previous one stays on."""
+        name = self.active()
+        if name == self.name:
+            return False
+        self.name = name
+        if name not in self.consoles:
+            self.consoles[name] = self.open_console('/dev/' + name.replace('tty', 'vcsa'))
+        console = self.consoles[name]
+        if console is None or console is self.console:
+            return False
+        self.console = console
+        return True
+
+    def read(self, keep=None):
+        self.switch()
+        return self.console.read(keep)
+
+    def close(self):
+        for console in self.consoles.values():
+            if console is not None:
+                console.close()
+        os.close(self.active_fd)
+
+
+def vcsa_frames(path):
+    """Yield the frames of a file or a FIFO of concatenated vcsa dumps,
+       ie. `cat /dev/vcsa1 >> frames` once in a while"""
+    with open(path, 'rb') as frames:
+        while True:
+            header = frames.read(ConsoleSource.header_size)
+            if len(header) < ConsoleSource.header_size:
+                return
+            size = header[0] * header[1] * 2
+            cells = frames.read(size)
+            if len(cells) < size:
+                return
+            yield header + cells
+
+
+def vcsa_frame(lines, cols, x=0, y=0, attribute=0x07):
+    """Build a vcsa frame of 8-bit text (ie. for generating synthetic load),
+       with one attribute for all of it"""
+    cells = bytearray()
+    for line in lines:
+        text = line.encode('latin_1', 'replace')[:cols].ljust(cols)
+        row = bytearray(cols * 2)
+        row[0::2] = text
+        row[1::2] = bytes([attribute]) * cols
+        cells += row
+    return bytes([len(lines), cols, x, y]) + bytes(cells)
+
+
+def is_device(path):
+    """Check if a path is a character device (ie. a real vcsa) rather than a file or FIFO"""
+    return stat.S_ISCHR(os.stat(path).st_mode)
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright and related rights waived via CC0
+# https://creativecommons.org/publicdomain/zero/1.0/legalcode
+
+# Finding the areas that changed between two frames
+
+# for the fallback of one bounding box
+from PIL import ImageChops
+
+# Optional dependency - fall back to one bounding box of the changes if NumPy is not available
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# The smallest tile the changes are tracked in, rounded up to the alignment of the driver
+TILE_WIDTH = 32
+TILE_HEIGHT = 16
+
+# How many of the boxes before it a box may be merged with when planning the draws,
+# besides merging it with all of them
+PLAN_WINDOW = 8
+# Up to this many boxes, the draws are planned without the window
+PLAN_EXACT = 32
+
+
+def tile_size(xdiv=8, ydiv=1):
+    """Return the size of the dirty tiles for a driver alignment"""
+    return -(-TILE_WIDTH // xdiv) * xdiv, -(-TILE_HEIGHT // ydiv) * ydiv
+
+
+def dirty_tiles(new, old, width, height):
+    """Return a grid of booleans telling which tiles of width x height pixels differ
+       between two images of the same size and mode"""
+    a = numpy.asarray(new)
+    b = numpy.asarray(old)
+    changed = a != b
+    if changed.ndim == 3:
+        # one value per channel
+        changed = changed.any(axis=2)
+    rows = -(-changed.shape[0] // height)
+    cols = -(-changed.shape[1] // width)
+    padded = numpy.zeros((rows * height, cols * width), dtype=bool)
+    padded[:changed.shape[0], :changed.shape[1]] = changed
+    return padded.reshape(rows, height, cols, width).any(axis=(1, 3))
+
+
+def merge_tiles(grid):
+    """Turn a grid of dirty tiles into rectangles (in tiles, with exclusive ends): the
+       runs of dirty tiles on each row, with the same runs on the following rows
+       merged into them"""
+    rects = []
+    # (first column, end column) -> the rectangle the run of the previous row belongs to
+    previous = {}
+    for row, tiles in enumerate(grid):
+        edges = numpy.flatnonzero(numpy.diff(numpy.concatenate(([0], tiles.view(numpy.int8), [0]))))
+        current = {}
+        for start, end in zip(edges[::2].tolist(), edges[1::2].tolist()):
+            rect = previous.get((start, end))
+            if rect is None:
+                rect = [start, row, end, row + 1]
+                rects.append(rect)
+            else:
+                rect[3] = row + 1
+            current[(start, end)] = rect
+        previous = current
+    return [tuple(rect) for rect in rects]
+
+
+def union(a, b):
+    return min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])
+
+
+def plan_draws(boxes, fixed, transfer, window=PLAN_WINDOW):
+    """Group consecutive boxes (ie. rows from top to bottom) into a cheap list of
+       boxes to draw, where drawing a box costs `fixed` plus transfer(box) - the
+       bounding box of a group has to be sent whole, but separate draws each have
+       their overhead. transfer() must not decrease when a box grows.
+
+       A dynamic program over the boxes in order. With up to PLAN_EXACT boxes every
+       grouping is considered and the plan is the cheapest; with more, a group ending
+       at a box starts at most `window` boxes before it or at the first box, so the
+       plan is an approximation that may miss a cheaper grouping of longer runs.
+       Groups stop growing as soon as they alone cost more than the best plan found,
+       which doesn't change the result, so this takes O(n) time for long lists."""
+    count = len(boxes)
+    if count < 2:
+        return list(boxes)
+    if count <= PLAN_EXACT:
+        window = count
+    # best[j] is the cost of drawing the first j boxes, starts[j] where its last group starts
+    best = [0] * (count + 1)
+    starts = [0] * (count + 1)
+    everything = boxes[0]
+    for j in range(1, count + 1):
+        everything = union(everything, boxes[j - 1])
+        group = boxes[j - 1]
+        best[j] = None
+        for i in range(j - 1, max(j - 1 - window, -1), -1):
+            group = union(group, boxes[i])
+            cost = fixed + transfer(group)
+            if best[j] is not None and cost >= best[j]:
+                break
+            if best[j] is None or best[i] + cost < best[j]:
+                best[j], starts[j] = best[i] + cost, i
+        cost = fixed + transfer(everything)
+        if cost < best[j]:
+            best[j], starts[j] = cost, 0
+    plan = []
+    j = count
+    while j > 0:
+        i = starts[j]
+        group = boxes[i]
+        for box in boxes[i + 1:j]:
+            group = union(group, box)
+        plan.append(group)
+        j = i
+    plan.reverse()
+    return plan
+
+
+def dirty_rects(new, old, xdiv=8, ydiv=1):
+    """Return the boxes that cover what differs between two images of the same size,
+       aligned to xdiv/ydiv, from top to bottom. Changes far apart get boxes of their
+       own instead of one bounding box that covers everything between them."""
+    if numpy is None:
+        bbox = ImageChops.difference(new, old).getbbox()
+        if not bbox:
+            return []
+        return [(bbox[0] // xdiv * xdiv, bbox[1] // ydiv * ydiv,
+                 min(-(-bbox[2] // xdiv) * xdiv, new.width), min(-(-bbox[3] // ydiv) * ydiv, new.height))]
+    width, height = tile_size(xdiv, ydiv)
+    rects = merge_tiles(dirty_tiles(new, old, width, height))
+    return [(x0 * width, y0 * height, min(x1 * width, new.width), min(y1 * height, new.height))
+            for x0, y0, x1, y1 in rects]
@@ -69,6 +69,12 @@ class IT8951(WaveshareEPD):
     Back_Gray_Val = 0xF0
     Front_Gray_Val = 0x00
 
+    #Cost model for planning the draws: the image data goes over SPI from Python,
+    #and all the areas of a draw_multi share one (A2 or DU) refresh.
+    draw_overhead = 0.001
+    byte_cost = 0.000001
+    refresh_cost = 0.12
+
     def __init__(self):
         super().__init__("IT8951", None, None)
         self.supports_partial = True
@@ -77,6 +83,7 @@ class IT8951(WaveshareEPD):
         self.align_1bpp_width = 32
         self.align_1bpp_height = 16
         self.supports_multi_draw = True
+        self.supports_grayscale = True
 
     def delay_ms(self, delaytime):
         time.sleep(float(delaytime) / 1000.0)
@@ -186,6 +193,7 @@ class IT8951(WaveshareEPD):
             self.SPI.max_speed_hz = int(mhz * 1000000)
         else:
             self.SPI.max_speed_hz = 2000000
+        self.SPI.setSpeed(self.SPI.max_speed_hz)
         print("SPI Speed = %.02f Mhz" % (self.SPI.max_speed_hz / 1000.0 / 1000.0))
         
         # It is unclear why this is necessary but it appears to be. The sample
@@ -445,6 +453,46 @@ class IT8951(WaveshareEPD):
             else:
                 self.display_area(x, y, width, height, update_mode)
 
+    def transfer_bits(self, mode):
+        #Black and white images are sent in 1bpp mode if it's enabled, others in 4bpp
+        return 1 if mode == "1" and self.enable_1bpp else 4
+
+    def draw_clean(self, x, y, image):
+        self.draw(x, y, image, self.DISPLAY_UPDATE_MODE_GC16)
+
+    def update_kind(self, mode, fast=False):
+        #Black and white images are drawn with A2 or DU, others with GC16 which
+        #leaves no ghosting
+        if mode != "1":
+            return 'clean'
+        return 'fast' if self.supports_a2 and self.enable_a2 else 'partial'
+
+    def wait_for_update(self):
+        self.wait_for_display_ready()
+
+    def update_modes(self):
+        modes = {"DU":self.DISPLAY_UPDATE_MODE_DU, "GC16":self.DISPLAY_UPDATE_MODE_GC16}
+        if self.supports_a2 and self.enable_a2:
+            modes["A2"] = self.DISPLAY_UPDATE_MODE_A2
+        return modes
+
+    def bus_write(self, data):
+        #The controller ignores what is sent while CS is high
+        GPIO.output(self.CS_PIN, GPIO.HIGH)
+        self.spi_write(data)
+        return True
+
+    def draw_fast(self, x, y, image):
+        #Black and white areas can always use the fastest update mode, also when they
+        #aren't aligned for (or enabled) 1bpp transfers
+        if image.mode == "1":
+            if self.supports_a2 and self.enable_a2:
+                self.draw(x, y, image, self.DISPLAY_UPDATE_MODE_A2)
+            else:
+                self.draw(x, y, image, self.DISPLAY_UPDATE_MODE_DU)
+        else:
+            self.draw(x, y, image)
+
     def clear(self):
         image = Image.new('1', (self.width, self.height), self.white)
         self.draw(0, 0, image, self.DISPLAY_UPDATE_MODE_INIT)
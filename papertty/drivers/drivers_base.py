@@ -151,6 +151,13 @@ class DisplayDriver(ABC):
     white = 255
     black = 0
 
+    # How long (in seconds) drawing takes, for planning which changed areas to draw
+    # together: the overhead of each draw, sending a byte of image data and refreshing
+    # the panel. Override these if needed.
+    draw_overhead = 0.002
+    byte_cost = 0.000004
+    refresh_cost = 0.3
+
     def __init__(self):
         super().__init__()
         self.name = None
@@ -165,6 +172,7 @@ class DisplayDriver(ABC):
         self.align_1bpp_width = None
         self.align_1bpp_height = None
         self.supports_multi_draw = None
+        self.supports_grayscale = None
 
     @abstractmethod
     def init(self, **kwargs):
@@ -176,6 +184,41 @@ class DisplayDriver(ABC):
         """Draw an image object on the display at (x,y)"""
         pass
 
+    def transfer_bits(self, mode):
+        """Return how many bits are sent to the display per pixel of an image in `mode`"""
+        return 1
+
+    def draw_fast(self, x, y, image):
+        """Draw a small image (ie. a typed character) at (x,y) with the lowest latency
+           the display can do - by default the same as draw"""
+        self.draw(x, y, image)
+
+    def draw_clean(self, x, y, image):
+        """Draw with the update that leaves no ghosting behind - by default the same
+           as draw, which is what drivers with a partial LUT do after init(partial=False)"""
+        self.draw(x, y, image)
+
+    def update_kind(self, mode, fast=False):
+        """Return how much ghosting drawing an image of a mode leaves behind: 'fast'
+           (with draw_fast), 'partial' or 'clean'"""
+        if not self.partial_refresh:
+            return 'clean'
+        return 'fast' if fast else 'partial'
+
+    def wait_for_update(self):
+        """Wait until the display has finished showing what was drawn - by default
+           draw does that already"""
+        pass
+
+    def update_modes(self):
+        """Return the update modes that draw can be told to use, by name"""
+        return {}
+
+    def bus_write(self, data):
+        """Send bytes over the bus without the display acting on them, to time the bus.
+           Returns False if the driver can't do that."""
+        return False
+
     def scrub(self, fillsize=16):
         """Scrub display - only works properly with partial refresh"""
         self.fill(self.black, fillsize=fillsize)
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright and related rights waived via CC0
+# https://creativecommons.org/publicdomain/zero/1.0/legalcode
+
+# Keeping track of where partial updates leave ghosting behind on the panel
+
+# The size of the areas the ghosting is tracked in, rounded up to the alignment of the driver
+TILE_WIDTH = 64
+TILE_HEIGHT = 64
+
+# How much ghosting each kind of update leaves behind: the fastest modes (ie. A2 on
+# the IT8951) the most, partial updates (ie. DU, or a partial LUT) less. A 'clean'
+# update (ie. GC16 or a full LUT) removes it.
+WEIGHTS = {'fast': 2, 'partial': 1}
+
+# Characters for the heat of a tile in the text version of the heatmap, from none
+# to the threshold and over
+SHADES = ' .:-=+*#%@'
+
+
+class GhostMap:
+    """A heatmap of the panel in tiles: how much ghosting the updates drawn on each
+       tile have left behind since it was last cleaned. Tiles that have taken more
+       than `threshold` partial updates (weighted by their kind) are due for a clean
+       refresh, so only the areas that keep changing (ie. a clock) are ever flashed."""
+
+    def __init__(self, width, height, threshold, xdiv=8, ydiv=1):
+        self.width = width
+        self.height = height
+        self.threshold = threshold
+        self.tile_width = -(-TILE_WIDTH // xdiv) * xdiv
+        self.tile_height = -(-TILE_HEIGHT // ydiv) * ydiv
+        self.cols = -(-width // self.tile_width)
+        self.rows = -(-height // self.tile_height)
+        self.heat = [[0] * self.cols for _ in range(self.rows)]
+        # how many tiles each kind of update has been drawn on, and how many were cleaned
+        self.counts = dict.fromkeys(list(WEIGHTS) + ['clean'], 0)
+
+    def tile_box(self, row, col):
+        """Return the native box of a tile"""
+        return (col * self.tile_width, row * self.tile_height,
+                min((col + 1) * self.tile_width, self.width), min((row + 1) * self.tile_height, self.height))
+
+    def tiles(self, box, whole=False):
+        """Return the (row, col) of the tiles a native box touches, or only the ones
+           it covers whole"""
+        cols = range(max(box[0], 0) // self.tile_width, min(-(-box[2] // self.tile_width), self.cols))
+        rows = range(max(box[1], 0) // self.tile_height, min(-(-box[3] // self.tile_height), self.rows))
+        tiles = [(row, col) for row in rows for col in cols]
+        if whole:
+            tiles = [(row, col) for row, col in tiles if self.covers(box, self.tile_box(row, col))]
+        return tiles
+
+    @staticmethod
+    def covers(box, other):
+        return box[0] <= other[0] and box[1] <= other[1] and box[2] >= other[2] and box[3] >= other[3]
+
+    def record(self, boxes, kind='partial'):
+        """Add the updates of a kind drawn on native boxes to the heatmap"""
+        if kind == 'clean':
+            self.clean(boxes)
+            return
+        weight = WEIGHTS[kind]
+        for box in boxes:
+            for row, col in self.tiles(box):
+                self.heat[row][col] += weight
+                self.counts[kind] += 1
+
+    def clean(self, boxes=None):
+        """Forget the ghosting of the tiles the native boxes cover whole, or of the
+           whole panel"""
+        if boxes is None:
+            boxes = [(0, 0, self.width, self.height)]
+        for box in boxes:
+            for row, col in self.tiles(box, whole=True):
+                if self.heat[row][col]:
+                    self.heat[row][col] = 0
+                    self.counts['clean'] += 1
+
+    def due(self):
+        """Return the native boxes of the tiles over the threshold from top to bottom:
+           the runs of them on each row, with the same runs on the following rows
+           merged into them"""
+        rects = []
+        previous = {}
+        for row, heat in enumerate(self.heat):
+            current = {}
+            col = 0
+            while col < self.cols:
+                if heat[col] <= self.threshold:
+                    col += 1
+                    continue
+                start = col
+                while col < self.cols and heat[col] > self.threshold:
+                    col += 1
+                rect = previous.get((start, col))
+                if rect is None:
+                    rect = [start, row, col, row + 1]
+                    rects.append(rect)
+                else:
+                    rect[3] = row + 1
+                current[(start, col)] = rect
+            previous = current
+        boxes = []
+        for x0, y0, x1, y1 in rects:
+            first, last = self.tile_box(y0, x0), self.tile_box(y1 - 1, x1 - 1)
+            boxes.append((first[0], first[1], last[2], last[3]))
+        return boxes
+
+    def __str__(self):
+        top = len(SHADES) - 1
+        lines = [''.join(SHADES[min(heat * top // max(self.threshold, 1), top)] for heat in row) for row in self.heat]
+        lines.append("{}x{} tiles of {}x{} pixels, cleaned over {}, updates: {}".format(
+            self.cols, self.rows, self.tile_width, self.tile_height, self.threshold,
+            ', '.join('{} {}'.format(kind, count) for kind, count in sorted(self.counts.items()))))
+        return '\n'.join(lines)
@@ -0,0 +1,362 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright and related rights waived via CC0
+# https://creativecommons.org/publicdomain/zero/1.0/legalcode
+
+# Rendering text one character cell at a time from an atlas of pre-rasterized glyphs
+
+# for the least recently used order of cached rows
+from collections import OrderedDict
+# for the cumulative advance tables of proportional rows
+from itertools import accumulate
+
+# for drawing
+from PIL import Image, ImageDraw
+# for copying the glyphs of the console font
+from papertty.kernelfont import KernelFont
+# for drawing in the native orientation of the panel
+from papertty.orientation import Orientation
+
+# Optional dependency - fall back to pasting the glyphs one by one if NumPy is not available
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Luminance of the 16 VGA console colors, used to tell "normal" (light on dark)
+# cells from reverse video ones
+VGA_LUMINANCE = [0, 19, 100, 119, 51, 70, 101, 170, 85, 104, 185, 200, 135, 155, 236, 255]
+
+# The attribute the console uses for plain text (light grey on black)
+DEFAULT_ATTRIBUTE = 0x07
+
+# Characters rasterized up front: printable ASCII, box drawing and block elements
+PREWARM = ''.join(chr(c) for c in list(range(0x20, 0x7F)) + list(range(0x2500, 0x25A0)))
+
+# How many rows of a proportional font to keep the advance tables of
+ADVANCE_TABLES = 1024
+
+
+def decode_attribute(attr):
+    """Split a VGA attribute byte (as found in /dev/vcsa) into
+       (reverse, bold, dim, shaded background, intense background).
+
+       The console is light on dark while the panel is dark on light, so a cell is
+       drawn in reverse if its background is lighter than its foreground - that's
+       how the kernel stores reverse video (and ie. the selection bars of mc).
+       Bold is the foreground intensity bit, dark grey text is dim. Note that with
+       a 512 glyph console font the intensity bit is used for the character instead."""
+    fg = attr & 0x0F
+    bg = (attr >> 4) & 0x07
+    reverse = VGA_LUMINANCE[bg] > VGA_LUMINANCE[fg]
+    bold = bool(attr & 0x08) and fg != 8
+    dim = fg == 8
+    shaded = bg != 0 and not reverse
+    intense = bool(attr & 0x80)
+    return reverse, bold, dim, shaded, intense
+
+
+class GlyphAtlas:
+    """Rasterizes each character once for a font and cell size and builds rows of text
+       by copying the cells out of the atlas instead of running FreeType for every row.
+
+       The atlas keeps the ink coverage of each glyph inside its cell in one array, so a
+       row is composed with a single NumPy gather. Ink that sticks out of the cell (ie.
+       slanted or wide glyphs) is kept aside and added on top, so the result is the same
+       as drawing the row with ImageDraw.text. Rows can have (vcsa) attributes, in which
+       case each cell gets the colors of its attribute.
+
+       The cells are stored already rotated and flipped to the native orientation of
+       the panel, so rows come out ready to be pasted on the native frame.
+
+       Proportional fonts (where printable ASCII doesn't all have the same advance) are
+       laid out by the advance of each glyph instead of in cells, and the cumulative
+       advance table of each row tells where its characters are."""
+
+    def __init__(self, font, width, height, mode='1', white=255, black=0, prewarm=PREWARM, orientation=None):
+        self.font = font
+        self.width = width
+        self.height = height
+        self.mode = mode
+        self.white = white
+        self.black = black
+        self.orientation = orientation or Orientation(width, height, portrait=True)
+        # glyph slot indexes for regular and (fake) bold characters
+        self.index = {}
+        self.bold_index = {}
+        # per slot: the glyph as a mask image and its x offset from the cell, for pasting
+        self.masks = []
+        # per slot: list of (x offset, coverage) of ink outside the cell
+        self.overhangs = []
+        # per slot: how far the glyph moves the pen
+        self.advances = []
+        # cumulative advance tables of recent rows of a proportional font
+        self.tables = OrderedDict()
+        # colors and boldness of each attribute byte
+        self.attributes = [self.colors(attr) for attr in range(256)]
+        if numpy:
+            self.cells = numpy.zeros((64,) + self.orientation.size(height, width), dtype=numpy.uint8)
+            self.has_overhang = numpy.zeros(64, dtype=bool)
+            # 1-bit images are built from boolean arrays
+            self.dtype = bool if mode == '1' else numpy.int32
+            self.inks = numpy.array([ink for ink, paper, bold in self.attributes], dtype=self.dtype)
+            self.papers = numpy.array([paper for ink, paper, bold in self.attributes], dtype=self.dtype)
+            self.bolds = numpy.array([bold for ink, paper, bold in self.attributes], dtype=bool)
+        for char in prewarm:
+            self.slot(char)
+        self.space = self.advances[self.slot(' ')]
+        self.monospace = len(set(self.advances[self.slot(chr(c))] for c in range(0x20, 0x7F))) == 1
+
+    def matches(self, font, width, height, mode, orientation):
+        """Check if the atlas was rasterized for these font, metrics, image mode and orientation"""
+        return (self.font, self.width, self.height, self.mode, self.orientation.key) == \
+            (font, width, height, mode, orientation.key)
+
+    def colors(self, attr):
+        """Return the (ink, paper) colors and boldness for an attribute. In 1-bit mode
+           only reverse video and bold can be shown, grayscale panels also get shaded
+           backgrounds and dim text."""
+        reverse, bold, dim, shaded, intense = decode_attribute(attr)
+        ink, paper = self.black, self.white
+        if self.mode != '1':
+            if dim:
+                ink = 0x88
+            if shaded:
+                paper = 0xAA if intense else 0xCC
+        if reverse:
+            ink, paper = paper, ink
+        return ink, paper, bold
+
+    def slot(self, char, bold=False):
+        """Return the atlas slot of a character, rasterizing it if needed"""
+        index = self.bold_index if bold else self.index
+        slot = index.get(char)
+        if slot is None:
+            slot = index[char] = self.rasterize(char, bold)
+        return slot
+
+    def rasterize(self, char, bold):
+        """Draw a character into the atlas and return its slot"""
+        width, height = self.width, self.height
+        # leave a cell of room on both sides for ink outside the cell
+        canvas = Image.new('L', (width * 3 + 1, height), 0)
+        # draw in the image mode of the rows, so 1-bit text doesn't get antialiased
+        if self.mode == '1':
+            canvas = canvas.convert('1')
+        if isinstance(self.font, KernelFont):
+            # the console font is already a bitmap
+            glyph = self.font.glyph(char)
+            canvas.paste(255, (width, 0), glyph)
+            if bold:
+                canvas.paste(255, (width + 1, 0), glyph)
+        elif not char.isspace():
+            draw = ImageDraw.Draw(canvas)
+            try:
+                draw.text((width, 0), char, font=self.font, fill=255)
+                # fake bold by overstriking one pixel to the right
+                if bold:
+                    draw.text((width + 1, 0), char, font=self.font, fill=255)
+            except UnicodeEncodeError:
+                # PIL fonts only cover Latin-1, leave the rest blank
+                pass
+        coverage = canvas.convert('L')
+        self.advances.append(self.measure(char))
+        bbox = coverage.getbbox()
+        left, right = (bbox[0], bbox[2]) if bbox else (width, width)
+        slot = len(self.masks)
+        self.masks.append((coverage.crop((left, 0, right, height)), left - width))
+        overhangs = []
+        if numpy:
+            pixels = numpy.asarray(coverage)
+            if slot >= len(self.cells):
+                self.cells = numpy.concatenate((self.cells, numpy.zeros_like(self.cells)))
+                self.has_overhang = numpy.concatenate((self.has_overhang, numpy.zeros_like(self.has_overhang)))
+            self.cells[slot] = self.orientation.array(pixels[:, width:width * 2])
+            if left < width:
+                overhangs.append((left - width, pixels[:, left:width]))
+            if right > width * 2:
+                overhangs.append((width, pixels[:, width * 2:right]))
+            self.has_overhang[slot] = bool(overhangs)
+        self.overhangs.append(overhangs)
+        return slot
+
+    def measure(self, char):
+        """Return the advance of a character in whole pixels"""
+        try:
+            if hasattr(self.font, 'getlength'):
+                return int(round(self.font.getlength(char)))
+            return self.font.getsize(char)[0]
+        except UnicodeEncodeError:
+            return self.width
+
+    def offsets(self, text):
+        """Return the x offset of each character of a row and the width of the row, so
+           characters i..j span offsets[i]..offsets[j + 1]. The advances were measured
+           when the glyphs were rasterized, so rows are never measured by FreeType."""
+        if self.monospace:
+            return range(0, (len(text) + 1) * self.width, self.width)
+        table = self.tables.get(text)
+        if table is None:
+            advances = self.advances
+            table = self.tables[text] = list(accumulate([0] + [advances[slot] for slot in self.slots(text)]))
+            if len(self.tables) > ADVANCE_TABLES:
+                self.tables.popitem(last=False)
+        else:
+            self.tables.move_to_end(text)
+        return table
+
+    def offset(self, table, i):
+        """Return the x offset of character i in an advance table, past the end of the
+           row as if it was padded with spaces (ie. for the cursor)"""
+        end = len(table) - 1
+        return table[i] if i <= end else table[end] + (i - end) * self.space
+
+    def slots(self, text, attrs=None):
+        """Return the atlas slots for a row of text"""
+        get = self.index.get
+        slots = [get(char) for char in text]
+        if None in slots:
+            slots = [self.slot(char) if slot is None else slot for char, slot in zip(text, slots)]
+        if attrs is not None:
+            for i, attr in enumerate(attrs[:len(text)]):
+                if self.attributes[attr][2]:
+                    slots[i] = self.slot(text[i], bold=True)
+        return slots
+
+    def render(self, text, attrs=None, fill=None):
+        """Build an image of a row of text on blank paper. Plain text is drawn in the fill
+           color (black by default), text with attributes in the colors of each cell."""
+        if fill is None:
+            fill = self.black
+        if attrs is not None:
+            # pad with the default attribute in case there are less attributes than characters
+            attrs = bytes(attrs[:len(text)]).ljust(len(text), bytes([DEFAULT_ATTRIBUTE]))
+        slots = self.slots(text, attrs)
+        width, height = self.width, self.height
+        if not numpy or not slots or not self.monospace:
+            offsets = self.offsets(text)
+            image = Image.new(self.mode, (offsets[-1], height), self.white)
+            inks = [fill] * len(slots)
+            if attrs is not None:
+                # backgrounds first, so they don't cover ink from the neighbouring cells
+                draw = ImageDraw.Draw(image)
+                for i, attr in enumerate(attrs):
+                    inks[i], paper, bold = self.attributes[attr]
+                    if paper != self.white and offsets[i + 1] > offsets[i]:
+                        draw.rectangle((offsets[i], 0, offsets[i + 1] - 1, height - 1), fill=paper)
+            self.paste(image, slots, inks, offsets)
+            return self.orientation.image(image)
+        coverage = self.coverage(slots)
+        if attrs is None:
+            ink, paper = self.dtype(fill), self.dtype(self.white)
+        else:
+            # the colors of the cells along the row, in the native orientation of the row
+            strip = self.orientation.area(len(slots) * width, height)
+            attrs = numpy.frombuffer(attrs, dtype=numpy.uint8)
+            ink = strip.array(numpy.repeat(self.inks[attrs], width)[None, :])
+            paper = strip.array(numpy.repeat(self.papers[attrs], width)[None, :])
+        if self.mode == '1':
+            # coverage is either 0 or 255 when rasterized in 1-bit mode
+            return Image.fromarray(numpy.where(coverage > 0, ink, paper))
+        # blend the ink and the paper by the (antialiased) coverage
+        pixels = paper + (ink - paper) * coverage.astype(numpy.int32) // 255
+        return Image.fromarray(pixels.astype(numpy.uint8), 'L')
+
+    def coverage(self, slots):
+        """Compose the ink coverage of a row with NumPy in the native orientation: gather
+           the cells from the atlas and add the ink that overhangs them"""
+        width, height = self.width, self.height
+        slots = numpy.asarray(slots, dtype=numpy.intp)
+        length = len(slots) * width
+        strip = self.orientation.area(length, height)
+        # the cells follow each other along the native x axis in portrait and along the
+        # native y axis in landscape, backwards if the text runs against that axis
+        if strip.flipx != (not strip.portrait):
+            cells = self.cells[slots[::-1]]
+        else:
+            cells = self.cells[slots]
+        if strip.portrait:
+            # (cells, height, width) -> (height, cells * width)
+            coverage = cells.transpose(1, 0, 2).reshape(height, length)
+        else:
+            # (cells, width, height) -> (cells * width, height)
+            coverage = cells.reshape(length, height)
+        for i in numpy.flatnonzero(self.has_overhang[slots]):
+            for offset, ink in self.overhangs[slots[i]]:
+                start = i * width + offset
+                begin, end = max(start, 0), min(start + ink.shape[1], length)
+                if begin < end:
+                    x0, y0, x1, y1 = strip.rect((begin, 0, end, height))
+                    area = coverage[y0:y1, x0:x1]
+                    numpy.maximum(area, strip.array(ink[:, begin - start:end - start]), out=area)
+        return coverage
+
+    def paste(self, image, slots, inks, offsets):
+        """Paste the glyphs of a row on an image through their masks at their offsets,
+           without NumPy or for proportional fonts"""
+        for i, slot in enumerate(slots):
+            mask, offset = self.masks[slot]
+            if mask.width:
+                image.paste(inks[i], (offsets[i] + offset, 0), mask)
+
+
+class RowCache:
+    """A least recently used cache of finished row images, keyed by what's on the row
+       (ie. the text, the cursor column and the attributes). Full-screen programs keep
+       drawing the same few rows over and over (status bars, rulers, borders), those
+       are then pasted from the cache instead of rendered again. The image data in
+       the cache is kept under `budget` bytes."""
+
+    def __init__(self, budget):
+        self.budget = budget
+        self.rows = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def image_size(image):
+        """Return the memory used by an image - PIL keeps even 1-bit images at a byte per pixel"""
+        return image.width * image.height * len(image.getbands())
+
+    def get(self, key):
+        """Return the cached image for a row, or None"""
+        image = self.rows.get(key)
+        if image is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.rows.move_to_end(key)
+        return image
+
+    def put(self, key, image):
+        """Cache the image of a row, dropping the least recently used rows to stay in budget"""
+        size = self.image_size(image)
+        if size > self.budget:
+            return
+        old = self.rows.pop(key, None)
+        if old is not None:
+            self.size -= self.image_size(old)
+        self.rows[key] = image
+        self.size += size
+        while self.size > self.budget:
+            key, old = self.rows.popitem(last=False)
+            self.size -= self.image_size(old)
+
+    def clear(self):
+        """Drop all rows, ie. when the font has changed"""
+        self.rows.clear()
+        self.size = 0
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __str__(self):
+        return '{} rows, {:.1f}/{:.1f} KiB, {} hits, {} misses, hit rate {:.1%}'.format(
+            len(self.rows), self.size / 1024, self.budget / 1024, self.hits, self.misses, self.hit_rate)
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright and related rights waived via CC0
+# https://creativecommons.org/publicdomain/zero/1.0/legalcode
+
+# Reading the font of a Linux virtual console from the kernel
+
+# for the buffers passed to the ioctls
+import array
+# for the ioctls
+import fcntl
+# for opening the tty
+import os
+# for packing the ioctl arguments
+import struct
+
+# for the glyph bitmaps
+from PIL import Image
+
+# ioctls and operations from linux/kd.h
+KDFONTOP = 0x4B72
+KD_FONT_OP_GET = 1
+GIO_UNIMAP = 0x4B66
+
+# struct console_font_op { unsigned int op, flags, width, height, charcount; unsigned char *data; }
+FONT_OP = 'IIIIIP'
+# struct unimapdesc { unsigned short entry_ct; struct unipair *entries; }
+UNIMAP_DESC = 'HP'
+
+# The largest font the kernel can give with KD_FONT_OP_GET: every character takes
+# 32 rows of up to 32 pixels, whatever the height of the font
+MAX_WIDTH = 32
+MAX_HEIGHT = 32
+MAX_CHARS = 512
+
+
+def address(buffer):
+    return buffer.buffer_info()[0]
+
+
+class KernelFont:
+    """The font of a virtual console as the kernel draws it: a bitmap per character
+       cell and the map from Unicode to the positions in the font. Glyphs are copied
+       from the bitmaps instead of rasterized, so the text looks exactly like on the
+       console."""
+
+    def __init__(self, width, height, glyphs, unimap, file='kernel'):
+        self.width = width
+        self.height = height
+        # a 1-bit image per font position
+        self.glyphs = glyphs
+        # Unicode code point -> font position
+        self.unimap = unimap
+        self.file = file
+        # the text is font positions instead of Unicode (ie. read from /dev/vcs),
+        # which is also how the console shows text when its font has no map
+        self.by_position = not unimap
+        self.replacement = unimap.get(0xFFFD, unimap.get(ord('?'), 0))
+
+    @classmethod
+    def load(cls, tty):
+        """Read the font and the Unicode map of the console of a tty (ie. /dev/tty1,
+           or /dev/tty0 for the current one)"""
+        fd = os.open(tty, os.O_RDONLY | os.O_NOCTTY)
+        try:
+            width, height, glyphs = cls.read_font(fd)
+            unimap = cls.read_unimap(fd)
+        finally:
+            os.close(fd)
+        return cls(width, height, glyphs, unimap, 'kernel:{}'.format(tty))
+
+    @staticmethod
+    def read_font(fd):
+        """Return the width, height and glyphs of the console font"""
+        pitch = (MAX_WIDTH + 7) // 8
+        data = array.array('B', bytes(MAX_CHARS * MAX_HEIGHT * pitch))
+        op = struct.pack(FONT_OP, KD_FONT_OP_GET, 0, MAX_WIDTH, MAX_HEIGHT, MAX_CHARS, address(data))
+        _, _, width, height, count, _ = struct.unpack(FONT_OP, fcntl.ioctl(fd, KDFONTOP, op))
+        # the kernel packs the rows of a glyph in whole bytes and gives each glyph 32 rows
+        pitch = (width + 7) // 8
+        size = MAX_HEIGHT * pitch
+        data = data.tobytes()
+        glyphs = [Image.frombytes('1', (pitch * 8, height), data[i * size:i * size + height * pitch]).crop((0, 0, width, height))
+                  for i in range(count)]
+        return width, height, glyphs
+
+    @staticmethod
+    def read_unimap(fd):
+        """Return the Unicode map of the console font as a dict"""
+        # room for as many entries as the count can tell
+        count = 0xFFFF
+        entries = array.array('H', bytes(count * 4))
+        desc = struct.pack(UNIMAP_DESC, count, address(entries))
+        count = struct.unpack(UNIMAP_DESC, fcntl.ioctl(fd, GIO_UNIMAP, desc))[0]
+        # pairs of (unicode, font position)
+        return {entries[i]: entries[i + 1] for i in range(0, count * 2, 2)}
+
+    def glyph(self, char):
+        """Return the bitmap the console would show for a character"""
+        code = ord(char)
+        position = code if self.by_position else self.unimap.get(code)
+        if position is None or position >= len(self.glyphs):
+            position = self.replacement
+        return self.glyphs[position]
+
+    def getsize(self, text):
+        return len(text) * self.width, self.height
+
+    def getlength(self, text):
+        return len(text) * self.width
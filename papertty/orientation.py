@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright and related rights waived via CC0
+# https://creativecommons.org/publicdomain/zero/1.0/legalcode
+
+# Mapping the logical text layout to the native orientation of the panel
+
+# for the transpose methods
+from PIL import Image
+
+# The PIL transpose that turns a logical image into a native one, by (portrait, flipx, flipy)
+TRANSPOSES = {
+    (True, False, False): None,
+    (True, True, False): Image.FLIP_LEFT_RIGHT,
+    (True, False, True): Image.FLIP_TOP_BOTTOM,
+    (True, True, True): Image.ROTATE_180,
+    (False, False, False): Image.ROTATE_90,
+    (False, True, False): Image.TRANSPOSE,
+    (False, False, True): Image.TRANSVERSE,
+    (False, True, True): Image.ROTATE_270,
+}
+
+
+class Orientation:
+    """Maps an area of the logical text layout (rows from top to bottom, columns from left
+       to right) to the native layout of the panel. In landscape the text is rotated 90
+       degrees counterclockwise, and flipx/flipy mirror the text before that.
+
+       Rectangles are mapped with coordinate maths, so text can be drawn directly in
+       the native orientation instead of rotating and flipping whole images."""
+
+    def __init__(self, width, height, portrait=False, flipx=False, flipy=False):
+        # size of the logical area
+        self.width = width
+        self.height = height
+        self.portrait = portrait
+        self.flipx = flipx
+        self.flipy = flipy
+        self.transpose = TRANSPOSES[(bool(portrait), bool(flipx), bool(flipy))]
+
+    @classmethod
+    def for_panel(cls, panel_width, panel_height, portrait=False, flipx=False, flipy=False):
+        """Return the orientation for the whole panel, given its native size"""
+        if portrait:
+            return cls(panel_width, panel_height, portrait, flipx, flipy)
+        return cls(panel_height, panel_width, portrait, flipx, flipy)
+
+    @property
+    def key(self):
+        """The transform as a hashable value, ie. for cache keys"""
+        return (bool(self.portrait), bool(self.flipx), bool(self.flipy))
+
+    @property
+    def identity(self):
+        return self.transpose is None
+
+    @property
+    def native_size(self):
+        return self.size(self.width, self.height)
+
+    def area(self, width, height):
+        """Return the same transform for a logical area of another size (ie. a row)"""
+        return Orientation(width, height, self.portrait, self.flipx, self.flipy)
+
+    def size(self, width, height):
+        """Return the native size of a logical width and height"""
+        return (width, height) if self.portrait else (height, width)
+
+    def logical_size(self, width, height):
+        """Return the logical size of a native width and height"""
+        return self.size(width, height)
+
+    def rect(self, box):
+        """Map a logical box (x0, y0, x1, y1 with exclusive ends) to a native box"""
+        x0, y0, x1, y1 = box
+        if self.flipx:
+            x0, x1 = self.width - x1, self.width - x0
+        if self.flipy:
+            y0, y1 = self.height - y1, self.height - y0
+        if not self.portrait:
+            x0, y0, x1, y1 = y0, self.width - x1, y1, self.width - x0
+        return x0, y0, x1, y1
+
+    def image(self, image):
+        """Transform a logical image into the native orientation"""
+        return image if self.transpose is None else image.transpose(self.transpose)
+
+    def array(self, array):
+        """Return a (strided) NumPy view of a logical array in the native orientation"""
+        if self.flipx:
+            array = array[:, ::-1]
+        if self.flipy:
+            array = array[::-1]
+        if not self.portrait:
+            # counterclockwise, like Image.ROTATE_90
+            array = array.transpose(1, 0, *range(2, array.ndim))[::-1]
+        return array
+
+    def paste(self, target, image, xy):
+        """Paste a native image of a logical area at logical position xy on a native target"""
+        width, height = self.logical_size(image.width, image.height)
+        box = self.rect((xy[0], xy[1], xy[0] + width, xy[1] + height))
+        target.paste(image, box[:2])
+        return box
@@ -20,31 +20,64 @@ import papertty.drivers.drivers_colordraw as drivers_colordraw
 import papertty.drivers.driver_it8951 as driver_it8951
 import papertty.drivers.drivers_4in2 as driver_4in2
 
+# for decoding the output of programs in a pseudo-terminal
+import codecs
+# for setting up and tearing down the signal wakeup pipe
+import contextlib
 # for ioctl
 import fcntl
 # for validating type of and access to device files
 import os
+# for parsing the kernel version
+import re
 # for gracefully handling signals (systemd service)
 import signal
 # for unpacking virtual console data
 import struct
 # for stdin and exit
 import sys
+# for waiting on console changes
 import select
 # for setting TTY size
 import termios
+# for passing the keyboard through to a pseudo-terminal
+import tty
 # for sleeping
 import time
 # for command line usage
 import click
 # for drawing
 from PIL import Image, ImageChops, ImageDraw, ImageFont, ImageOps
-# for tidy driver list
-from collections import OrderedDict
+# for tidy driver list and counting scroll votes
+from collections import Counter, OrderedDict, deque
 # for VNC
 from vncdotool import api
 # for reading stdin data for use with Pillow
 from io import BytesIO
+# for printing benchmark results
+import json
+# for benchmarking the text pipeline with recorded sessions
+from papertty.bench import emulate_multi_draw, peak_rss, read_cast, replay as replay_cast
+# for measuring the display and loading the results
+from papertty.calibrate import Calibration, apply_profile, load_profile, profile_path, save_profile
+# for reading the virtual console
+from papertty.console import ActiveConsole, ConsoleSnapshot, SyntheticConsole, VirtualConsole, first_difference, is_device, last_difference, vcsa_frames
+# for finding the changed areas of frames
+from papertty.damage import dirty_rects, plan_draws
+# for cleaning up the ghosting left by partial updates
+from papertty.ghosting import GhostMap
+# for rendering text
+from papertty.glyphs import GlyphAtlas, RowCache
+# for --font kernel
+from papertty.kernelfont import KernelFont
+# for drawing in the native orientation of the panel
+from papertty.orientation import Orientation
+# for taking frames through the stages of drawing them
+from papertty.pipeline import FramePipeline, inversion, rotation, scaling
+# for showing several consoles at once
+from papertty.tiles import Compositor, TileDriver, tile_boxes
+# for running programs in a pseudo-terminal
+from papertty.vt import VirtualTerminal, spawn
 
 # resource path
 RESOURCE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "resources")
@@ -73,10 +106,37 @@ class PaperTTY:
     enable_a2 = True
     enable_1bpp = True
     mhz = None
-
-    def __init__(self, driver, font=defaultfont, fontsize=defaultsize, partial=None, encoding='utf-8', spacing=0, cursor=None, vcom=None, enable_a2=True, enable_1bpp=True, mhz=None):
+    attributes = False
+    glyphs = None
+    row_cache = None
+    # bytes of rendered rows to keep around for reuse
+    default_row_cache_size = 8 * 1024 * 1024
+    # most cells a change can span to be drawn on the keystroke fast path
+    keystroke_cells = 4
+    # the ghosting heatmap, if partial updates are tracked
+    ghosting = None
+    # seconds without drawing before the areas with too much ghosting are cleaned
+    clean_idle = 5
+    # the native box of the cursor laid over the retained frame on the panel
+    cursor_overlay = None
+    # called with the time each stage of drawing took, see FramePipeline
+    stage_hook = None
+    # the planning and drawing stages of the text
+    text_pipeline = None
+    # the stages of drawing the text as full frames, without partial refresh
+    image_pipeline = None
+
+    def __init__(self, driver, font=defaultfont, fontsize=defaultsize, partial=None, encoding='utf-8', spacing=0, cursor=None, vcom=None, enable_a2=True, enable_1bpp=True, mhz=None, attributes=False, row_cache_size=default_row_cache_size, profile=None):
         """Create a PaperTTY with the chosen driver and settings"""
         self.driver = get_drivers()[driver]['class']()
+        # the timings measured with `calibrate`, if any - profile=False doesn't look for them
+        self.profile_path = None if profile is False else profile or profile_path(driver)
+        self.profile = load_profile(self.profile_path) if self.profile_path else None
+        if self.profile:
+            print("Using the calibration profile {}".format(self.profile_path))
+            apply_profile(self.driver, self.profile)
+            if mhz is None:
+                mhz = self.profile.get('mhz')
         self.spacing = spacing
         self.fontsize = fontsize
         self.font = self.load_font(font) if font else None
@@ -89,6 +149,53 @@ class PaperTTY:
         self.enable_a2 = enable_a2
         self.enable_1bpp = enable_1bpp
         self.mhz = mhz
+        self.attributes = attributes
+        self.row_cache = RowCache(row_cache_size) if row_cache_size else None
+
+    @property
+    def image_mode(self):
+        """Image mode for rendering text: grayscale if attributes are shown on a panel
+           that can do it (ie. IT8951 without 1bpp), otherwise black and white"""
+        if self.attributes and self.driver.supports_grayscale and not (self.driver.supports_1bpp and self.driver.enable_1bpp):
+            return 'L'
+        return '1'
+
+    def get_glyphs(self, orientation):
+        """Return the glyph atlas for the current font, rasterizing a new one if the
+           font, its metrics, the image mode or the orientation have changed"""
+        if self.glyphs is None or not self.glyphs.matches(self.font, self.font_width, self.font_height, self.image_mode, orientation):
+            self.glyphs = GlyphAtlas(self.font, self.font_width, self.font_height, self.image_mode, self.white, self.black,
+                                     orientation=orientation)
+            # the cached rows were rendered from the old atlas
+            if self.row_cache is not None:
+                self.row_cache.clear()
+        return self.glyphs
+
+    def render_row(self, text, attrs, cursor_x, fill, orientation):
+        """Return the finished image of a row of text in the native orientation, with
+           the cursor on it if cursor_x (the column of the cursor) isn't None. Rows are
+           cached by their content, so a row that has been seen recently is not
+           rendered again."""
+        glyphs = self.get_glyphs(orientation)
+        # clearing the screen on exit is a one-off, don't cache it
+        cache = self.row_cache if fill == self.black else None
+        key = (text, cursor_x, attrs, orientation.key)
+        image = cache.get(key) if cache is not None else None
+        if image is None:
+            if cursor_x is not None and cursor_x >= len(text):
+                # the cursor is past the end of the text
+                text = text.ljust(cursor_x + 1)
+            # clearing the screen on exit draws the text in white, so leave the attributes out
+            if fill != self.black:
+                attrs = None
+            image = glyphs.render(text, attrs, fill)
+            if cursor_x is not None:
+                offsets = glyphs.offsets(text)
+                row = orientation.area(offsets[-1], self.font_height)
+                self.draw_cursor(image, row.rect(self.cursor_box(offsets[cursor_x], offsets[cursor_x + 1], row.width)))
+            if cache is not None:
+                cache.put(key, image)
+        return image
 
     def ready(self):
         """Check that the driver is loaded and initialized"""
@@ -129,6 +236,12 @@ class PaperTTY:
         """Split a sequence into parts of size n"""
         return [s[begin:begin + n] for begin in range(0, len(s), n)]
 
+    @staticmethod
+    def splitlines(text):
+        """Return the rows of a text - either a string or a sequence of rows
+           (ie. a console snapshot) that is used as is"""
+        return text.split('\n') if isinstance(text, str) else text
+
     @staticmethod
     def fold(text, width=None, filter_fn=None):
         """Format a string to a specified width and/or filter it"""
@@ -155,13 +268,17 @@ class PaperTTY:
            (1, "/dev/vcs1") if not"""
         dev = vcsa.replace("vcsa", "vcsu")
         if os.path.exists(dev):
-            if isinstance(self.font, ImageFont.FreeTypeFont):
+            if isinstance(self.font, (ImageFont.FreeTypeFont, KernelFont)):
                 return 4, dev
             else:
                 print("Font {} doesn't support Unicode. Falling back to 8-bit encoding.".format(self.font.file))
                 return 1, vcsa.replace("vcsa", "vcs")
         else:
             print("System does not have /dev/vcsu. Falling back to 8-bit encoding.")
+            if isinstance(self.font, KernelFont):
+                # vcs has the positions in the console font rather than characters (only
+                # the first 256 glyphs of a 512 glyph font, the 9th bit is in the attributes)
+                self.font.by_position = True
             return 1, vcsa.replace("vcsa", "vcs")
 
     @staticmethod
@@ -192,12 +309,86 @@ class PaperTTY:
             print("No write access to {} so cannot set terminal size, maybe run with sudo?".format(tty))
         return True
 
+    @staticmethod
+    def vcsa_poller(vcsa_fd):
+        """Return a poll object that wakes up when the virtual console changes,
+           or None if the kernel doesn't signal vcsa changes (needs 2.6.36+)"""
+        release = tuple(int(n) for n in re.findall(r'\d+', os.uname().release)[:3])
+        if release < (2, 6, 36):
+            return None
+        poller = select.poll()
+        # the kernel raises POLLPRI on the vcsa file whenever the console is updated
+        poller.register(vcsa_fd, select.POLLPRI)
+        if any(event & (select.POLLERR | select.POLLNVAL) for _, event in poller.poll(0)):
+            return None
+        return poller
+
+    @staticmethod
+    @contextlib.contextmanager
+    def signal_wakeup(poller):
+        """Make signals interrupt waiting on poller, by having them written to a pipe
+           registered on it. Yields the end of the pipe to read (None without a
+           poller), the previous wakeup fd is restored and the pipe closed on exit."""
+        if poller is None:
+            yield None
+            return
+        wakeup_r, wakeup_w = os.pipe()
+        os.set_blocking(wakeup_r, False)
+        os.set_blocking(wakeup_w, False)
+        previous = signal.set_wakeup_fd(wakeup_w)
+        poller.register(wakeup_r, select.POLLIN)
+        try:
+            yield wakeup_r
+        finally:
+            signal.set_wakeup_fd(previous)
+            poller.unregister(wakeup_r)
+            os.close(wakeup_r)
+            os.close(wakeup_w)
+
+    @staticmethod
+    def wait_for_vcsa(poller, vcsa_fds, timeout=None):
+        """Block until the console changes (any of vcsa_fds signals it) or some other
+           registered fd (ie. the signal wakeup pipe) becomes readable, then clear the
+           pending events"""
+        for fd, event in poller.poll(timeout):
+            if fd in vcsa_fds:
+                # the change notification stays pending until the file is read
+                os.pread(fd, 1, 0)
+            else:
+                try:
+                    while os.read(fd, 512):
+                        pass
+                except BlockingIOError:
+                    pass
+
+    def open_console(self, vcsa, attributes=False, rate=0):
+        """Return the source of console snapshots for vcsa: the virtual console if it's a
+           device, or a stand-in playing the frames in it if it's a file or a FIFO.
+           Returns None if the device can't be used."""
+        if os.path.exists(vcsa) and not is_device(vcsa):
+            return SyntheticConsole(vcsa_frames(vcsa), rate, self.encoding, attributes=attributes)
+        if not self.valid_vcsa(vcsa):
+            return None
+        character_width, vcsudev = self.vcsudev(vcsa)
+        # keep the devices open for the whole session instead of reopening them for every frame
+        return VirtualConsole(vcsa, vcsudev, character_width, self.encoding, attributes=attributes)
+
     def load_font(self, path, keep_if_not_found=False):
-        """Load the PIL or TrueType font"""
+        """Load the PIL or TrueType font, or the font of a virtual console for
+           'kernel' (the current console) or 'kernel:/dev/ttyN'"""
         font = None
         # If no path is given, reuse existing font path. Good for resizing.
         path = path or self.fontfile
-        if os.path.isfile(path):
+        if path == 'kernel' or path.startswith('kernel:'):
+            tty = path.partition(':')[2] or '/dev/tty0'
+            try:
+                font = KernelFont.load(tty)
+            except OSError as e:
+                self.error("Can't read the console font of {}: {}".format(tty, e))
+            print('Loading the console font of {} ({}x{}, {} glyphs). Font size is ignored.'.format(tty, font.width, font.height, len(font.glyphs)))
+            self.is_truetype = False
+            self.fontfile = path
+        elif os.path.isfile(path):
             try:
                 # first check if the font looks like a PILfont
                 with open(path, 'rb') as f:
@@ -243,6 +434,8 @@ class PaperTTY:
             # pil fonts don't seem to have metrics, but all
             # characters seem to have the same height
             self.font_height = font.getsize('a')[1] + self.spacing
+        # the glyph atlas was rasterized with the old metrics
+        self.glyphs = None
 
     def init_display(self):
         """Initialize the display - call the driver's init method"""
@@ -258,37 +451,179 @@ class PaperTTY:
         ph = self.driver.height
         return int((pw if portrait else ph) / width), int((ph if portrait else pw) / height)
 
-    def draw_line_cursor(self, cursor, draw):
-        cur_x, cur_y = cursor[0], cursor[1]
-        width = self.font_width
-        # desired cursor width
-        cur_width = width - 1
-        # get font height
+    @property
+    def alignment(self):
+        """The (x, y) multiples that drawn areas have to be aligned to for the driver"""
+        if self.driver.supports_1bpp and self.driver.enable_1bpp:
+            return self.driver.align_1bpp_width, self.driver.align_1bpp_height
+        return 8, 1
+
+    def plan_draws(self, boxes, mode):
+        """Return the cheapest boxes to draw to cover the native boxes, in order (ie. from
+           top to bottom), according to the cost model of the driver: merging boxes
+           sends the area between them too, but saves the overhead of a draw - and a
+           refresh of its own, unless the driver draws several areas in one refresh.
+           The boxes are aligned for the driver."""
+        xdiv, ydiv = self.alignment
+        boxes = [self.band(box, xdiv=xdiv, ydiv=ydiv) for box in boxes]
+        driver = self.driver
+        fixed = driver.draw_overhead
+        if not driver.supports_multi_draw:
+            fixed += driver.refresh_cost
+        cost = driver.byte_cost * driver.transfer_bits(mode) / 8
+
+        def transfer(box):
+            return (box[2] - box[0]) * (box[3] - box[1]) * cost
+
+        return plan_draws(boxes, fixed, transfer)
+
+    def track_ghosting(self, threshold):
+        """Keep a heatmap of the partial updates drawn, so that the areas that have
+           taken more than `threshold` of them can be cleaned with clean_ghosting.
+           SIGUSR2 prints the heatmap."""
+        if not (threshold and self.driver.supports_partial and self.partial):
+            return
+        self.ghosting = GhostMap(self.driver.width, self.driver.height, threshold, *self.alignment)
+
+        def sigusr2_handler(sig, frame):
+            print("Ghosting heatmap (SIGUSR2):")
+            print(self.ghosting)
+
+        signal.signal(signal.SIGUSR2, sigusr2_handler)
+
+    def record_draws(self, boxes, mode, fast=False):
+        """Add native boxes drawn from an image of a mode to the ghosting heatmap"""
+        if self.ghosting:
+            self.ghosting.record(boxes, self.driver.update_kind(mode, fast))
+
+    def clean_delay(self, last_draw):
+        """Return how many seconds to wait before cleaning the areas with too much
+           ghosting (0 to clean now), or None if none need it. last_draw is the
+           time.monotonic() of the latest draw."""
+        if not self.ghosting or not self.ghosting.due():
+            return None
+        if last_draw is None:
+            return 0
+        return max(last_draw + self.clean_idle - time.monotonic(), 0)
+
+    def clean_ghosting(self, image):
+        """Redraw the areas with too much ghosting from the full frame that is on the
+           panel (the retained frame, with the cursor laid over it), with the update that
+           leaves no ghosting behind. Drivers with a partial LUT are switched to the
+           full one for it. Returns the boxes that were drawn."""
+        if not self.ghosting:
+            return []
+        if image is None:
+            # the panel has been cleared (ie. scrubbed) since
+            self.ghosting.clean()
+            return []
+        boxes = self.plan_draws(self.ghosting.due(), image.mode)
+        if not boxes:
+            return []
+        if self.cursor_overlay:
+            image = image.copy()
+            self.draw_cursor(image, self.cursor_overlay)
+        switch = bool(self.driver.partial_refresh)
+        if switch:
+            self.driver.reset()
+            self.driver.init(partial=False, vcom=self.vcom, enable_a2=self.enable_a2, enable_1bpp=self.enable_1bpp, mhz=self.mhz)
+        for box in boxes:
+            self.driver.draw_clean(box[0], box[1], image.crop(box))
+        if switch:
+            self.driver.reset()
+            self.driver.init(partial=self.partial, vcom=self.vcom, enable_a2=self.enable_a2, enable_1bpp=self.enable_1bpp, mhz=self.mhz)
+        self.ghosting.clean(boxes)
+        return boxes
+
+    def draw_boxes(self, image, boxes):
+        """Draw the boxes of a full frame, with one draw_multi if the driver supports
+           it and as separate draws otherwise"""
+        self.record_draws(boxes, image.mode)
+        if self.driver.supports_multi_draw:
+            if boxes:
+                self.driver.draw_multi([{"x":box[0], "y":box[1], "image":image.crop(box)} for box in boxes])
+        else:
+            for box in boxes:
+                self.driver.draw(box[0], box[1], image.crop(box))
+
+    def frame_damage(self, image, previous):
+        """Return the native boxes where a full frame differs from the previous one:
+           the dirty rectangles with partial refresh, otherwise the bounding box as
+           the whole frame is drawn anyway"""
+        if self.driver.supports_partial and self.partial:
+            xdiv, ydiv = self.alignment
+            return dirty_rects(image, previous, xdiv, ydiv)
+        bbox = self.img_diff(image, previous)
+        return [bbox] if bbox else []
+
+    def draw_frame(self, image, boxes, verbose=False):
+        """Draw the boxes of a full frame with partial refresh, or the whole frame if
+           there are no boxes or partial refresh is not possible or desired"""
+        if boxes is not None and self.driver.supports_partial and self.partial:
+            if verbose:
+                print("partial: {}".format(boxes))
+            self.draw_boxes(image, boxes)
+        else:
+            if verbose:
+                print("{}: {}".format("initial" if boxes is None else "full", image.size))
+            self.driver.draw(0, 0, image)
+
+    def frame_pipeline(self, source=None, rotate=None, invert=False, verbose=False):
+        """Return a FramePipeline that draws full frames (ie. of a framebuffer) on the
+           panel: rotated, inverted and scaled to the panel, with only the changed
+           areas drawn as planned by plan_draws, and the ghosting cleaned up once
+           nothing has changed for a while"""
+        transforms = []
+        if rotate:
+            transforms.append(rotation(rotate))
+        if invert:
+            transforms.append(inversion)
+        transforms.append(scaling((self.driver.width, self.driver.height)))
+
+        # the time.monotonic() of the latest draw
+        drawn = {'at': None}
+
+        def sink(image, boxes):
+            self.draw_frame(image, boxes, verbose)
+            drawn['at'] = time.monotonic()
+
+        def idle(image):
+            if self.clean_delay(drawn['at']) != 0:
+                return
+            cleaned = self.clean_ghosting(image)
+            if cleaned and verbose:
+                print("clean: {}".format(cleaned))
+
+        return FramePipeline(sink, source=source,
+                             transforms=transforms, damage=self.frame_damage,
+                             planner=lambda boxes, image: self.plan_draws(boxes, image.mode),
+                             idle=idle, hook=self.stage_hook)
+
+    def cursor_box(self, start_x, end_x, row_width):
+        """Return the box (with exclusive ends) of the cursor on the character from
+           start_x to end_x on a row of text, in the logical coordinates of the row"""
+        width = max(end_x - start_x, 1)
         height = self.font_height
-        # starting X is the font width times current column
-        start_x = cur_x * width
+        if self.cursor == 'block':
+            # the block covers the cell and the pixel column after it
+            return start_x, 0, min(start_x + width + 1, row_width), height
         offset = 0
         if self.cursor != 'default': # only default and a number are valid in this context
             offset = int(self.cursor)
-        # add 1 because rows start at 0 and we want the cursor at the bottom
-        start_y = (cur_y + 1) * height - 1 - offset
-        # draw the cursor line
-        draw.line((start_x, start_y, start_x + cur_width, start_y), fill=self.black)
-
-    def draw_block_cursor(self, cursor, image):
-        cur_x, cur_y = cursor[0], cursor[1]
-        width = self.font_width
-        # get font height
-        height = self.font_height
-        upper_left = (cur_x * width, cur_y * height)
-        lower_right = ((cur_x + 1) * width, (cur_y + 1) * height)
-        mask = Image.new('1', (image.width, image.height), self.black)
-        draw = ImageDraw.Draw(mask)
-        draw.rectangle([upper_left, lower_right], fill=self.white)
-        return ImageChops.logical_xor(image, mask)
+        # the underscore is at the bottom of the cell, offset pixels up
+        start_y = min(max(height - 1 - offset, 0), height - 1)
+        return start_x, start_y, start_x + width, start_y + 1
+
+    def draw_cursor(self, image, box):
+        """Draw the cursor on a native image, box is the native box of the cursor"""
+        if self.cursor == 'block':
+            # invert the colors under the block
+            image.paste(ImageChops.invert(image.crop(box)), box)
+        else:
+            ImageDraw.Draw(image).rectangle((box[0], box[1], box[2] - 1, box[3] - 1), fill=self.black)
 
     def showfb(self, fb_num, rotate=None, invert=False, sleep=1, full_interval=100):
-        """Render the framebuffer - basically a copy-paste of showvnc at this point"""
+        """Render the framebuffer"""
         def _get_fb_info(fb_num):
             config_dir = "/sys/class/graphics/fb%d/" % fb_num
             size = None
@@ -305,99 +640,31 @@ class PaperTTY:
                 mode = "BGRX" if bpp == 32 else "BGR;16"
                 return Image.frombytes("RGB", size, f.read(), "raw", mode).convert("L")
 
-        previous_fb_img = None
-        diff_bbox = None
-        # number of updates; when it's 0, do a full refresh
-        updates = 0
-        while True:
-            new_fb_img = _get_fb_img(fb_num)
-            # apply rotation if any
-            if rotate:
-                new_fb_img = new_fb_img.rotate(rotate, expand=True)
-            # apply invert
-            if invert:
-                new_fb_img = ImageOps.invert(new_fb_img)
-            # rescale image if needed
-            if new_fb_img.size != (self.driver.width, self.driver.height):
-                new_fb_img = new_fb_img.resize((self.driver.width, self.driver.height))
-            # if at least two frames have been processed, get a bounding box of their difference region
-            if new_fb_img and previous_fb_img:
-                diff_bbox = self.band(self.img_diff(new_fb_img, previous_fb_img))
-            # frames differ, so we should update the display
-            if diff_bbox:
-                # increment update counter
-                updates = (updates + 1) % full_interval
-                # if partial update is supported and it's not time for a full refresh,
-                # draw just the different region
-                if updates > 0 and (self.driver.supports_partial and self.partial):
-                    print("partial ({}): {}".format(updates, diff_bbox))
-                    self.driver.draw(diff_bbox[0], diff_bbox[1], new_fb_img.crop(diff_bbox))
-                # if partial update is not possible or desired, do a full refresh
-                else:
-                    print("full ({}): {}".format(updates, new_fb_img.size))
-                    old_partial = self.partial
-                    self.partial = False
-                    self.driver.draw(0, 0, new_fb_img)
-                    self.partial = old_partial
-            # otherwise this is the first frame, so run a full refresh to get things going
-            else:
-                if updates == 0:
-                    updates = (updates + 1) % full_interval
-                    print("initial ({}): {}".format(updates, new_fb_img.size))
-                    self.driver.draw(0, 0, new_fb_img)
-            previous_fb_img = new_fb_img.copy()
-            time.sleep(float(sleep))
-
-
+        # areas that have taken full_interval partial updates get a full one when
+        # the framebuffer is idle
+        self.track_ghosting(full_interval)
+        pipeline = self.frame_pipeline(lambda: _get_fb_img(fb_num), rotate, invert, verbose=True)
+        pipeline.run(float(sleep))
 
     def showvnc(self, host, display, password=None, rotate=None, invert=False, sleep=1, full_interval=100):
         with api.connect(':'.join([host, display]), password=password) as client:
-            previous_vnc_image = None
-            diff_bbox = None
-            # number of updates; when it's 0, do a full refresh
-            updates = 0
+            # areas that have taken full_interval partial updates get a full one when
+            # the screen is idle
+            self.track_ghosting(full_interval)
             client.timeout = 30
-            while True:
+
+            def capture():
                 try:
                     client.refreshScreen()
                 except TimeoutError:
                     print("Timeout to server {}:{}".format(host, display))
                     client.disconnect()
                     sys.exit(1)
-                new_vnc_image = client.screen
-                # apply rotation if any
-                if rotate:
-                    new_vnc_image = new_vnc_image.rotate(rotate, expand=True)
-                # apply invert
-                if invert:
-                    new_vnc_image = ImageOps.invert(new_vnc_image)
-                # rescale image if needed
-                if new_vnc_image.size != (self.driver.width, self.driver.height):
-                    new_vnc_image = new_vnc_image.resize((self.driver.width, self.driver.height))
-                # if at least two frames have been processed, get a bounding box of their difference region
-                if new_vnc_image and previous_vnc_image:
-                    diff_bbox = self.band(self.img_diff(new_vnc_image, previous_vnc_image))
-                # frames differ, so we should update the display
-                if diff_bbox:
-                    # increment update counter
-                    updates = (updates + 1) % full_interval
-                    # if partial update is supported and it's not time for a full refresh,
-                    # draw just the different region
-                    if updates > 0 and (self.driver.supports_partial and self.partial):
-                        print("partial ({}): {}".format(updates, diff_bbox))
-                        self.driver.draw(diff_bbox[0], diff_bbox[1], new_vnc_image.crop(diff_bbox))
-                    # if partial update is not possible or desired, do a full refresh
-                    else:
-                        print("full ({}): {}".format(updates, new_vnc_image.size))
-                        self.driver.draw(0, 0, new_vnc_image)
-                # otherwise this is the first frame, so run a full refresh to get things going
-                else:
-                    if updates == 0:
-                        updates = (updates + 1) % full_interval
-                        print("initial ({}): {}".format(updates, new_vnc_image.size))
-                        self.driver.draw(0, 0, new_vnc_image)
-                previous_vnc_image = new_vnc_image.copy()
-                time.sleep(float(sleep))
+                # the client keeps updating the same image
+                return client.screen.copy()
+
+            pipeline = self.frame_pipeline(capture, rotate, invert, verbose=True)
+            pipeline.run(float(sleep))
 
     def showtext(self, text, fill, cursor=None, portrait=False, flipx=False, flipy=False, oldimage=None, oldtext=None, oldcursor=None):
         """Draw a string on the screen"""
@@ -412,52 +679,32 @@ class PaperTTY:
 
                 return self.partialdraw_showtext(text=text, fill=fill, cursor=cursor, portrait=portrait, flipx=flipx, flipy=flipy, oldimage=oldimage, oldtext=oldtext, oldcursor=oldcursor)
 
-            # set order of h, w according to orientation
-            image = Image.new('1', (self.driver.width, self.driver.height) if portrait else (
-                self.driver.height, self.driver.width),
-                              self.white)
-            # create the Draw object and draw the text
-            draw = ImageDraw.Draw(image)
-
-            # Split the text up by line and display each line individually.
-            # This is a workaround for a font height bug in PIL
-            lines = text.split('\n')
-            for i, line in enumerate(lines):
-                if line:
+            # the text is drawn directly in the native orientation of the panel,
+            # the rows are rotated and flipped as they are rendered
+            orientation = Orientation.for_panel(self.driver.width, self.driver.height, portrait, flipx, flipy)
+            image = Image.new(self.image_mode, (self.driver.width, self.driver.height), self.white)
+
+            # Split the text up by line and display each line individually, with
+            # the cursor on its line if we want one
+            lines = self.splitlines(text)
+            cur_y = cursor[1] if cursor and self.cursor else -1
+            for i in range(max(len(lines), cur_y + 1)):
+                line = self.partialdraw_get_line(lines, i)
+                cur_x = cursor[0] if i == cur_y else None
+                if line or cur_x is not None:
                     y = i * self.font_height
-                    draw.text((0, y), line, font=self.font, fill=fill, spacing=self.spacing)
-
-            # if we want a cursor, draw it - the most convoluted part
-            if cursor and self.cursor:
-                if self.cursor == 'block':
-                    image = self.draw_block_cursor(cursor, image)
-                else:
-                    self.draw_line_cursor(cursor, draw)
-            # rotate image if using landscape
-            if not portrait:
-                image = image.rotate(90, expand=True)
-            # apply flips if desired
-            if flipx:
-                image = image.transpose(Image.FLIP_LEFT_RIGHT)
-            if flipy:
-                image = image.transpose(Image.FLIP_TOP_BOTTOM)
-            # find out which part changed and draw only that on the display
-            if oldimage and self.driver.supports_partial and self.partial:
-                # create a bounding box of the altered region and
-                # make the X coordinates divisible by 8
-                if self.driver.supports_1bpp and self.driver.enable_1bpp:
-                    xdiv = self.driver.align_1bpp_width
-                    ydiv = self.driver.align_1bpp_height
-                else:
-                    xdiv = 8
-                    ydiv = 1
-                diff_bbox = self.band(self.img_diff(image, oldimage), xdiv=xdiv, ydiv=ydiv)
-                # crop the altered region and draw it on the display
-                if diff_bbox:
-                    self.driver.draw(diff_bbox[0], diff_bbox[1], image.crop(diff_bbox))
-            else:
-                # if no previous image, draw the entire display
-                self.driver.draw(0, 0, image)
+                    row = self.render_row(line, self.partialdraw_get_attrs(lines, i), cur_x, fill, orientation)
+                    orientation.paste(image, row, (0, y))
+            # find out which parts changed and draw only those on the display,
+            # or the entire display if there's no previous image - the ghosting
+            # is cleaned by the callers once they're idle, not here
+            if self.image_pipeline is None:
+                self.image_pipeline = FramePipeline(self.draw_frame, damage=self.frame_damage,
+                                                    planner=lambda boxes, image: self.plan_draws(boxes, image.mode),
+                                                    hook=self.stage_hook)
+            if oldimage is None:
+                self.image_pipeline.reset()
+            self.image_pipeline.process(image)
             return image
         else:
             self.error("Display not ready")
@@ -477,48 +724,46 @@ class PaperTTY:
         #the current render), then split them up based on a newline delimiter.
         #This is so we can compare the previous state of the text to the current state
         #of the text line by line and only redraw the lines which have actually changed.
-        oldlines = oldtext.split('\n')
-        newlines = text.split('\n')
+        oldlines = self.splitlines(oldtext)
+        newlines = self.splitlines(text)
 
 
         #Use the font height as the height for other measurements, such as row height
         height = self.font_height
 
-        #Figure out the width and height of the panel after rotation.
-        #These values are used when determining the maximum allowed size of a row of text,
-        #when figuring out coordinates, and so on.
-        driverHeight = self.driver.height if portrait else self.driver.width
-        driverWidth = self.driver.width if portrait else self.driver.height
+        #The text is laid out in logical coordinates (rows from top to bottom) and
+        #drawn in the native orientation of the panel. The orientation maps between
+        #the two, so nothing needs to be rotated or flipped after drawing.
+        orientation = Orientation.for_panel(self.driver.width, self.driver.height, portrait, flipx, flipy)
+
+        #Typing usually changes just a cell or two next to the cursor. Those are drawn
+        #straight away, without going through the row by row machinery below.
+        if self.partialdraw_keystroke(oldlines, newlines, cursor, oldcursor, oldimage, fill, orientation):
+            return oldimage
         
+        #If the console has scrolled, move the rows that are already on the retained
+        #frame instead of rendering them again. After that only the newly exposed rows
+        #(and whatever else changed) are rendered, but the whole scrolled area still has
+        #to be sent to the panel.
+        oldRows = None
+        scrolledArea = None
+        shift = self.partialdraw_get_scroll(oldlines, newlines) if oldimage else 0
+        if shift:
+            oldRows, scrolledArea = self.partialdraw_scroll_image(oldimage, shift, orientation)
+
         #First, run through each row and build a list of strings to potentially draw
-        changedLines = self.partialdraw_get_changed_lines(cursor, oldcursor, oldlines, newlines)
-
-
-        #If this panel doesn't support multiple draws in a single refresh, then we
-        #are probably better off merging the individual lines of text into a single
-        #block and drawing that instead.
-        #This is because of the overhead involved with each individual write to the
-        #GPIO pins, so it can be faster to do one big write instead of two small writes.
-        #
-        #There's no strict rule of which is faster.
-        #It depends on the speed of the machine (eg. rpi zero vs rpi 4b) and the speed
-        #of the panel refresh.
-        #
-        #The value of maxRedraw should probably always be either 1 or 2.
-        if not self.driver.supports_multi_draw:
-            maxRedraw = 1
-            blocks = self.partialdraw_get_text_blocks(changedLines)
-            self.partialdraw_merge_text_blocks(blocks, maxRedraw, changedLines)
-        
+        changedLines = self.partialdraw_get_changed_lines(oldlines, newlines, oldRows)
+
+
 
         #For each line in `changedLines`, figure out its coordinates and other information
         #needed for drawing.
-        linesToDraw = self.partialdraw_get_lines_to_draw(changedLines, height, flipy, driverHeight)
+        linesToDraw = self.partialdraw_get_lines_to_draw(changedLines, oldlines, newlines, height)
         
 
-        #Take those lines and turn them into actual images, performing all necessary
-        #rotation, coordinate adjustments, etc.
-        imagesToDraw = self.partialdraw_get_images_to_draw(linesToDraw, cursor, oldcursor, height, fill, flipx, flipy, driverWidth)
+        #Take those lines and turn them into actual images in the native orientation,
+        #with their logical coordinates.
+        imagesToDraw = self.partialdraw_get_images_to_draw(linesToDraw, height, fill, orientation, oldlines)
 
 
         #If oldimage is defined, update it by drawing the new frames onto it.
@@ -527,213 +772,349 @@ class PaperTTY:
         #We're building it to a) return a full-screen image as the return value for
         #compatibility with other papertty functions and b) perform cropping for
         #1bpp alignment.
+        #The cursor is not part of this image, it's laid over the areas sent to the panel.
+        hadImage = bool(oldimage)
         if not oldimage:
-            oldimage = Image.new('1', (driverWidth, driverHeight), self.white)
-        
+            oldimage = Image.new(self.image_mode, (self.driver.width, self.driver.height), self.white)
+
+        #Paste each image at its native position, which is also the changed area.
+        #If the console scrolled, the changed rows are drawn together with the rest of
+        #the scrolled area.
+        boxes = [orientation.paste(oldimage, arr["image"], (arr["x"], arr["y"])) for arr in imagesToDraw]
+        if scrolledArea:
+            boxes = [scrolledArea]
+
+        #Moving the cursor only takes updating the cell it left and the one it moved to,
+        #the text under it is already on the retained frame.
+        cursorBox = self.partialdraw_get_cursor_box(newlines, cursor, orientation)
+        oldCursorBox = self.partialdraw_get_cursor_box(oldlines, oldcursor, orientation) if hadImage else None
+        if cursorBox != oldCursorBox:
+            boxes += [box for box in (oldCursorBox, cursorBox) if box]
+
+        self.partialdraw_send(oldimage, boxes, cursorBox, orientation)
+
+        return oldimage
+
+    def partialdraw_get_cursor_box(self, lines, cursor, orientation):
+
+        """Return the native box of the cursor at `cursor` on the rows `lines`, or None
+            if the cursor isn't shown (or is off the screen)."""
+
+        if not (cursor and self.cursor):
+            return None
+        x, y = cursor[0], cursor[1]
+
+        #The cursor may be past the end of the text, and a proportional font needs the
+        #text before it to know where it is
+        line = self.partialdraw_get_line(lines, y)
+        if x >= len(line):
+            line = line.ljust(x + 1)
+        offsets = self.get_glyphs(orientation).offsets(line)
+        left, top, right, bottom = self.cursor_box(offsets[x], offsets[x + 1], offsets[-1])
+        top += y * self.font_height
+        bottom = min(bottom + y * self.font_height, orientation.height)
+        right = min(right, orientation.width)
+        if left >= right or top >= bottom:
+            return None
+        return orientation.rect((left, top, right, bottom))
+
+    def partialdraw_send(self, image, boxes, cursorBox, orientation, fast=False):
+
+        """Send the native boxes of the retained frame to the panel, with the cursor
+            laid over them. The text was compared already, so the boxes go straight to
+            the planning and drawing stages of the text pipeline."""
+
+        if not boxes:
+            return
+
+        if self.text_pipeline is None:
+            self.text_pipeline = FramePipeline(self.partialdraw_draw, planner=self.partialdraw_plan, hook=self.stage_hook)
+        self.text_pipeline.process(image, boxes, cursorBox=cursorBox, orientation=orientation, fast=fast)
+
+    def partialdraw_plan(self, boxes, image, cursorBox, orientation, fast):
+
+        """Return the boxes to send: merged as planned by plan_draws, or with `fast`
+            all in one box."""
+
+        #The planner merges neighbouring boxes, so put them in the order of the rows
+        if orientation.portrait:
+            boxes = sorted(boxes, key=lambda box: (box[1], box[0]))
+        else:
+            boxes = sorted(boxes)
+        if fast:
+            xdiv, ydiv = self.alignment
+            return [self.band((min(box[0] for box in boxes), min(box[1] for box in boxes),
+                               max(box[2] for box in boxes), max(box[3] for box in boxes)), xdiv=xdiv, ydiv=ydiv)]
+        return self.plan_draws(boxes, image.mode)
+
+    def partialdraw_draw(self, image, boxes, cursorBox, orientation, fast):
+
+        """Draw the boxes of the retained frame with the cursor laid over them, with
+            one draw_multi if the driver supports it and as separate draws otherwise.
+            `fast` draws the one box with driver.draw_fast."""
 
         #Array of bounded images to pass through to draw_multi if the driver
         #supports it via driver.supports_multi_draw
         imageArray = []
 
+        for bbox in boxes:
+            croppedImage = image.crop(bbox)
 
-        #For each image we want to draw, paste the image onto the fullscreen image (oldimage).
-        #Then build a bbox and band the image coordinates we required by the board
-        #and bpp setting.
-        #Finally, either draw the image immediately, or put it in imageArray so it can be
-        #drawn in bulk.
-        for arr in imagesToDraw:
-            oldimage.paste(arr["image"], (arr["x"], arr["y"])) #for the return data
-
-            diff_bbox = ( \
-                arr["x"], \
-                arr["y"], \
-                arr["x"] + arr["image"].width, \
-                arr["y"] + arr["image"].height \
-            )
-            if self.driver.supports_1bpp and self.driver.enable_1bpp:
-                xdiv = self.driver.align_1bpp_width
-                ydiv = self.driver.align_1bpp_height
-            else:
-                xdiv = 8
-                ydiv = 1
-
-            #If the screen is rotated, then switch the bounds around.
-            #This is because we crop BEFORE rotating, so doing it here
-            #with switched values saves us from needing to crop a second
-            #time.
-            if not portrait:
-                xdiv, ydiv = ydiv, xdiv
-
-            bbox = self.band(diff_bbox, xdiv=xdiv, ydiv=ydiv)
-
-            croppedImage = oldimage.crop(bbox)
-            x, y = bbox[0], bbox[1]
-
-            #Rotate the image and coordinates
-            if not portrait:
-                croppedImage = croppedImage.rotate(90, expand=True)
-                x, y = y, driverWidth - x - croppedImage.height
-
-            #If multi_draw is supported, add the image to an array so they can
-            #all be sent through at once.
-            #Otherwise, just draw the image immediately.
-            if self.driver.supports_multi_draw:
-                imageArray.append({"x":x, "y":y, "image":croppedImage})
-            else:
-                self.driver.draw(x, y, croppedImage)
+            #Lay the cursor over the part of it that falls in this box
+            if cursorBox:
+                overlap = (max(cursorBox[0], bbox[0]) - bbox[0], max(cursorBox[1], bbox[1]) - bbox[1],
+                           min(cursorBox[2], bbox[2]) - bbox[0], min(cursorBox[3], bbox[3]) - bbox[1])
+                if overlap[0] < overlap[2] and overlap[1] < overlap[3]:
+                    self.draw_cursor(croppedImage, overlap)
 
+            imageArray.append({"x":bbox[0], "y":bbox[1], "image":croppedImage})
 
-        if self.driver.supports_multi_draw:
+        #Remember where the cursor is on the panel and where the updates left ghosting
+        self.cursor_overlay = cursorBox
+        self.record_draws(boxes, image.mode, fast)
+
+        if fast:
+            self.driver.draw_fast(imageArray[0]["x"], imageArray[0]["y"], imageArray[0]["image"])
+        elif self.driver.supports_multi_draw:
             self.driver.draw_multi(imageArray)
+        else:
+            for arr in imageArray:
+                self.driver.draw(arr["x"], arr["y"], arr["image"])
+    
+    def partialdraw_keystroke(self, oldlines, newlines, cursor, oldcursor, oldimage, fill, orientation):
 
+        """Fast path for the common case of a keystroke: at most one row changed, and
+            the changed characters and the old and new cursor are a few cells apart on
+            it. Only the changed characters are rendered onto the retained frame, and
+            the cells are sent to the panel right away with its fastest update mode.
+            Returns False without drawing anything if the change is not like that."""
 
-        return oldimage
-    
-    def partialdraw_get_changed_lines(self, cursor, oldcursor, oldlines, newlines):
+        if not oldimage or fill != self.black or self.image_mode != '1' or not self.get_glyphs(orientation).monospace:
+            return False
+
+        #Find the one row whose text changed, if any
+        comparable = isinstance(newlines, ConsoleSnapshot) and newlines.comparable(oldlines)
+        textRow = None
+        for i in range(self.rows):
+            if comparable:
+                textChanged = i < len(newlines) and newlines.row_changed(oldlines, i, i)
+            else:
+                textChanged = self.partialdraw_get_line(newlines, i) != self.partialdraw_get_line(oldlines, i)
+            if textChanged:
+                if textRow is not None:
+                    return False
+                textRow = i
+        row = textRow
+
+        #The cursor only matters if it moved
+        cursorBox = self.partialdraw_get_cursor_box(newlines, cursor, orientation)
+        oldCursorBox = self.partialdraw_get_cursor_box(oldlines, oldcursor, orientation)
+        cells = []
+        boxes = []
+        if cursorBox != oldCursorBox:
+            for box, position in ((oldCursorBox, oldcursor), (cursorBox, cursor)):
+                if box:
+                    boxes.append(box)
+                    cells.append(position[0])
+                    if row is None:
+                        row = position[1]
+                    elif position[1] != row:
+                        return False
+        if row is None:
+            return False
+
+        if textRow is not None:
+            firstChanged, lastChanged = self.partialdraw_get_changed_range(oldlines, newlines, row)
+            cells += [firstChanged, lastChanged]
+        if max(cells) - min(cells) >= self.keystroke_cells:
+            return False
+
+        if textRow is not None:
+            #Redraw the neighbours too, for the glyphs that stick out of their cells
+            newval = self.partialdraw_get_line(newlines, row)
+            first = max(firstChanged - 1, 0)
+            last = lastChanged + 1 if not self.cols else min(lastChanged + 1, max(self.cols, len(newval)) - 1)
+            context = 1 if first > 0 else 0
+            attrs = self.partialdraw_get_attrs(newlines, row)
+            chunk = {
+                "newval":newval[first-context:last+2],
+                "attrs":attrs[first-context:last+2] if attrs is not None else None
+            }
+            height = self.font_height
+            image = self.partialdraw_build_image((last - first + 1) * self.font_width, height, [chunk], height, fill, orientation, context)
+            boxes.append(orientation.paste(oldimage, image, (first * self.font_width, row * height)))
+
+        self.partialdraw_send(oldimage, boxes, cursorBox, orientation, fast=True)
+        return True
+
+    def partialdraw_get_changed_lines(self, oldlines, newlines, oldRows=None):
 
         """This function compares two strings arrays, oldlines and newlines, and
             figures out which lines of text in those arrays are different.
-            It also takes cursor position into consideration when figuring out if
-            the text has "changed" or not."""
+            The cursor is laid over the text when it's sent to the panel, so it
+            doesn't make a line "changed".
+            If the console has scrolled, oldRows tells which old line is now shown
+            on each row (None for the rows exposed by scrolling)."""
 
         #List of lines of text which have changed
         changedLines = []
 
+        #Console snapshots carry per-row digests, so unchanged rows can be skipped
+        #without decoding or comparing their text at all.
+        comparable = isinstance(newlines, ConsoleSnapshot) and newlines.comparable(oldlines)
+
         for i in range(self.rows):
-            
-            newval = newlines[i] if i < len(newlines) else ''
-            oldval = oldlines[i] if i < len(oldlines) else ''
-
-            #Use these variables to check if the cursor has moved
-            cursorIsOnThisLine = False
-            cursorWasOnThisLine = False
-            cursorMovedHorizontally = False
-
-            if cursor and self.cursor:
-                cur_y = cursor[1]
-                if cur_y == i:
-                    cursorIsOnThisLine = True
-
-            if oldcursor:
-                cur_y = oldcursor[1]
-                if cur_y == i:
-                    cursorWasOnThisLine = True
-
-            #If the cursor was on this line last render, and it's still on this line
-            #this render, then we need to check the x axis (cursor[0]) and the text
-            #to judge whether the cursor needs drawing or not.
-            #If it doesn't need drawing, set both variables to false.
-            if cursorIsOnThisLine and cursorWasOnThisLine:
-                if oldcursor[0] != cursor[0]:
-                    cursorMovedHorizontally = True
-                elif oldval == newval:
-                    cursorIsOnThisLine = False
-                    cursorWasOnThisLine = False
-
-            #Draw this line if either the cursor has moved, or the text has changed
-            drawThisLine = cursorMovedHorizontally or cursorIsOnThisLine != cursorWasOnThisLine or oldval != newval
 
+            oldRow = i if oldRows is None else oldRows[i]
+
+            if oldRow is None:
+                #A row exposed by scrolling is redrawn completely
+                textChanged = True
+            elif comparable:
+                textChanged = i < len(newlines) and newlines.row_changed(oldlines, i, oldRow)
+            else:
+                textChanged = self.partialdraw_get_line(newlines, i) != self.partialdraw_get_line(oldlines, oldRow)
+
+            #The text itself is only looked up for the lines that are actually drawn
             lineToDraw = {
-                "drawThisLine":drawThisLine,
-                "newval":newval,
-                "cursorIsOnThisLine":cursorIsOnThisLine,
-                "oldval":oldval,
-                "cursorWasOnThisLine":cursorWasOnThisLine
+                "drawThisLine":textChanged,
+                "row":i,
+                "oldRow":oldRow
             }
             changedLines.append(lineToDraw)
 
         return changedLines
 
-    def partialdraw_get_text_blocks(self, changedLines):
+    @staticmethod
+    def partialdraw_get_line(lines, i):
+        """Return line i of a list of lines (or a console snapshot), or an empty string
+            if there's no such line"""
+        return lines[i] if i < len(lines) else ''
 
-        """This function takes the result of partialdraw_get_changed_lines and
-            groups consecutive lines together in order to create blocks of text."""
+    @staticmethod
+    def partialdraw_get_attrs(lines, i):
+        """Return the attribute bytes of line i of a console snapshot read with
+            attributes, or None"""
+        if isinstance(lines, ConsoleSnapshot) and i < len(lines):
+            return lines.row_attrs(i)
+        return None
 
-        #Array of grouped text blocks
-        blocks = []
+    @staticmethod
+    def find_scroll(oldkeys, newkeys):
+        """Find how many rows the content has moved up (negative for down) by matching
+            the keys (ie. digests) of the rows that appear only once in the old content.
+            Return 0 if it hasn't moved, or if too few of the rows agree."""
+        counts = Counter(oldkeys)
+        positions = {key: j for j, key in enumerate(oldkeys) if counts[key] == 1}
+        votes = Counter()
+        unmoved = 0
+        for i, key in enumerate(newkeys):
+            j = positions.get(key)
+            if j == i:
+                unmoved += 1
+            elif j is not None:
+                votes[j - i] += 1
+        if not votes:
+            return 0
+        shift, count = votes.most_common(1)[0]
+        if count > unmoved and count >= max(2, len(newkeys) // 4):
+            return shift
+        return 0
+
+    def partialdraw_get_scroll(self, oldlines, newlines):
+
+        """Return how many rows the console has scrolled up (negative for down)
+            between oldlines and newlines, or 0 if it hasn't."""
+
+        if isinstance(newlines, ConsoleSnapshot):
+            if not newlines.comparable(oldlines) or newlines.rows != self.rows:
+                return 0
+            scroll = newlines.scroll_from(oldlines)
+            if scroll is not None:
+                return scroll
+            return self.find_scroll(oldlines.digests, newlines.digests)
+        if isinstance(oldlines, ConsoleSnapshot):
+            return 0
+        return self.find_scroll([self.partialdraw_get_line(oldlines, i) for i in range(self.rows)],
+                                [self.partialdraw_get_line(newlines, i) for i in range(self.rows)])
+
+    def partialdraw_scroll_image(self, image, shift, orientation):
+
+        """Scroll the rows on the retained frame by `shift` rows (up if positive).
+            Returns the old line now shown on each row (None for the rows exposed by
+            scrolling, which still show their old content) and the native box of
+            the scrolled area."""
 
-        #Used in the loop to keep track of whether the previous line was flagged for
-        #drawing or not
-        drawLastLine = False
-        
-        for i, arr in enumerate(changedLines):
-            
-            drawThisLine = arr["drawThisLine"]
+        height = self.font_height
+        #Rows of a proportional font may be wider than the columns in `M`s
+        if self.cols and self.get_glyphs(orientation).monospace:
+            width = min(self.cols * self.font_width, orientation.width)
+        else:
+            width = orientation.width
+        if shift > 0:
+            source = (0, shift * height, width, self.rows * height)
+            target = (0, 0)
+        else:
+            source = (0, 0, width, (self.rows + shift) * height)
+            target = (0, -shift * height)
+        orientation.paste(image, image.crop(orientation.rect(source)), target)
+        oldRows = [i + shift if 0 <= i + shift < self.rows else None for i in range(self.rows)]
+        return oldRows, orientation.rect((0, 0, width, self.rows * height))
+
+    def partialdraw_get_changed_range(self, oldlines, newlines, i, oldRow=-1):
+
+        """Return the indexes of the first and last changed character of line i,
+            compared to the old line oldRow (the same line by default, None for a line
+            exposed by scrolling).
+            Console snapshots are compared cell by cell with a vectorized comparison,
+            plain strings with slice comparisons instead of walking them char by char."""
+
+        if oldRow == -1:
+            oldRow = i
+
+        if isinstance(newlines, ConsoleSnapshot) and newlines.comparable(oldlines):
+            if oldRow is None:
+                return (0, newlines.cols - 1)
+            span = newlines.changed_span(oldlines, i, oldRow) if i < len(newlines) else None
+            #An unchanged line has nothing to draw, use the same convention as below
+            #for lines of equal length.
+            return span if span else (newlines.cols - 1, 0)
+
+        newval = self.partialdraw_get_line(newlines, i)
+
+        #A line exposed by scrolling still shows whatever was there before, so
+        #clear the whole width of it
+        if oldRow is None:
+            oldlen = len(self.partialdraw_get_line(oldlines, i))
+            return (0, max(len(newval), oldlen, self.cols or 0, 1) - 1)
+
+        oldval = self.partialdraw_get_line(oldlines, oldRow)
+        oldlen = len(oldval)
+        newlen = len(newval)
+
+        #If either string is empty, everything from the start has changed.
+        #Otherwise find the first non-matching character.
+        #firstChanged falls on the end of the shorter line if one line completely
+        #encapsulates the other.
+        #eg. if the line changed from "test" to "testing" then they are identical
+        #until the last char of the old string, so set firstChanged to be the final
+        #character of whichever line is shorter.
+        if oldlen == 0 or newlen == 0:
+            firstChanged = 0
+        else:
+            firstChanged = min(first_difference(oldval, newval), min(oldlen, newlen) - 1)
 
-            #If this line is to be drawn, and so was the previous line, group them
-            #together in the same block.
-            #If this line is to be drawn, but the previous one wasn't, then start a
-            #new block instead.
-            if drawThisLine:
-                if drawLastLine:
-                    blocks[-1]["end"] = i
-                else:
-                    blocks.append({"start":i, "end":i})
-
-            drawLastLine = drawThisLine
-
-        return blocks
-
-    def partialdraw_merge_text_blocks(self, blocks, maxRedraw, changedLines):
-
-        """This function takes the result of partialdraw_get_text_blocks
-            and merges the text blocks together until the total number of block
-            does not exceed `maxRedraw`."""
-
-        #If the number of blocks to draw is more than we want to redraw separately
-        #(`maxRedraw`), then batch them together.
-        #We do this by setting `drawThisLine` to True for the lines in between separate
-        #blocks.
-        #This causes the "block" to be made bigger artificially by drawing lines we
-        #don't need to, which in turn leverages the "append" behavior in the drawing loop.
-        #
-        #This sounds counter-productive, but it actually speeds things up in cases where
-        #we can't perform multiple independent writes to the board in a single refresh.
-        #This is because each individual write to SPI incurs overhead, and each individual
-        #write also triggers a redraw by the e-ink panel which has its own delay.
-        #So if we're looking to do multiple small writes, sometimes it's preferable to do one
-        #bigger write instead.
-
-        if len(blocks) > maxRedraw:
-
-            #First, iterate through each block and figure out how big the gap is between
-            #that block and the next block.
-            #Then when we've found the smallest gap, merge those two blocks together.
-            #Repeat this process until the number of blocks does not exceed `maxRedraw`.
-            #The smallest gap is used as the criteria for merging because a "gap" between
-            #blocks is a section of lines which otherwise don't need to be drawn.
-            #Any of those lines we do draw is extra overhead.
-            #So to minimize that extra overhead, we make a point of looking for the
-            #smallest gaps.
-
-            while len(blocks) > maxRedraw:
-                smallestGap = -1
-                smallestGapIndex = -1
-                for i in range(len(blocks) - 1):
-                    thisBlock = blocks[i]
-                    nextBlock = blocks[i+1]
-                    thisBlockEnd = thisBlock["end"]
-                    nextBlockStart = nextBlock["start"]
-                    gap = nextBlockStart - thisBlockEnd
-                    if smallestGap == -1 or gap < smallestGap:
-                        smallestGap = gap
-                        smallestGapIndex = i
-                blockToMerge = blocks.pop(smallestGapIndex+1)
-                blocks[smallestGapIndex]["end"] = blockToMerge["end"]
-
-            #Next, iterate through all of the lines of text we were going to draw
-            #(or not draw) and reassess whether to draw them or not based on whether
-            #they're in one of the calculated text blocks.
-            #Setting drawThisLine to True means that line of text will be
-            #flagged for merging in the drawing loop elsewhere in the code.
-
-            for i, arr in enumerate(changedLines):
-                for block in blocks:
-                    if i >= block["start"] and i <= block["end"]:
-                        changedLines[i]["drawThisLine"] = True
-                        break
-
-    def partialdraw_get_lines_to_draw(self, changedLines, height, flipy, driverHeight):
+        #Next, find the LAST non-matching character.
+        #If the line length has changed, then the last char won't match, so just
+        #set it to that.
+        if newlen != oldlen:
+            lastChanged = max(oldlen, newlen) - 1
+        else:
+            lastChanged = max(last_difference(oldval, newval), 0)
+
+        return firstChanged, lastChanged
+
+    def partialdraw_get_lines_to_draw(self, changedLines, oldlines, newlines, height):
 
         """This function takes the result of partialdraw_get_changed_lines and
             figures out where and how to draw the line.
@@ -751,79 +1132,29 @@ class PaperTTY:
 
         for i, arr in enumerate(changedLines):
             drawThisLine = arr["drawThisLine"]
-            newval = arr["newval"]
-            cursorIsOnThisLine = arr["cursorIsOnThisLine"]
-            oldval = arr["oldval"]
-            cursorWasOnThisLine = arr["cursorWasOnThisLine"]
-
-            #Calculate the y coordinate based on the row number and font height.
-            #If flipy is set, count the rows backwards, since we want to draw from
-            #the "end" (which flipy moves to the start of the screen) instead.
-            if flipy:
-
-                #Calculate the gap between the last row and the edge of the screen,
-                #then add it to y.
-                #This is because we want the gap between the "last" row (which,
-                #when flipped, becomes the first row) to be at the bottom of the screen,
-                #not the top.
-                offset_y = driverHeight % self.font_height
-                
-                #We want to count backwards from 1 row BEFORE self.rows, since that's
-                #the maximum index we would actually draw at when counting forwards.
-                maxRowIndex = self.rows - 1
 
-                y = (maxRowIndex - i) * height
-                y += offset_y
-            else:
-                y = i * height
+            #Calculate the (logical) y coordinate based on the row number and font height.
+            #Flipping is left to the orientation, which also moves the gap after the
+            #last row to the other edge of the screen.
+            y = i * height
 
             if not drawThisLine:
 
-                #If the cursor hasn't moved to/from this line and the text hasn't changed,
-                #then don't add this line to the `linesToDraw` array.
+                #If the text hasn't changed, then don't add this line to the `linesToDraw` array.
                 #Just set append to false, since we aren't drawing this line and thus can't
                 #append to it
                 append = False
 
             else:
-                firstChanged = -1
-                lastChanged = 0
-                oldlen = len(oldval)
-                newlen = len(newval)
-                smallerLen = min(oldlen, newlen)
-
-                #Iterate through the old text value and the new text value char by char
-                #in order to find the first non-matching character.
-                #Or, if either string is empty, set firstChanged to 0.
-                if oldlen == 0 or newlen == 0:
-                    firstChanged = 0
-                else:
-                    for j in range(smallerLen):
-                        oldChar = oldval[j]
-                        newChar = newval[j]
-                        if oldChar != newChar:
-                            firstChanged = j
-                            break
-
-                #firstChanged might not be set if one line completely encapsulates the other.
-                #eg. if the line changed from "test" to "testing" then they are identical
-                #until the last char of the old string, so firstChanged would never be set.
-                #In that case, set firstChanged to be the final character of whichever line
-                #is shorter.
-                if firstChanged == -1:
-                    firstChanged = min(oldlen, newlen) - 1
-
-                #Next, try to find the LAST non-matching character.
-                #If the line length has changed, then the last char won't match, so just
-                #set it to that. Otherwise, iterate char by char again.
-                if newlen != oldlen:
-                    lastChanged = max(oldlen, newlen) - 1
-                else:
-                    for j in range(newlen):
-                        oldChar = oldval[j]
-                        newChar = newval[j]
-                        if oldChar != newChar:
-                            lastChanged = j
+                newval = self.partialdraw_get_line(newlines, i)
+                firstChanged, lastChanged = self.partialdraw_get_changed_range(oldlines, newlines, i, arr["oldRow"])
+
+                #Glyphs may stick out of their cells (ie. bold or wide ones), so also redraw
+                #the neighbours of the changed characters: they may have drawn over them,
+                #or may have been drawn over.
+                if firstChanged <= lastChanged:
+                    firstChanged = max(firstChanged - 1, 0)
+                    lastChanged = lastChanged + 1 if not self.cols else min(lastChanged + 1, max(self.cols, len(newval)) - 1)
 
                 #Set the x coordinate to start at `firstChanged` since we won't draw
                 #anything before that.
@@ -839,11 +1170,11 @@ class PaperTTY:
                     "x":x,
                     "y":y,
                     "newval":newval,
-                    "cursorIsOnThisLine":cursorIsOnThisLine,
+                    "oldRow":arr["oldRow"],
+                    "attrs":self.partialdraw_get_attrs(newlines, i),
                     "subsequentLines":subsequentLines,
                     "firstChanged":firstChanged,
-                    "lastChanged":lastChanged,
-                    "cursorWasOnThisLine":cursorWasOnThisLine
+                    "lastChanged":lastChanged
                 }
 
                 #If append is true, that means this line and the previous line were both altered.
@@ -861,14 +1192,18 @@ class PaperTTY:
 
         return linesToDraw
 
-    def partialdraw_get_images_to_draw(self, linesToDraw, cursor, oldcursor, height, fill, flipx, flipy, driverWidth):
+    def partialdraw_get_images_to_draw(self, linesToDraw, height, fill, orientation, oldlines=None):
 
         """This function takes the result of partialdraw_get_lines_to_draw and turns
-            each line into an image. It takes care of rotation, adjusting the
-            coordinates, and so on."""
+            each line into an image in the native orientation of the panel, along
+            with its logical coordinates."""
 
         #List of images (lines of text) to draw
         imagesToDraw = []
+
+        #Proportional fonts don't have the characters of different rows line up, so
+        #their blocks are measured with the advance tables of the rows instead.
+        glyphs = self.get_glyphs(orientation)
         
         for i, arr in enumerate(linesToDraw):
 
@@ -879,8 +1214,12 @@ class PaperTTY:
 
             #Run the chunks of text through the partialdraw_get_indexes_from_chunks function.
             #This will tell us the first and last character indexes to draw.
-            #TODO: if the font isn't monospace, this should just cover the entire line
-            (smallestStartIndex, biggestEndIndex) = self.partialdraw_get_indexes_from_chunks(chunks, cursor, oldcursor)
+            (smallestStartIndex, biggestEndIndex) = self.partialdraw_get_indexes_from_chunks(chunks)
+
+            if not glyphs.monospace:
+                imagesToDraw.append(self.partialdraw_get_proportional_image(chunks, smallestStartIndex, biggestEndIndex,
+                                                                            oldlines, height, fill, orientation, glyphs))
+                continue
 
             #Calculate the starting x coordinate (smallest_x) and the ending x coordinate
             #(biggest_x) of the block.
@@ -888,8 +1227,14 @@ class PaperTTY:
             biggest_x = biggestEndIndex * self.font_width
 
             #For each text chunk, reduce its length based on the chars we want to draw.
+            #Keep one more character on both sides for context: glyphs that stick out
+            #of their cells draw over the edges of the block, but the characters
+            #themselves are left outside of it.
+            context = 1 if smallestStartIndex > 0 else 0
             for chunk in chunks:
-                chunk["newval"] = chunk["newval"][smallestStartIndex:biggestEndIndex+1]
+                chunk["newval"] = chunk["newval"][smallestStartIndex-context:biggestEndIndex+2]
+                if chunk["attrs"] is not None:
+                    chunk["attrs"] = chunk["attrs"][smallestStartIndex-context:biggestEndIndex+2]
 
             #Calculate the image width based on how many chars have changed.
             #eg. If the text changed from "test" to "testing", then 3 chars have changed.
@@ -906,41 +1251,58 @@ class PaperTTY:
             rowHeight = lineHeight * len(chunks)
 
             #Draw the image
-            image = self.partialdraw_build_image(rowWidth, rowHeight, chunks, height, fill, cursor, smallestStartIndex)
-
-            #Flip the image, if needed.
-            #But do NOT rotate it here.
-            #Rotation is handled later in the process to simplify coordinate translation.
-            if flipx:
-                image = image.transpose(Image.FLIP_LEFT_RIGHT)
-            if flipy:
-                image = image.transpose(Image.FLIP_TOP_BOTTOM)
-            
-            #Figure out where to draw the image based on either the first or last
-            #chunk's coordinates
-            if flipy:
-                chunk = chunks[-1]
-            else:
-                chunk = chunks[0]
-
-            offset_x = 0 #driverWidth % self.font_width
-            y = chunk["y"]
+            image = self.partialdraw_build_image(rowWidth, rowHeight, chunks, height, fill, orientation, context)
 
-            #smallest_x is the x coordinate of the start of the changed area.
-            #So set x to be smallest_x if flipx is turned off.
-            #If flipx is turned on, then calculate the x coordinate based on
-            #the panel width, image width, etc.
-            if flipx:
-                x = driverWidth - image.width + offset_x - smallest_x
-            else:
-                x = smallest_x
+            #The block starts at the first chunk's row, and smallest_x is the x
+            #coordinate of the start of the changed area.
+            y = chunks[0]["y"]
+            x = smallest_x
 
             #Add this image to the list of images to draw
             imagesToDraw.append({"x":x, "y":y, "image":image})
 
         return imagesToDraw
 
-    def partialdraw_get_indexes_from_chunks(self, chunks, cursor, oldcursor):
+    def partialdraw_get_proportional_image(self, chunks, startIndex, endIndex, oldlines, height, fill, orientation, glyphs):
+
+        """Builds the image of a block of rows in a proportional font, along with its
+            logical coordinates.
+            The advance tables of the new and the old text of each row tell where the
+            characters startIndex..endIndex are, and the block covers all of them.
+            If they changed width, the rest of the row moved too, so then the block
+            reaches to the end of the longer row."""
+
+        left = None
+        right = 0
+        for chunk in chunks:
+            new = glyphs.offsets(chunk["newval"])
+            if chunk["oldRow"] is None:
+                #A row exposed by scrolling shows whatever was there before
+                old = None
+            else:
+                old = glyphs.offsets(self.partialdraw_get_line(oldlines, chunk["oldRow"]))
+            start = glyphs.offset(new, startIndex)
+            end = glyphs.offset(new, endIndex + 1)
+            if old is None:
+                start, end = 0, orientation.width
+            elif end != glyphs.offset(old, endIndex + 1):
+                start = min(start, glyphs.offset(old, startIndex))
+                #Leave room for the ink sticking out of the last glyph
+                end = max(end, glyphs.offset(old, endIndex + 1), new[-1], old[-1]) + self.font_width
+            left = start if left is None else min(left, start)
+            right = max(right, end)
+        left = max(min(left, orientation.width - 1), 0)
+        right = max(min(right, orientation.width), left + 1)
+
+        #Render the whole rows (they're likely cached) and take the block out of them
+        block = orientation.area(right - left, height * len(chunks))
+        image = Image.new(self.image_mode, block.native_size, self.white)
+        for j, chunk in enumerate(chunks):
+            block.paste(image, self.render_row(chunk["newval"], chunk["attrs"], None, fill, orientation), (-left, j * height))
+
+        return {"x":left, "y":chunks[0]["y"], "image":image}
+
+    def partialdraw_get_indexes_from_chunks(self, chunks):
 
         """Calculates the starting and ending character indexes of a text block.
             eg. If chunk[0] only changes from characters 0-4, but chunk[1] changed
@@ -964,77 +1326,26 @@ class PaperTTY:
             if endIndex > biggestEndIndex:
                 biggestEndIndex = endIndex
 
-        #If the cursor has moved, make sure it is drawn
-        for chunk in chunks:
-            cursorIsOnThisLine = chunk["cursorIsOnThisLine"]
-            cursorWasOnThisLine = chunk["cursorWasOnThisLine"]
-
-            #If the cursor both was and still is on this line, it may have moved horizontally.
-            #Check if x coordinates match.
-            #If they don't match, then the cursor has moved and needs to be redrawn.
-            #In which case we should adjust the smallest/biggest index of the text
-            #redraw to include the cursor.
-            if cursorIsOnThisLine and cursorWasOnThisLine:
-                cur_x = cursor[0]
-                old_x = oldcursor[0]
-                if cur_x != old_x:
-                    smaller_x = min(cur_x, old_x)
-                    bigger_x = max(cur_x, old_x)
-                    if smallestStartIndex == -1 or smaller_x < smallestStartIndex:
-                        smallestStartIndex = smaller_x
-                    if bigger_x > biggestEndIndex:
-                        biggestEndIndex = bigger_x
-
-            #If the cursor is now on a different line than it was before, and it is/was on this
-            #particular line, then we need to make sure the draw includes the index where the
-            #cursor is/was.
-            if cursorIsOnThisLine != cursorWasOnThisLine:
-                if cursorIsOnThisLine:
-                    cur_x = cursor[0]
-                else:
-                    cur_x = oldcursor[0]
-                if smallestStartIndex == -1 or cur_x < smallestStartIndex:
-                    smallestStartIndex = cur_x
-                if cur_x > biggestEndIndex:
-                    biggestEndIndex = cur_x
-
         return (smallestStartIndex, biggestEndIndex)
 
-    def partialdraw_build_image(self, rowWidth, rowHeight, chunks, height, fill, cursor, smallestStartIndex):
-
-        """Builds an image based on the chunks of text and size parameters passed in.
-            Also draws the cursor, if needed."""
-
+    def partialdraw_build_image(self, rowWidth, rowHeight, chunks, height, fill, orientation, context=0):
 
-        #First, create an image with the expected dimensions.
-        image = Image.new('1', (rowWidth, rowHeight), self.white)
+        """Builds an image in the native orientation based on the chunks of text and
+            size parameters passed in."""
 
 
-        #Then get the ImageDraw object so we can actually draw on the image.
-        draw = ImageDraw.Draw(image)
+        #First, create an image with the expected dimensions, and map the rows of the
+        #block to it.
+        block = orientation.area(rowWidth, rowHeight)
+        image = Image.new(self.image_mode, block.native_size, self.white)
 
 
-        #For each chunk, draw the text and possibly the cursor
+        #For each chunk, paste the (possibly cached) image of the text.
+        #The text starts `context` characters before the block.
+        x = -context * self.font_width
         for j, chunk in enumerate(chunks):
-            x = 0
             y = j * height
-            newval = chunk["newval"]
-            cursorIsOnThisLine = chunk["cursorIsOnThisLine"]
-
-            draw.text((x, y), newval, font=self.font, fill=fill, spacing=self.spacing)
-
-            #Draw the cursor, if it's on this line
-            if cursorIsOnThisLine:
-
-                #Adjust cursor's coordinate so they're relative to the text chunk's position
-                cursor_x = cursor[0] - smallestStartIndex
-                cursor_y = j
-                
-                newcursor = (cursor_x, cursor_y, cursor[2])
-                if self.cursor == 'block':
-                    image = self.draw_block_cursor(newcursor, image)
-                else:
-                    self.draw_line_cursor(newcursor, draw)
+            block.paste(image, self.render_row(chunk["newval"], chunk["attrs"], None, fill, orientation), (x, y))
 
         return image
 
@@ -1047,6 +1358,106 @@ class PaperTTY:
             self.error("Display not ready")
 
 
+class UpdateScheduler:
+    """Decides when to draw terminal updates. A change after a quiet period (ie. typing)
+       is drawn right away, but changes that keep coming in a burst (ie. `cat`ing a log)
+       are coalesced: wait until the console has been quiet for `min_latency` seconds,
+       but at most `max_latency` seconds from the first undrawn change, and then draw
+       only the latest state."""
+
+    def __init__(self, min_latency=0.1, max_latency=1.0):
+        self.min_latency = min_latency
+        self.max_latency = max_latency
+        # time of the latest change or draw
+        self.last_activity = None
+        self.last_change = None
+        self.pending_since = None
+        self.burst = False
+        self.changes = 0
+
+    def changed(self, now=None):
+        """Call whenever a new console state is seen"""
+        now = time.monotonic() if now is None else now
+        if self.pending_since is None:
+            self.pending_since = now
+            # a change right after the previous change or draw means the console is busy
+            self.burst = self.last_activity is not None and now - self.last_activity < self.min_latency
+        self.last_change = self.last_activity = now
+        self.changes += 1
+
+    def delay(self, now=None):
+        """Return how many seconds to wait before drawing the pending changes, 0 to draw now"""
+        if not self.burst or self.pending_since is None:
+            return 0
+        now = time.monotonic() if now is None else now
+        deadline = min(self.last_change + self.min_latency, self.pending_since + self.max_latency)
+        return max(deadline - now, 0)
+
+    def drawn(self, now=None):
+        """Call after drawing, return how many console states were skipped since the last draw"""
+        coalesced = max(self.changes - 1, 0)
+        self.last_activity = time.monotonic() if now is None else now
+        self.pending_since = None
+        self.burst = False
+        self.changes = 0
+        return coalesced
+
+
+class TextTail:
+    """The last lines of a stream of text, as many as fit on the display. Lines are
+       folded (or cut) to the width of the display as they come in and only the visible
+       ones are kept, so memory use doesn't depend on the amount of input."""
+
+    def __init__(self, rows, cols, encoding='utf-8', fold=True):
+        self.rows = rows
+        self.cols = cols
+        self.fold = fold
+        self.lines = deque(maxlen=rows)
+        # the line that hasn't ended yet
+        self.partial = ''
+        self.decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+
+    @staticmethod
+    def visible(line):
+        """Return what's left of a line on a terminal - a carriage return starts the
+           line over, ie. for progress bars"""
+        line = line.rstrip('\r')
+        return line[line.rfind('\r') + 1:].expandtabs()
+
+    def append(self, line):
+        line = self.visible(line)
+        if self.fold:
+            self.lines.extend(PaperTTY.split(line, self.cols) or [''])
+        else:
+            self.lines.append(line[:self.cols])
+
+    def feed(self, data, final=False):
+        """Add a chunk of input bytes"""
+        lines = (self.partial + self.decoder.decode(data, final)).split('\n')
+        self.partial = lines.pop()
+        for line in lines:
+            self.append(line)
+        if self.partial and final:
+            self.append(self.partial)
+            self.partial = ''
+        # keep a line that never ends from growing without bounds
+        self.partial = self.partial[self.partial.rstrip('\r').rfind('\r') + 1:]
+        if len(self.partial) > self.cols:
+            if self.fold:
+                split = (len(self.partial) - 1) // self.cols * self.cols
+                self.append(self.partial[:split])
+                self.partial = self.partial[split:]
+            else:
+                self.partial = self.partial[:self.cols]
+
+    def text(self):
+        """Return the visible text, the unfinished line included"""
+        lines = list(self.lines)
+        if self.partial:
+            lines = lines[max(len(lines) - self.rows + 1, 0):] + [self.visible(self.partial)[:self.cols]]
+        return '\n'.join(lines)
+
+
 class Settings:
     """A class to store CLI settings so they can be referenced in the subcommands"""
     args = {}
@@ -1145,8 +1556,9 @@ def display_image(driver, image, stretch=False, no_resize=False, fill_color="whi
 @click.option('--driver', default=None, help='Select display driver')
 @click.option('--nopartial', is_flag=True, default=False, help="Don't use partial updates even if display supports it")
 @click.option('--encoding', default='latin_1', help='Encoding to use for the buffer', show_default=True)
+@click.option('--profile', default=None, help='Calibration profile to use [default: ~/.config/papertty/DRIVER.json]')
 @click.pass_context
-def cli(ctx, driver, nopartial, encoding):
+def cli(ctx, driver, nopartial, encoding, profile):
     """Display stdin or TTY on a Waveshare e-Paper display"""
     if not driver:
         PaperTTY.error(
@@ -1156,7 +1568,7 @@ def cli(ctx, driver, nopartial, encoding):
         matched_drivers = [n for n in get_drivers() if n.lower() == driver.lower()]
         if not matched_drivers:
             PaperTTY.error('Invalid driver selection, choose from:\n{}'.format(get_driver_list()))
-        ctx.obj = Settings(driver=matched_drivers[0], partial=not nopartial, encoding=encoding)
+        ctx.obj = Settings(driver=matched_drivers[0], partial=not nopartial, encoding=encoding, profile=profile)
     pass
 
 
@@ -1177,6 +1589,55 @@ def scrub(settings, size):
     ptty.driver.scrub(fillsize=size)
 
 
+@click.command()
+@click.option('--mhz', 'speeds', multiple=True, type=float, help='Try this SPI speed in MHz and keep the fastest that works, repeat for each speed')
+@click.option('--repeat', default=3, help='How many times to time each measurement', show_default=True)
+@click.option('--vcom', default=None, help='VCOM as positive value x 1000. eg. 1460 = -1.46V')
+@click.option('--disable_a2', is_flag=True, default=False, help='Disable fast A2 panel refresh for black and white images')
+@click.option('--disable_1bpp', is_flag=True, default=False, help='Disable fast 1bpp mode')
+@click.pass_obj
+def calibrate(settings, speeds, repeat, vcom, disable_a2, disable_1bpp):
+    """Measure the bus and refresh timings of the display and save them as its profile"""
+    if vcom:
+        settings.args['vcom'] = int(vcom)
+    settings.args['enable_a2'] = not disable_a2
+    settings.args['enable_1bpp'] = not disable_1bpp
+    ptty = PaperTTY(**settings.args)
+    ptty.init_display()
+    print("Calibrating {} ({}x{}), the display is cleared to white".format(settings.args['driver'], ptty.driver.width, ptty.driver.height))
+
+    def reinit(partial):
+        ptty.driver.init(partial=partial, vcom=ptty.vcom, enable_a2=ptty.enable_a2, enable_1bpp=ptty.enable_1bpp, mhz=ptty.mhz)
+
+    # the fastest SPI speed at which the display still reports the same size and the
+    # bus gets faster is kept
+    size = (ptty.driver.width, ptty.driver.height)
+    best = None
+    for mhz in sorted(speeds):
+        ptty.mhz = mhz
+        reinit(ptty.partial)
+        if (ptty.driver.width, ptty.driver.height) != size:
+            print("{} MHz: the display doesn't answer properly, stopping here".format(mhz))
+            break
+        bus = Calibration(ptty.driver, *ptty.alignment, repeat=repeat, log=lambda line: None).bus()
+        rate = bus['chunks'][max(bus['chunks'], key=int)] if bus else 0
+        print("{} MHz: {:.0f} bytes/s".format(mhz, rate))
+        if best is None or rate > best[1]:
+            best = (mhz, rate)
+    if best:
+        ptty.mhz = best[0]
+        reinit(ptty.partial)
+
+    results = Calibration(ptty.driver, *ptty.alignment, repeat=repeat).run(reinit)
+    profile = OrderedDict([('driver', settings.args['driver']), ('width', ptty.driver.width), ('height', ptty.driver.height),
+                           ('mhz', ptty.mhz)])
+    profile.update(results)
+    save_profile(profile, ptty.profile_path)
+    print("Cost model: {:.3f} ms per draw, {:.3f} us per byte, {:.3f} s per refresh".format(
+        profile['cost']['draw_overhead'] * 1000, profile['cost']['byte_cost'] * 1e6, profile['cost']['refresh_cost']))
+    print("Saved the profile to {}".format(ptty.profile_path))
+
+
 @click.command()
 @click.option('--font', default=PaperTTY.defaultfont, help='Path to a TrueType or PIL font',
               show_default=True)
@@ -1185,13 +1646,20 @@ def scrub(settings, size):
 @click.option('--portrait', default=False, is_flag=True, help='Use portrait orientation', show_default=True)
 @click.option('--nofold', default=False, is_flag=True, help="Don't fold the input", show_default=True)
 @click.option('--spacing', default='0', help='Line spacing for the text, "auto" to automatically determine a good value', show_default=True)
+@click.option('--follow', default=False, is_flag=True, help='Keep showing the last lines as they come in, like tail -f', show_default=True)
+@click.option('--sleep', default=0.5, help='Minimum delay between screen updates when following (s)', show_default=True)
+@click.option('--minlatency', default=0.1, help='Draw a burst of input once it has been quiet this long when following (s)', show_default=True)
+@click.option('--maxlatency', default=1.0, help='Maximum delay before drawing a burst of input when following (s)', show_default=True)
 @click.pass_obj
-def stdin(settings, font, fontsize, width, portrait, nofold, spacing):
+def stdin(settings, font, fontsize, width, portrait, nofold, spacing, follow, sleep, minlatency, maxlatency):
     """Display standard input and leave it on screen"""
     settings.args['font'] = font
     settings.args['fontsize'] = fontsize
     settings.args['spacing'] = spacing
     ptty = settings.get_init_tty()
+    if follow:
+        follow_stdin(ptty, width, portrait, nofold, float(sleep), UpdateScheduler(float(minlatency), float(maxlatency)))
+        return
     text = sys.stdin.read()
     if not nofold:
         if width:
@@ -1203,6 +1671,53 @@ def stdin(settings, font, fontsize, width, portrait, nofold, spacing):
     ptty.showtext(text, fill=ptty.driver.black, portrait=portrait)
 
 
+def follow_stdin(ptty, width, portrait, nofold, interval, scheduler):
+    """Show the last lines of standard input until it ends, drawing only what changed"""
+    cols, rows = ptty.fit(portrait)
+    if width:
+        cols = min(int(width), cols)
+    # the partial updates need the size of the text
+    ptty.rows, ptty.cols = rows, cols
+    tail = TextTail(rows, cols, sys.stdin.encoding or 'utf-8', fold=not nofold)
+    fd = sys.stdin.fileno()
+    oldtext = None
+    oldimage = None
+    pending = False
+    last_draw = None
+    eof = False
+    try:
+        while not eof:
+            now = time.monotonic()
+            if pending:
+                wait = scheduler.delay(now)
+                if last_draw is not None:
+                    wait = max(wait, last_draw + interval - now)
+                if wait <= 0:
+                    text = tail.text()
+                    if text != oldtext:
+                        oldimage = ptty.showtext(text, fill=ptty.driver.black, portrait=portrait,
+                                                 oldimage=oldimage, oldtext=oldtext)
+                        oldtext = text
+                        last_draw = time.monotonic()
+                    scheduler.drawn(last_draw)
+                    pending = False
+                    continue
+            else:
+                wait = None
+            # wait for input, or until the pending input should be drawn
+            if select.select([fd], [], [], wait)[0]:
+                data = os.read(fd, 65536)
+                eof = not data
+                tail.feed(data, final=eof)
+                scheduler.changed()
+                pending = True
+    except KeyboardInterrupt:
+        pass
+    text = tail.text()
+    if text != oldtext:
+        ptty.showtext(text, fill=ptty.driver.black, portrait=portrait, oldimage=oldimage, oldtext=oldtext)
+
+
 @click.command()
 @click.option('--image', 'image_location', help='Location of image to display (omit for stdin)', show_default=True)
 @click.option('--stretch', default=False, is_flag=True, show_default=True,
@@ -1239,7 +1754,7 @@ def image(settings, image_location, stretch, no_resize, fill_color, mirror, flip
 @click.option('--rotate', default=None, help="Rotate screen (90 / 180 / 270)")
 @click.option('--invert', default=False, is_flag=True, help="Invert colors")
 @click.option('--sleep', default=1, show_default=True, help="Refresh interval (s)", type=float)
-@click.option('--fullevery', default=50, show_default=True, help="# of partial updates between full updates")
+@click.option('--fullevery', default=50, show_default=True, help="# of partial updates an area can take before it gets a full update when idle, 0 to never clean")
 @click.pass_obj
 def vnc(settings, host, display, password, rotate, invert, sleep, fullevery):
     """Display a VNC desktop"""
@@ -1257,7 +1772,7 @@ def vnc(settings, host, display, password, rotate, invert, sleep, fullevery):
 @click.option('--rotate', default=None, help="Rotate screen (90 / 180 / 270)")
 @click.option('--invert', default=False, is_flag=True, help="Invert colors")
 @click.option('--sleep', default=1, show_default=True, help="Refresh interval (s)", type=float)
-@click.option('--fullevery', default=50, show_default=True, help="# of partial updates between full updates")
+@click.option('--fullevery', default=50, show_default=True, help="# of partial updates an area can take before it gets a full update when idle, 0 to never clean")
 @click.pass_obj
 def fb(settings, fb_num, rotate, invert, sleep, fullevery):
     """Display the framebuffer"""
@@ -1266,13 +1781,19 @@ def fb(settings, fb_num, rotate, invert, sleep, fullevery):
 
 
 @click.command()
-@click.option('--vcsa', default='/dev/vcsa1', help='Virtual console device (/dev/vcsa[1-63])', show_default=True)
-@click.option('--font', default=PaperTTY.defaultfont, help='Path to a TrueType or PIL font', show_default=True)
+@click.option('--vcsa', default='/dev/vcsa1', help='Virtual console device (/dev/vcsa[1-63]), or a file or FIFO of vcsa frames', show_default=True)
+@click.option('--rate', default=0.0, help='Frames per second to play a file of vcsa frames at, 0 for the next frame on every update', show_default=True)
+@click.option('--follow', is_flag=True, default=False, help='Follow the console in the foreground instead of --vcsa', show_default=True)
+@click.option('--tile', 'tiles', multiple=True, help='Show a console in a tile of the display instead of --vcsa: VCSA[,FONT[,SIZE]], repeat for each tile')
+@click.option('--font', default=PaperTTY.defaultfont, help='Path to a TrueType or PIL font, or "kernel" for the font of the console', show_default=True)
 @click.option('--size', 'fontsize', default=8, help='Font size', show_default=True)
 @click.option('--noclear', default=False, is_flag=True, help='Leave display content on exit')
 @click.option('--nocursor', default=False, is_flag=True, help="(DEPRECATED, use --cursor=none instead) Don't draw the cursor")
 @click.option('--cursor', default='legacy', help='Set cursor type. Valid values are default (underscore cursor at a sensible place), block (inverts colors at cursor), none (draws no cursor) or a number n (underscore cursor n pixels from the bottom)', show_default=False)
 @click.option('--sleep', default=0.1, help='Minimum sleep between refreshes', show_default=True)
+@click.option('--poll', 'use_poll', is_flag=True, default=False, help='Wait for console changes instead of sleeping (falls back to --sleep if unsupported)', show_default=True)
+@click.option('--minlatency', default=0.1, help='Draw a burst of output once the console has been quiet this long (s), 0 draws every change', show_default=True)
+@click.option('--maxlatency', default=1.0, help='Maximum delay before drawing a burst of output (s)', show_default=True)
 @click.option('--rows', 'ttyrows', default=None, help='Set TTY rows (--cols required too)')
 @click.option('--cols', 'ttycols', default=None, help='Set TTY columns (--rows required too)')
 @click.option('--portrait', default=False, is_flag=True, help='Use portrait orientation', show_default=False)
@@ -1282,16 +1803,21 @@ def fb(settings, fb_num, rotate, invert, sleep, fullevery):
 @click.option('--scrub', 'apply_scrub', is_flag=True, default=False, help='Apply scrub when starting up',
               show_default=True)
 @click.option('--autofit', is_flag=True, default=False, help='Autofit terminal size to font size', show_default=True)
-@click.option('--attributes', is_flag=True, default=False, help='Use attributes', show_default=True)
+@click.option('--attributes', is_flag=True, default=False, help='Show reverse video, bold and (on grayscale panels) shading from the console attributes', show_default=True)
+@click.option('--rowcache', default=PaperTTY.default_row_cache_size / 1024 / 1024, help='Memory for caching rendered rows (MiB), 0 to disable', show_default=True)
+@click.option('--fullevery', default=50, show_default=True, help="# of partial updates an area can take before it gets a full update when idle, 0 to never clean")
 @click.option('--interactive', is_flag=True, default=False, help='Interactive mode')
 @click.option('--vcom', default=None, help='VCOM as positive value x 1000. eg. 1460 = -1.46V')
 @click.option('--disable_a2', is_flag=True, default=False, help='Disable fast A2 panel refresh for black and white images')
 @click.option('--disable_1bpp', is_flag=True, default=False, help='Disable fast 1bpp mode')
 @click.option('--mhz', default=None, help='Set SPI speed in MHz')
 @click.pass_obj
-def terminal(settings, vcsa, font, fontsize, noclear, nocursor, cursor, sleep, ttyrows, ttycols, portrait, flipx, flipy,
-             spacing, apply_scrub, autofit, attributes, interactive, vcom, disable_a2, disable_1bpp, mhz):
+def terminal(settings, vcsa, rate, follow, tiles, font, fontsize, noclear, nocursor, cursor, sleep, use_poll, minlatency, maxlatency, ttyrows, ttycols, portrait, flipx, flipy,
+             spacing, apply_scrub, autofit, attributes, rowcache, fullevery, interactive, vcom, disable_a2, disable_1bpp, mhz):
     """Display virtual console on an e-Paper display, exit with Ctrl-C."""
+    # the console font of the console being displayed, the tiles look up their own
+    if font == 'kernel' and not follow and not tiles and os.path.exists(vcsa) and is_device(vcsa):
+        font = 'kernel:{}'.format(PaperTTY.ttydev(vcsa))
     settings.args['font'] = font
     settings.args['fontsize'] = fontsize
     settings.args['spacing'] = spacing
@@ -1312,6 +1838,8 @@ def terminal(settings, vcsa, font, fontsize, noclear, nocursor, cursor, sleep, t
     
     settings.args['enable_a2'] = not disable_a2
     settings.args['enable_1bpp'] = not disable_1bpp
+    settings.args['attributes'] = attributes
+    settings.args['row_cache_size'] = int(float(rowcache) * 1024 * 1024)
     
     if mhz:
         mhz = float(mhz)
@@ -1335,6 +1863,15 @@ def terminal(settings, vcsa, font, fontsize, noclear, nocursor, cursor, sleep, t
 
     if apply_scrub:
         ptty.driver.scrub()
+
+    ptty.track_ghosting(fullevery)
+    if tiles:
+        if interactive or follow:
+            print("--interactive and --follow can't be used with --tile, ignoring them")
+        show_tiles(ptty, tiles, settings, float(sleep), use_poll, UpdateScheduler(float(minlatency), float(maxlatency)),
+                   autofit, noclear, {'portrait': portrait, 'flipx': flipx, 'flipy': flipy})
+        return
+
     oldbuff = ''
     oldimage = None
     oldcursor = None
@@ -1345,6 +1882,8 @@ def terminal(settings, vcsa, font, fontsize, noclear, nocursor, cursor, sleep, t
     def sigint_handler(sig, frame):
         if not interactive:
             print("Exiting (SIGINT)...")
+            if ptty.row_cache is not None:
+                print("Row cache: {}".format(ptty.row_cache))
             if not noclear:
                 ptty.showtext(oldbuff, fill=ptty.white, **textargs)
             sys.exit(0)
@@ -1365,143 +1904,584 @@ def terminal(settings, vcsa, font, fontsize, noclear, nocursor, cursor, sleep, t
 
     if any([ttyrows, ttycols]) and not all([ttyrows, ttycols]):
         ptty.error("You must define both --rows and --cols to change terminal size.")
-    if ptty.valid_vcsa(vcsa):
-        if all([ttyrows, ttycols]):
-            ptty.set_tty_size(ptty.ttydev(vcsa), ttyrows, ttycols)
-        else:
+    def open_console(device):
+        """Open the source of a console and set the size of its TTY if asked to"""
+        console = ptty.open_console(device, attributes=attributes, rate=float(rate))
+        if isinstance(console, VirtualConsole):
+            if all([ttyrows, ttycols]):
+                ptty.set_tty_size(ptty.ttydev(device), ttyrows, ttycols)
             # if size not specified manually, see if autofit was requested
-            if autofit:
+            elif autofit:
                 max_dim = ptty.fit(portrait)
                 print("Automatic resize of TTY to {} rows, {} columns".format(max_dim[1], max_dim[0]))
-                ptty.set_tty_size(ptty.ttydev(vcsa), max_dim[1], max_dim[0])
+                ptty.set_tty_size(ptty.ttydev(device), max_dim[1], max_dim[0])
+        return console
+
+    if follow:
+        try:
+            console = ActiveConsole(open_console)
+        except OSError as e:
+            ptty.error("Can't follow the active console: {}".format(e))
+        vcsa = "the active console"
+    else:
+        console = open_console(vcsa)
+        if console and not isinstance(console, VirtualConsole):
+            # the frames decide the size, there's no TTY to resize
+            if any([ttyrows, ttycols, autofit]):
+                print("{} is not a console device, ignoring --rows, --cols and --autofit".format(vcsa))
+                autofit = False
+    if console:
+        poller = None
+        poll_fds = console.poll_fds()
+        if use_poll:
+            poller = ptty.vcsa_poller(poll_fds[0]) if poll_fds else None
+            if poller:
+                # ie. the file telling which console is active
+                for fd in poll_fds[1:]:
+                    poller.register(fd, select.POLLPRI)
+            else:
+                print("Can't wait for changes to {}, falling back to sleeping".format(vcsa))
+        if poller:
+            interval = "waiting for changes"
+        else:
+            interval = "minimum update interval {} s".format(sleep)
+        scheduler = UpdateScheduler(float(minlatency), float(maxlatency))
+        # the latest console state seen, drawn or not
+        lastsample = None
         if interactive:
-            print("Started displaying {}, minimum update interval {} s, open menu with Ctrl-C".format(vcsa, sleep))
+            print("Started displaying {}, {}, open menu with Ctrl-C".format(vcsa, interval))
         else:
-            print("Started displaying {}, minimum update interval {} s, exit with Ctrl-C".format(vcsa, sleep))
-        character_width, vcsudev = ptty.vcsudev(vcsa)
-        while True:
-            if flags['show_menu']:
-                flags['show_menu'] = False
-                print()
-                print('Rendering paused. Enter')
-                print('    (f) to change font,')
-                print('    (s) to change spacing,')
-                if ptty.is_truetype:
-                    print('    (h) to change font size,')
-                print('    (c) to scrub,')
-                print('    (i) reinitialize display,')
-                print('    (r) do a full refresh,')
-                print('    (x) to exit,')
-                print('    anything else to continue.')
-                print('Command line arguments for current settings:\n    --font {} --size {} --spacing {}'.format(ptty.fontfile, ptty.fontsize, ptty.spacing))
-
-                ch = sys.stdin.readline().strip()
-                if ch == 'x':
-                    if not noclear:
-                        ptty.showtext(oldbuff, fill=ptty.white, **textargs)
-                    sys.exit(0)
-                elif ch == 'f':
-                    print('Current font: {}'.format(ptty.fontfile))
-                    new_font = click.prompt('Enter new font (leave empty to abort)', default='', show_default=False)
-                    if new_font:
-                        ptty.spacing = spacing
-                        ptty.font = ptty.load_font(new_font, keep_if_not_found=True)
-                        if autofit:
-                            max_dim = ptty.fit(portrait)
-                            print("Automatic resize of TTY to {} rows, {} columns".format(max_dim[1], max_dim[0]))
-                            ptty.set_tty_size(ptty.ttydev(vcsa), max_dim[1], max_dim[0])
-                        oldbuff = None
-                    else:
-                        print('Font not changed')
-                elif ch == 's':
-                    print('Current spacing: {}'.format(ptty.spacing))
-                    new_spacing = click.prompt('Enter new spacing (leave empty to abort)', default='empty', type=int, show_default=False)
-                    if new_spacing != 'empty':
-                        ptty.spacing = new_spacing
-                        ptty.recalculate_font(ptty.font)
-                        if autofit:
-                            max_dim = ptty.fit(portrait)
-                            print("Automatic resize of TTY to {} rows, {} columns".format(max_dim[1], max_dim[0]))
-                            ptty.set_tty_size(ptty.ttydev(vcsa), max_dim[1], max_dim[0])
-                        oldbuff = None
-                    else:
-                        print('Spacing not changed')
-                elif ch == 'h' and ptty.is_truetype:
-                    print('Current font size: {}'.format(ptty.fontsize))
-                    new_fontsize = click.prompt('Enter new font size (leave empty to abort)', default='empty', type=int, show_default=False)
-                    if new_fontsize != 'empty':
-                        ptty.fontsize = new_fontsize
-                        ptty.spacing = spacing
-                        ptty.font = ptty.load_font(path=None)
-                        if autofit:
-                            max_dim = ptty.fit(portrait)
-                            print("Automatic resize of TTY to {} rows, {} columns".format(max_dim[1], max_dim[0]))
-                            ptty.set_tty_size(ptty.ttydev(vcsa), max_dim[1], max_dim[0])
+            print("Started displaying {}, {}, exit with Ctrl-C".format(vcsa, interval))
+        # signals must interrupt the wait, otherwise the menu and scrub requests
+        # would only be noticed after the next console change
+        with ptty.signal_wakeup(poller):
+            while True:
+                if flags['show_menu']:
+                    flags['show_menu'] = False
+                    print()
+                    print('Rendering paused. Enter')
+                    print('    (f) to change font,')
+                    print('    (s) to change spacing,')
+                    if ptty.is_truetype:
+                        print('    (h) to change font size,')
+                    print('    (c) to scrub,')
+                    print('    (i) reinitialize display,')
+                    print('    (r) do a full refresh,')
+                    if ptty.ghosting:
+                        print('    (g) to show the ghosting heatmap,')
+                    print('    (x) to exit,')
+                    print('    anything else to continue.')
+                    print('Command line arguments for current settings:\n    --font {} --size {} --spacing {}'.format(ptty.fontfile, ptty.fontsize, ptty.spacing))
+
+                    ch = sys.stdin.readline().strip()
+                    if ch == 'x':
+                        if not noclear:
+                            ptty.showtext(oldbuff, fill=ptty.white, **textargs)
+                        sys.exit(0)
+                    elif ch == 'f':
+                        print('Current font: {}'.format(ptty.fontfile))
+                        new_font = click.prompt('Enter new font (leave empty to abort)', default='', show_default=False)
+                        if new_font:
+                            ptty.spacing = spacing
+                            ptty.font = ptty.load_font(new_font, keep_if_not_found=True)
+                            if autofit:
+                                max_dim = ptty.fit(portrait)
+                                print("Automatic resize of TTY to {} rows, {} columns".format(max_dim[1], max_dim[0]))
+                                ptty.set_tty_size(ptty.ttydev(console.vcsa), max_dim[1], max_dim[0])
+                            oldbuff = None
+                        else:
+                            print('Font not changed')
+                    elif ch == 's':
+                        print('Current spacing: {}'.format(ptty.spacing))
+                        new_spacing = click.prompt('Enter new spacing (leave empty to abort)', default='empty', type=int, show_default=False)
+                        if new_spacing != 'empty':
+                            ptty.spacing = new_spacing
+                            ptty.recalculate_font(ptty.font)
+                            if autofit:
+                                max_dim = ptty.fit(portrait)
+                                print("Automatic resize of TTY to {} rows, {} columns".format(max_dim[1], max_dim[0]))
+                                ptty.set_tty_size(ptty.ttydev(console.vcsa), max_dim[1], max_dim[0])
+                            oldbuff = None
+                        else:
+                            print('Spacing not changed')
+                    elif ch == 'h' and ptty.is_truetype:
+                        print('Current font size: {}'.format(ptty.fontsize))
+                        new_fontsize = click.prompt('Enter new font size (leave empty to abort)', default='empty', type=int, show_default=False)
+                        if new_fontsize != 'empty':
+                            ptty.fontsize = new_fontsize
+                            ptty.spacing = spacing
+                            ptty.font = ptty.load_font(path=None)
+                            if autofit:
+                                max_dim = ptty.fit(portrait)
+                                print("Automatic resize of TTY to {} rows, {} columns".format(max_dim[1], max_dim[0]))
+                                ptty.set_tty_size(ptty.ttydev(console.vcsa), max_dim[1], max_dim[0])
+                            oldbuff = None
+                        else:
+                            print('Font size not changed')
+                    elif ch == 'g' and ptty.ghosting:
+                        print(ptty.ghosting)
+                    elif ch == 'c':
+                        flags['scrub_requested'] = True
+                    elif ch == 'i':
+                        ptty.clear()
+                        oldimage = None
                         oldbuff = None
+                    elif ch == 'r':
+                        if oldimage:
+                            ptty.driver.reset()
+                            ptty.driver.init(partial=False, vcom=self.vcom, enable_a2=self.enable_a2, enable_1bpp=self.enable_1bpp, mhz=self.mhz)
+                            ptty.driver.draw(0, 0, oldimage)
+                            ptty.driver.reset()
+                            ptty.driver.init(partial=ptty.partial, vcom=self.vcom, enable_a2=self.enable_a2, enable_1bpp=self.enable_1bpp, mhz=self.mhz)
+
+                # if user or SIGUSR1 toggled the scrub flag, scrub display and start with a fresh image
+                if flags['scrub_requested']:
+                    ptty.driver.scrub()
+                    # clear old image and buffer and restore flag
+                    oldimage = None
+                    oldbuff = ''
+                    flags['scrub_requested'] = False
+            
+                # take a snapshot of the console, rows are decoded only when they're drawn
+                buff = console.read(keep=oldbuff)
+                cursor = buff.cursor
+                # another console came to the foreground, wait for changes to that one instead
+                if poller and console.poll_fds() != poll_fds:
+                    for fd in set(poll_fds) - set(console.poll_fds()):
+                        poller.unregister(fd)
+                    for fd in set(console.poll_fds()) - set(poll_fds):
+                        poller.register(fd, select.POLLPRI)
+                    poll_fds = console.poll_fds()
+                # follow the size of the console, it may not be what was asked for
+                if (buff.rows, buff.cols) != (ptty.rows, ptty.cols):
+                    ptty.rows, ptty.cols = buff.rows, buff.cols
+                if buff != lastsample:
+                    scheduler.changed()
+                    lastsample = buff.sample()
+                # do something only if content has changed or cursor was moved
+                if buff != oldbuff or cursor != oldcursor:
+                    delay = scheduler.delay()
+                    if delay:
+                        # the console is busy, so don't wake up for every change - check again
+                        # when it might have settled and draw only the latest state then
+                        time.sleep(delay)
+                        continue
+                    # show new content
+                    oldimage = ptty.showtext(buff, fill=ptty.black, cursor=cursor if not nocursor else None,
+                                            oldimage=oldimage,
+                                            oldtext=oldbuff,
+                                            oldcursor=oldcursor,
+                                            **textargs)
+                    oldbuff = buff
+                    oldcursor = cursor
+                    coalesced = scheduler.drawn()
+                    if coalesced:
+                        print("Coalesced {} frames".format(coalesced))
+                elif ptty.clean_delay(scheduler.last_activity) == 0:
+                    # the console has been idle for a while, clean up the ghosting
+                    cleaned = ptty.clean_ghosting(oldimage)
+                    if cleaned:
+                        print("Cleaned {}".format(cleaned))
+                elif poller:
+                    # sleep until the kernel tells us something changed, or until it's
+                    # time to clean up the ghosting
+                    delay = ptty.clean_delay(scheduler.last_activity)
+                    ptty.wait_for_vcsa(poller, poll_fds, None if delay is None else delay * 1000)
+                else:
+                    # delay before next update check
+                    time.sleep(float(sleep))
+
+
+def show_tiles(ptty, specs, settings, interval, use_poll, scheduler, autofit, noclear, textargs):
+    """Show several consoles on the display, each in its own tile with its own font
+       (specs are VCSA[,FONT[,SIZE]]). What the tiles draw in a cycle is sent to the
+       panel together, so it refreshes once however many tiles changed."""
+    driver = ptty.driver
+    if driver.supports_1bpp and driver.enable_1bpp:
+        xdiv, ydiv = driver.align_1bpp_width, driver.align_1bpp_height
+    else:
+        xdiv, ydiv = 8, 1
+    compositor = Compositor(driver)
+    boxes = tile_boxes(len(specs), driver.width, driver.height, textargs['portrait'], textargs['flipx'], textargs['flipy'],
+                       xdiv, ydiv)
+    tiles = []
+    for spec, box in zip(specs, boxes):
+        vcsa, _, rest = spec.partition(',')
+        font, _, size = rest.partition(',')
+        args = dict(settings.args)
+        # the tiles draw through the real driver, don't open another one - the costs
+        # of drawing are the real driver's too, so there's no profile to load
+        args['driver'] = 'Dummy'
+        args['profile'] = False
+        if font:
+            args['font'] = font
+        if size:
+            args['fontsize'] = int(size)
+        if args['font'] == 'kernel' and os.path.exists(vcsa) and is_device(vcsa):
+            args['font'] = 'kernel:{}'.format(PaperTTY.ttydev(vcsa))
+        args['row_cache_size'] = args.get('row_cache_size', PaperTTY.default_row_cache_size) // len(specs)
+        tile = PaperTTY(**args)
+        tile.driver = TileDriver(compositor, box)
+        tile.init_display()
+        console = tile.open_console(vcsa, attributes=tile.attributes)
+        if not console:
+            ptty.error("Can't show {}".format(vcsa))
+        if autofit and isinstance(console, VirtualConsole):
+            cols, rows = tile.fit(textargs['portrait'])
+            print("Automatic resize of {} to {} rows, {} columns".format(PaperTTY.ttydev(vcsa), rows, cols))
+            tile.set_tty_size(PaperTTY.ttydev(vcsa), rows, cols)
+        tiles.append({'name': vcsa, 'ptty': tile, 'console': console,
+                      'buff': None, 'sample': None, 'oldbuff': None, 'oldimage': None, 'oldcursor': None})
+
+    poll_fds = [fd for tile in tiles for fd in tile['console'].poll_fds()]
+    poller = None
+    if use_poll:
+        poller = PaperTTY.vcsa_poller(poll_fds[0]) if poll_fds else None
+        if poller:
+            for fd in poll_fds[1:]:
+                poller.register(fd, select.POLLPRI)
+        else:
+            print("Can't wait for changes to the consoles, falling back to sleeping")
+
+    flags = {'scrub_requested': False}
+
+    def sigusr1_handler(sig, frame):
+        print("Scrubbing display (SIGUSR1)...")
+        flags['scrub_requested'] = True
+
+    signal.signal(signal.SIGUSR1, sigusr1_handler)
+
+    print("Started displaying {}, exit with Ctrl-C".format(', '.join(tile['name'] for tile in tiles)))
+    # signals must interrupt the wait, otherwise a scrub request would only be
+    # noticed after the next console change
+    with PaperTTY.signal_wakeup(poller):
+        try:
+            while True:
+                if flags['scrub_requested']:
+                    driver.scrub()
+                    # start over with fresh images
+                    for tile in tiles:
+                        tile['oldbuff'] = tile['oldimage'] = tile['oldcursor'] = None
+                    ptty.clean_ghosting(None)
+                    flags['scrub_requested'] = False
+
+                # each tile looks for changes on its own
+                dirty = []
+                changed = False
+                for tile in tiles:
+                    buff = tile['buff'] = tile['console'].read(keep=tile['oldbuff'])
+                    if (buff.rows, buff.cols) != (tile['ptty'].rows, tile['ptty'].cols):
+                        tile['ptty'].rows, tile['ptty'].cols = buff.rows, buff.cols
+                    if buff != tile['sample']:
+                        changed = True
+                        tile['sample'] = buff.sample()
+                    if buff != tile['oldbuff'] or buff.cursor != tile['oldcursor']:
+                        dirty.append(tile)
+                if changed:
+                    scheduler.changed()
+
+                if dirty:
+                    delay = scheduler.delay()
+                    if delay:
+                        time.sleep(delay)
+                        continue
+                    for tile in dirty:
+                        buff, tty = tile['buff'], tile['ptty']
+                        tile['oldimage'] = tty.showtext(buff, fill=tty.black, cursor=buff.cursor,
+                                                        oldimage=tile['oldimage'],
+                                                        oldtext=tile['oldbuff'],
+                                                        oldcursor=tile['oldcursor'],
+                                                        **textargs)
+                        tile['oldbuff'] = buff
+                        tile['oldcursor'] = buff.cursor
+                    # one refresh for all of them
+                    if compositor.flush():
+                        ptty.record_draws(compositor.drawn, compositor.frame.mode)
+                    coalesced = scheduler.drawn()
+                    if coalesced:
+                        print("Coalesced {} frames".format(coalesced))
+                elif ptty.clean_delay(scheduler.last_activity) == 0:
+                    # the consoles have been idle for a while, clean up the ghosting
+                    # from the frame of the whole panel
+                    cleaned = ptty.clean_ghosting(compositor.frame)
+                    if cleaned:
+                        print("Cleaned {}".format(cleaned))
+                elif poller:
+                    # sleep until the kernel tells us something changed, or until it's
+                    # time to clean up the ghosting
+                    delay = ptty.clean_delay(scheduler.last_activity)
+                    PaperTTY.wait_for_vcsa(poller, poll_fds, None if delay is None else delay * 1000)
+                else:
+                    time.sleep(interval)
+        except KeyboardInterrupt:
+            print("Exiting (SIGINT)...")
+            if not noclear:
+                for tile in tiles:
+                    if tile['oldbuff'] is not None:
+                        tile['ptty'].showtext(tile['oldbuff'], fill=tile['ptty'].white, **textargs)
+                compositor.flush()
+        finally:
+            for tile in tiles:
+                tile['console'].close()
+
+
+@click.command(name='pty')
+@click.argument('command', nargs=-1)
+@click.option('--font', default=PaperTTY.defaultfont, help='Path to a TrueType or PIL font', show_default=True)
+@click.option('--size', 'fontsize', default=8, help='Font size', show_default=True)
+@click.option('--noclear', default=False, is_flag=True, help='Leave display content on exit')
+@click.option('--cursor', default='default', help='Set cursor type. Valid values are default (underscore cursor at a sensible place), block (inverts colors at cursor), none (draws no cursor) or a number n (underscore cursor n pixels from the bottom)', show_default=True)
+@click.option('--minlatency', default=0.1, help='Draw a burst of output once the program has been quiet this long (s), 0 draws every change', show_default=True)
+@click.option('--maxlatency', default=1.0, help='Maximum delay before drawing a burst of output (s)', show_default=True)
+@click.option('--rows', 'ttyrows', default=None, help='Set terminal rows (--cols required too) [default: fit to display]')
+@click.option('--cols', 'ttycols', default=None, help='Set terminal columns (--rows required too) [default: fit to display]')
+@click.option('--term', default='xterm', help='Terminal type (TERM) for the program', show_default=True)
+@click.option('--portrait', default=False, is_flag=True, help='Use portrait orientation', show_default=False)
+@click.option('--flipx', default=False, is_flag=True, help='Flip X axis', show_default=False)
+@click.option('--flipy', default=False, is_flag=True, help='Flip Y axis', show_default=False)
+@click.option('--spacing', default='0', help='Line spacing for the text, "auto" to automatically determine a good value', show_default=True)
+@click.option('--scrub', 'apply_scrub', is_flag=True, default=False, help='Apply scrub when starting up', show_default=True)
+@click.option('--attributes', is_flag=True, default=False, help='Show reverse video, bold and (on grayscale panels) shading from the text attributes', show_default=True)
+@click.option('--rowcache', default=PaperTTY.default_row_cache_size / 1024 / 1024, help='Memory for caching rendered rows (MiB), 0 to disable', show_default=True)
+@click.option('--fullevery', default=50, show_default=True, help="# of partial updates an area can take before it gets a full update when idle, 0 to never clean")
+@click.pass_obj
+def pty_terminal(settings, command, font, fontsize, noclear, cursor, minlatency, maxlatency, ttyrows, ttycols, term,
+                 portrait, flipx, flipy, spacing, apply_scrub, attributes, rowcache, fullevery):
+    """Run a command (default: $SHELL) in a pseudo-terminal and display it, exit with Ctrl-C."""
+    settings.args['font'] = font
+    settings.args['fontsize'] = fontsize
+    settings.args['spacing'] = spacing
+    settings.args['attributes'] = attributes
+    settings.args['row_cache_size'] = int(float(rowcache) * 1024 * 1024)
+    settings.args['cursor'] = None if cursor == 'none' else cursor
+
+    if any([ttyrows, ttycols]) and not all([ttyrows, ttycols]):
+        PaperTTY.error("You must define both --rows and --cols to change terminal size.")
+
+    ptty = settings.get_init_tty()
+    if apply_scrub:
+        ptty.driver.scrub()
+
+    if all([ttyrows, ttycols]):
+        ptty.rows, ptty.cols = int(ttyrows), int(ttycols)
+    else:
+        ptty.cols, ptty.rows = ptty.fit(portrait)
+    if not command:
+        command = [os.environ.get('SHELL', '/bin/sh')]
+
+    # the program writes to the emulated screen, which keeps track of the changed cells
+    screen = VirtualTerminal(ptty.rows, ptty.cols, attributes=attributes)
+    pid, master_fd = spawn(list(command), ptty.rows, ptty.cols, term)
+    decoder = codecs.getincrementaldecoder('utf-8')('replace')
+    print("Started {} in a {}x{} terminal, exit with Ctrl-C".format(' '.join(command), ptty.cols, ptty.rows))
+
+    poller = select.poll()
+    poller.register(master_fd, select.POLLIN)
+    # pass the keys typed on our terminal through to the program
+    keyboard = sys.stdin.isatty()
+    keyboard_mode = None
+    if keyboard:
+        keyboard_mode = termios.tcgetattr(sys.stdin.fileno())
+        tty.setraw(sys.stdin.fileno())
+        poller.register(sys.stdin.fileno(), select.POLLIN)
+
+    textargs = {'portrait': portrait, 'flipx': flipx, 'flipy': flipy}
+    flags = {'scrub_requested': False}
+    oldbuff = None
+    oldimage = None
+    oldcursor = None
+
+    def sigint_handler(sig, frame):
+        sys.exit(0)
+
+    def sigusr1_handler(sig, frame):
+        flags['scrub_requested'] = True
+
+    signal.signal(signal.SIGINT, sigint_handler)
+    signal.signal(signal.SIGUSR1, sigusr1_handler)
+
+    scheduler = UpdateScheduler(float(minlatency), float(maxlatency))
+    ptty.track_ghosting(fullevery)
+    pending = False
+    finished = False
+    # signals must interrupt the wait, otherwise a scrub request would only be
+    # noticed after the next output
+    with ptty.signal_wakeup(poller) as wakeup_r:
+        try:
+            while not finished:
+                # wait for a burst of output to settle, or until it's time to clean up the ghosting
+                delay = scheduler.delay() if pending else ptty.clean_delay(scheduler.last_activity)
+                for fd, event in poller.poll(None if delay is None else delay * 1000):
+                    if fd == master_fd:
+                        try:
+                            data = os.read(master_fd, 65536)
+                        except OSError:
+                            # EIO once the program has exited
+                            data = b''
+                        if not data:
+                            finished = True
+                            continue
+                        screen.feed(decoder.decode(data))
+                        replies = screen.pop_replies()
+                        if replies:
+                            os.write(master_fd, replies.encode())
+                        scheduler.changed()
+                        pending = True
+                    elif fd == wakeup_r:
+                        try:
+                            while os.read(wakeup_r, 512):
+                                pass
+                        except BlockingIOError:
+                            pass
                     else:
-                        print('Font size not changed')
-                elif ch == 'c':
-                    flags['scrub_requested'] = True
-                elif ch == 'i':
-                    ptty.clear()
+                        os.write(master_fd, os.read(fd, 1024))
+
+                if flags['scrub_requested']:
+                    ptty.driver.scrub()
                     oldimage = None
                     oldbuff = None
-                elif ch == 'r':
-                    if oldimage:
-                        ptty.driver.reset()
-                        ptty.driver.init(partial=False, vcom=self.vcom, enable_a2=self.enable_a2, enable_1bpp=self.enable_1bpp, mhz=self.mhz)
-                        ptty.driver.draw(0, 0, oldimage)
-                        ptty.driver.reset()
-                        ptty.driver.init(partial=ptty.partial, vcom=self.vcom, enable_a2=self.enable_a2, enable_1bpp=self.enable_1bpp, mhz=self.mhz)
-
-            # if user or SIGUSR1 toggled the scrub flag, scrub display and start with a fresh image
-            if flags['scrub_requested']:
-                ptty.driver.scrub()
-                # clear old image and buffer and restore flag
-                oldimage = None
-                oldbuff = ''
-                flags['scrub_requested'] = False
-            
-            with open(vcsa, 'rb') as f:
-                with open(vcsudev, 'rb') as vcsu:
-                    # read the first 4 bytes to get the console attributes
-                    attributes = f.read(4)
-                    rows, cols, x, y = list(map(ord, struct.unpack('cccc', attributes)))
-
-                    # read from the text buffer 
-                    buff = vcsu.read()
-                    if character_width == 4:
-                        # work around weird bug
-                        buff = buff.replace(b'\x20\x20\x20\x20', b'\x20\x00\x00\x00')
-                    # find character under cursor (in case using a non-fixed width font)
-                    char_under_cursor = buff[character_width * (y * rows + x):character_width * (y * rows + x + 1)]
-                    encoding = 'utf_32' if character_width == 4 else ptty.encoding
-                    cursor = (x, y, char_under_cursor.decode(encoding, 'ignore'))
-                    # add newlines per column count
-                    buff = ''.join([r.decode(encoding, 'replace') + '\n' for r in ptty.split(buff, cols * character_width)])
-                    # do something only if content has changed or cursor was moved
-                    if buff != oldbuff or cursor != oldcursor:
-                        # show new content
-                        oldimage = ptty.showtext(buff, fill=ptty.black, cursor=cursor if not nocursor else None,
-                                                oldimage=oldimage,
-                                                oldtext=oldbuff,
-                                                oldcursor=oldcursor,
-                                                **textargs)
-                        oldbuff = buff
+                    flags['scrub_requested'] = False
+                    pending = True
+
+                # draw right away unless the program is in the middle of a burst of output
+                if pending and (finished or not scheduler.delay()):
+                    buff = screen.snapshot()
+                    cursor = buff.cursor if screen.cursor_visible else None
+                    # the snapshot knows what was written since the previous one, so
+                    # nothing has to be compared to find out if anything changed
+                    if oldbuff is None or buff.changed or cursor != oldcursor:
+                        oldimage = ptty.showtext(buff, fill=ptty.black, cursor=cursor,
+                                                 oldimage=oldimage,
+                                                 oldtext=oldbuff,
+                                                 oldcursor=oldcursor,
+                                                 **textargs)
                         oldcursor = cursor
-                    else:
-                        # delay before next update check
-                        time.sleep(float(sleep))
+                    oldbuff = buff
+                    scheduler.drawn()
+                    pending = False
+                elif not pending and ptty.clean_delay(scheduler.last_activity) == 0:
+                    ptty.clean_ghosting(oldimage)
+        finally:
+            if keyboard_mode:
+                termios.tcsetattr(sys.stdin.fileno(), termios.TCSADRAIN, keyboard_mode)
+            # closing the terminal hangs up the program, unless it has already exited
+            os.close(master_fd)
+            if not finished:
+                os.kill(pid, signal.SIGHUP)
+            _, status = os.waitpid(pid, 0)
+            print("Exiting...")
+            if ptty.row_cache is not None:
+                print("Row cache: {}".format(ptty.row_cache))
+            if not noclear and oldbuff is not None:
+                ptty.showtext(oldbuff, fill=ptty.white, **textargs)
+    sys.exit(os.WEXITSTATUS(status) if os.WIFEXITED(status) else 1)
+
+
+@click.group()
+def bench():
+    """Measure the performance of PaperTTY"""
+    pass
+
+
+@bench.command(name='replay')
+@click.argument('cast', type=click.Path(exists=True, dir_okay=False))
+@click.option('--speed', default=0.0, help='Playback speed relative to the recording, 0 plays as fast as possible', show_default=True)
+@click.option('--font', default=PaperTTY.defaultfont, help='Path to a TrueType or PIL font', show_default=True)
+@click.option('--size', 'fontsize', default=8, help='Font size', show_default=True)
+@click.option('--spacing', default='0', help='Line spacing for the text, "auto" to automatically determine a good value', show_default=True)
+@click.option('--cursor', default='default', help='Set cursor type (default, block, none or a number n)', show_default=True)
+@click.option('--minlatency', default=0.1, help='Draw a burst of output once it has been quiet this long (s), 0 draws every change', show_default=True)
+@click.option('--maxlatency', default=1.0, help='Maximum delay before drawing a burst of output (s)', show_default=True)
+@click.option('--rows', 'ttyrows', default=None, type=int, help='Terminal rows [default: from the recording]')
+@click.option('--cols', 'ttycols', default=None, type=int, help='Terminal columns [default: from the recording]')
+@click.option('--portrait', default=False, is_flag=True, help='Use portrait orientation', show_default=False)
+@click.option('--flipx', default=False, is_flag=True, help='Flip X axis', show_default=False)
+@click.option('--flipy', default=False, is_flag=True, help='Flip Y axis', show_default=False)
+@click.option('--attributes', is_flag=True, default=False, help='Show the text attributes', show_default=True)
+@click.option('--rowcache', default=PaperTTY.default_row_cache_size / 1024 / 1024, help='Memory for caching rendered rows (MiB), 0 to disable', show_default=True)
+@click.option('--width', 'panel_width', default=None, type=int, help='Panel width for the Dummy and Bitmap drivers')
+@click.option('--height', 'panel_height', default=None, type=int, help='Panel height for the Dummy and Bitmap drivers')
+@click.option('--partial', 'emulate_partial', is_flag=True, default=False, help='Treat the panel as one that supports partial updates', show_default=True)
+@click.option('--multidraw', 'emulate_multi', is_flag=True, default=False, help='Treat the panel as one that can draw several areas at once', show_default=True)
+@click.option('--json', 'as_json', is_flag=True, default=False, help='Print the results as JSON', show_default=True)
+@click.pass_obj
+def bench_replay(settings, cast, speed, font, fontsize, spacing, cursor, minlatency, maxlatency, ttyrows, ttycols,
+                 portrait, flipx, flipy, attributes, rowcache, panel_width, panel_height, emulate_partial, emulate_multi, as_json):
+    """Play an asciinema v2 recording through the text pipeline and report how it performed"""
+    settings.args['font'] = font
+    settings.args['fontsize'] = fontsize
+    settings.args['spacing'] = spacing
+    settings.args['attributes'] = attributes
+    settings.args['row_cache_size'] = int(float(rowcache) * 1024 * 1024)
+    settings.args['cursor'] = None if cursor == 'none' else cursor
+
+    try:
+        header, events = read_cast(cast)
+    except (ValueError, KeyError) as e:
+        PaperTTY.error("Can't read {}: {}".format(cast, e))
+
+    ptty = PaperTTY(**settings.args)
+    if panel_width:
+        ptty.driver.width = panel_width
+    if panel_height:
+        ptty.driver.height = panel_height
+    ptty.init_display()
+    if emulate_partial:
+        ptty.driver.supports_partial = True
+    if emulate_multi and not ptty.driver.supports_multi_draw:
+        emulate_multi_draw(ptty.driver)
+    ptty.rows = ttyrows or header['height']
+    ptty.cols = ttycols or header['width']
+
+    screen = VirtualTerminal(ptty.rows, ptty.cols, attributes=attributes)
+    scheduler = UpdateScheduler(float(minlatency), float(maxlatency))
+    start = time.perf_counter()
+    timings, meter, frames = replay_cast(ptty, screen, events, scheduler, speed=float(speed),
+                                         portrait=portrait, flipx=flipx, flipy=flipy)
+    elapsed = time.perf_counter() - start
+
+    outputs = sum(1 for event in events if event[1] == 'o')
+    results = OrderedDict([
+        ('cast', cast),
+        ('events', outputs),
+        ('recorded', events[-1][0] if events else 0),
+        ('elapsed', elapsed),
+        ('frames', frames),
+        ('draws', meter.draws),
+        ('pixels', meter.pixels),
+        ('bytes', meter.bytes),
+        ('stages', OrderedDict((stage, timings.stats(stage)) for stage in ('parse', 'snapshot', 'render', 'plan', 'draw', 'frame'))),
+        ('peak_rss', peak_rss()),
+    ])
+    if ptty.row_cache is not None:
+        results['row_cache_hit_rate'] = ptty.row_cache.hit_rate
+
+    if as_json:
+        print(json.dumps(results, indent=2))
+        return
+    print("Replayed {}: {} output events, {:.1f} s recorded, {:.2f} s elapsed".format(
+        cast, outputs, results['recorded'], elapsed))
+    print("Frames: {} drawn".format(frames))
+    print("Transfers: {} draws, {} pixels, {} bytes".format(meter.draws, meter.pixels, meter.bytes))
+    print("{:<10}{:>8}{:>12}{:>10}{:>10}{:>10}{:>10}".format('Stage', 'calls', 'total ms', 'p50 ms', 'p90 ms', 'p99 ms', 'max ms'))
+    for stage, stats in results['stages'].items():
+        print("{:<10}{calls:>8}{total:>12.1f}{p50:>10.3f}{p90:>10.3f}{p99:>10.3f}{max:>10.3f}".format(stage, **stats))
+    print("Peak RSS: {:.1f} MiB".format(results['peak_rss'] / 1024))
+    if ptty.row_cache is not None:
+        print("Row cache: {}".format(ptty.row_cache))
 
 
 # add all the CLI commands
 cli.add_command(scrub)
+cli.add_command(calibrate)
 cli.add_command(terminal)
+cli.add_command(pty_terminal)
 cli.add_command(stdin)
 cli.add_command(image)
 cli.add_command(vnc)
 cli.add_command(fb)
 cli.add_command(list_drivers)
+cli.add_command(bench)
 
 
 if __name__ == '__main__':
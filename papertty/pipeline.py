@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright and related rights waived via CC0
+# https://creativecommons.org/publicdomain/zero/1.0/legalcode
+
+# Taking frames from where they come from to the panel in stages
+
+# for timing the stages
+import time
+
+# for inverting frames
+from PIL import ImageOps
+
+
+def rotation(angle):
+    """A transform that rotates frames counter clockwise by angle degrees"""
+    return lambda image: image.rotate(angle, expand=True)
+
+
+def inversion(image):
+    """A transform that inverts the colors of frames"""
+    return ImageOps.invert(image)
+
+
+def scaling(size):
+    """A transform that scales frames to a size, ie. the size of the panel"""
+    return lambda image: image if image.size == size else image.resize(size)
+
+
+class FramePipeline:
+    """Takes frames through the stages of drawing them on the panel. The stages are
+       callables, any of them except the sink can be left out:
+
+       - source() captures a frame (an image), or returns None if there's none
+       - transforms each turn an image into another (ie. rotate, invert, scale)
+       - damage(image, previous) returns the native boxes that differ from the
+         previous frame
+       - planner(boxes, image, **options) returns the boxes to draw
+       - sink(image, boxes, **options) draws the boxes of the frame, or the whole
+         frame if boxes is None
+       - idle(image) is called when a frame didn't change (ie. to clean up ghosting)
+
+       hook(stage, seconds) is called with the time each stage took, where the
+       stage is one of STAGES."""
+
+    STAGES = ('capture', 'transform', 'damage', 'plan', 'send')
+
+    def __init__(self, sink, source=None, transforms=(), damage=None, planner=None, idle=None, hook=None):
+        self.sink = sink
+        self.source = source
+        self.transforms = list(transforms)
+        self.damage = damage
+        self.planner = planner
+        self.idle = idle
+        self.hook = hook
+        # the latest frame, as it was drawn
+        self.previous = None
+
+    def timed(self, stage, function, *args, **kwargs):
+        if self.hook is None:
+            return function(*args, **kwargs)
+        start = time.perf_counter()
+        result = function(*args, **kwargs)
+        self.hook(stage, time.perf_counter() - start)
+        return result
+
+    def process(self, image, boxes=None, **options):
+        """Take a captured frame through the rest of the stages. If the caller knows
+           which native boxes changed (ie. from comparing text), they're drawn instead
+           of asking the damage stage. The options are passed to the planner and the
+           sink. Returns the boxes drawn: None if it was the whole frame, an empty
+           list if nothing changed."""
+        for transform in self.transforms:
+            image = self.timed('transform', transform, image)
+        previous, self.previous = self.previous, image
+        if boxes is None:
+            if previous is None or self.damage is None:
+                self.timed('send', self.sink, image, None, **options)
+                return None
+            boxes = self.timed('damage', self.damage, image, previous)
+        if not boxes:
+            if self.idle:
+                self.idle(image)
+            return []
+        if self.planner:
+            boxes = self.timed('plan', self.planner, boxes, image, **options)
+        self.timed('send', self.sink, image, boxes, **options)
+        return boxes
+
+    def reset(self):
+        """Forget the latest frame, so that the next one is drawn whole (ie. after the
+           panel was cleared)"""
+        self.previous = None
+
+    def step(self):
+        """Capture a frame and draw it, return what process returned or an empty
+           list if there was no frame"""
+        image = self.timed('capture', self.source)
+        if image is None:
+            return []
+        return self.process(image)
+
+    def run(self, interval):
+        """Capture and draw frames forever, interval seconds apart"""
+        while True:
+            self.step()
+            time.sleep(interval)
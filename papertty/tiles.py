@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright and related rights waived via CC0
+# https://creativecommons.org/publicdomain/zero/1.0/legalcode
+
+# Sharing one panel between several consoles, each in its own tile
+
+# for the grid of tiles
+import math
+
+# for the frame of the whole panel
+from PIL import Image
+# for laying the tiles out the way the text is read
+from papertty.orientation import Orientation
+
+
+def tile_boxes(count, panel_width, panel_height, portrait=False, flipx=False, flipy=False, xdiv=8, ydiv=1):
+    """Split the panel into a grid of `count` tiles, filled row by row as the text is
+       read. Returns the native boxes of the tiles, with their edges aligned to
+       xdiv/ydiv so that the areas the tiles draw stay aligned on the panel."""
+    orientation = Orientation.for_panel(panel_width, panel_height, portrait, flipx, flipy)
+    cols = int(math.ceil(math.sqrt(count)))
+    rows = int(math.ceil(count / cols))
+
+    def snap(value, div, end):
+        return end if value >= end else value // div * div
+
+    boxes = []
+    for i in range(count):
+        row, col = divmod(i, cols)
+        box = orientation.rect((orientation.width * col // cols, orientation.height * row // rows,
+                                orientation.width * (col + 1) // cols, orientation.height * (row + 1) // rows))
+        boxes.append((snap(box[0], xdiv, panel_width), snap(box[1], ydiv, panel_height),
+                      snap(box[2], xdiv, panel_width), snap(box[3], ydiv, panel_height)))
+    return boxes
+
+
+class Compositor:
+    """Collects what the tiles draw during a refresh cycle and sends it to the panel
+       at once: as one draw_multi batch if the driver can take several areas, or
+       otherwise as the area that covers all of them, cut from a frame of the whole
+       panel."""
+
+    def __init__(self, driver):
+        self.driver = driver
+        self.frame = None
+        self.batch = []
+        # the native boxes sent to the panel by the latest flush
+        self.drawn = []
+
+    def add(self, x, y, image):
+        """Add an area in native panel coordinates"""
+        if self.frame is None:
+            self.frame = Image.new(image.mode, (self.driver.width, self.driver.height), self.driver.white)
+        self.frame.paste(image, (x, y))
+        self.batch.append({"x": x, "y": y, "image": image})
+
+    def flush(self):
+        """Draw the collected areas, return how many there were"""
+        batch, self.batch = self.batch, []
+        self.drawn = [(item["x"], item["y"], item["x"] + item["image"].width, item["y"] + item["image"].height)
+                      for item in batch]
+        if not batch:
+            return 0
+        if self.driver.supports_multi_draw:
+            self.driver.draw_multi(batch)
+        elif len(batch) == 1:
+            self.driver.draw(batch[0]["x"], batch[0]["y"], batch[0]["image"])
+        else:
+            x0 = min(box[0] for box in self.drawn)
+            y0 = min(box[1] for box in self.drawn)
+            x1 = max(box[2] for box in self.drawn)
+            y1 = max(box[3] for box in self.drawn)
+            self.drawn = [(x0, y0, x1, y1)]
+            self.driver.draw(x0, y0, self.frame.crop(self.drawn[0]))
+        return len(batch)
+
+
+class TileDriver:
+    """Stands in for the panel driver of a tile: looks like a panel of the size of
+       the tile and hands what is drawn on it to the compositor, moved to the tile
+       and clipped to it. Everything else is the real driver's."""
+
+    def __init__(self, compositor, box):
+        self.compositor = compositor
+        self.box = box
+        self.width = box[2] - box[0]
+        self.height = box[3] - box[1]
+
+    def __getattr__(self, name):
+        return getattr(self.compositor.driver, name)
+
+    def init(self, **kwargs):
+        # the panel is initialized once for all the tiles
+        pass
+
+    def draw(self, x, y, image):
+        # rows that don't fit the tile are cut off
+        x0, y0 = max(x, 0), max(y, 0)
+        x1, y1 = min(x + image.width, self.width), min(y + image.height, self.height)
+        if x0 < x1 and y0 < y1:
+            if (x0, y0, x1, y1) != (x, y, x + image.width, y + image.height):
+                image = image.crop((x0 - x, y0 - y, x1 - x, y1 - y))
+            self.compositor.add(self.box[0] + x0, self.box[1] + y0, image)
+
+    def draw_fast(self, x, y, image):
+        # the tiles are drawn together, so there's nothing faster
+        self.draw(x, y, image)
+
+    def draw_multi(self, images):
+        for item in images:
+            self.draw(item["x"], item["y"], item["image"])
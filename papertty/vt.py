@@ -0,0 +1,718 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright and related rights waived via CC0
+# https://creativecommons.org/publicdomain/zero/1.0/legalcode
+
+# A VT100/xterm subset terminal emulator for running programs in a pseudo-terminal
+
+# for setting the size of the pseudo-terminal
+import fcntl
+# for starting the command
+import os
+# for forking with a pseudo-terminal
+import pty
+# for parsing the output
+import re
+# for packing the terminal size
+import struct
+# for the TIOCSWINSZ ioctl
+import termios
+
+# for handing the screen to the partial update pipeline like a virtual console
+from papertty.console import UTF32, ConsoleSnapshot
+# the attribute for plain text
+from papertty.glyphs import DEFAULT_ATTRIBUTE
+
+# The parts of the output: control sequences, OSC strings (ie. window titles), other
+# strings, other escape sequences, control characters and text
+TOKENS = re.compile(r'''
+    \x1b\[ (?P<private>[<=>?]?) (?P<params>[0-9;:]*) (?P<intermediate>[\ -/]*) (?P<final>[@-~])
+  | \x1b\] [^\x07\x1b]* (?:\x07|\x1b\\)
+  | \x1b[P^_X] [^\x1b]* \x1b\\
+  | \x1b (?P<escintermediate>[\ -/]*) (?P<escfinal>[0-OQ-WYZ\\`a-~])
+  | (?P<control>[\x00-\x1a\x1c-\x1f\x7f-\x9f])
+  | (?P<text>[^\x00-\x1f\x7f-\x9f]+)
+''', re.VERBOSE)
+
+# An escape sequence cut off by the end of a read
+INCOMPLETE = re.compile(r'\x1b(?:\[[<=>?]?[0-9;:]*[ -/]*|\][^\x07\x1b]*\x1b?|[P^_X][^\x1b]*\x1b?|[ -/]*)\Z')
+
+# Don't keep an unterminated string around forever
+MAX_PENDING = 4096
+
+# ANSI color numbers (red = 1, green = 2, blue = 4) to VGA ones (blue = 1, green = 2, red = 4)
+ANSI_TO_VGA = (0, 4, 2, 6, 1, 5, 3, 7)
+
+# The DEC special graphics character set, used for line drawing
+DEC_GRAPHICS = str.maketrans({
+    '`': '◆', 'a': '▒', 'f': '°', 'g': '±', 'j': '┘', 'k': '┐',
+    'l': '┌', 'm': '└', 'n': '┼', 'o': '⎺', 'p': '⎻', 'q': '─',
+    'r': '⎼', 's': '⎽', 't': '├', 'u': '┤', 'v': '┴', 'w': '┬',
+    'x': '│', 'y': '≤', 'z': '≥', '{': 'π', '|': '≠', '}': '£',
+    '~': '·',
+})
+
+# The replies to device attribute queries: a VT100 with advanced video
+PRIMARY_ATTRIBUTES = '\x1b[?1;2c'
+SECONDARY_ATTRIBUTES = '\x1b[>0;0;0c'
+
+
+def rgb_color(red, green, blue):
+    """Return the closest of the 16 ANSI colors (0-15) to an RGB color"""
+    color = (red > 127) | (green > 127) << 1 | (blue > 127) << 2
+    if max(red, green, blue) > 191:
+        color |= 8
+    return color
+
+
+def indexed_color(index):
+    """Return the closest of the 16 ANSI colors to a color of the 256 color palette"""
+    if index < 16:
+        return index
+    if index >= 232:
+        level = 8 + (index - 232) * 10
+        return rgb_color(level, level, level)
+    index -= 16
+    levels = (0, 95, 135, 175, 215, 255)
+    return rgb_color(levels[index // 36], levels[index // 6 % 6], levels[index % 6])
+
+
+class ScreenSnapshot(ConsoleSnapshot):
+    """A snapshot of the emulated screen. Unlike a virtual console, the emulator knows
+       which cells were written and how far the screen scrolled since the previous
+       snapshot (the base), so comparing with the base needs no diffing at all."""
+
+    def __init__(self, rows, cols, x, y, buffer, vcsa, base, damage, scroll):
+        super().__init__(rows, cols, x, y, buffer, 4, UTF32, vcsa)
+        self.base = base
+        # the first and last written cell of each row, or None
+        self.damage = damage
+        self.scroll = scroll
+
+    @property
+    def changed(self):
+        """Check if anything was written since the base snapshot"""
+        return self.scroll != 0 or any(span is not None for span in self.damage)
+
+    def tracks(self, other, row, other_row):
+        """Check if the damage tells how a row differs from other_row of another snapshot"""
+        if other is None or other is not self.base:
+            return False
+        if other_row is None:
+            return self.scroll == 0
+        return other_row == row + self.scroll
+
+    def scroll_from(self, other):
+        if other is not None and other is self.base:
+            return self.scroll
+        return None
+
+    def row_changed(self, other, row, other_row=None):
+        if self.tracks(other, row, other_row):
+            return self.damage[row] is not None
+        return super().row_changed(other, row, other_row)
+
+    def changed_span(self, other, row, other_row=None):
+        if self.tracks(other, row, other_row):
+            return self.damage[row]
+        return super().changed_span(other, row, other_row)
+
+
+class VirtualTerminal:
+    """Emulates a subset of VT100 and xterm: cursor movement, erasing, inserting and
+       deleting, scrolling regions, SGR attributes (as VGA attribute bytes, like in
+       /dev/vcsa), the alternate screen and line drawing characters.
+
+       Every write records the changed cells per row and full screen scrolls are
+       counted, so each snapshot carries its exact damage compared to the previous one.
+       Double width and combining characters take a single cell."""
+
+    def __init__(self, rows, cols, attributes=False):
+        self.attributes = attributes
+        self.rows = 0
+        self.cols = 0
+        self.pending = ''
+        self.replies = []
+        self.last = None
+        self.reset(rows, cols)
+
+    def reset(self, rows=None, cols=None):
+        """Reset the terminal to its initial state (and size)"""
+        self.rows = rows or self.rows
+        self.cols = cols or self.cols
+        self.x = 0
+        self.y = 0
+        self.wrap_next = False
+        self.top = 0
+        self.bottom = self.rows - 1
+        self.autowrap = True
+        self.insert = False
+        self.origin = False
+        self.cursor_visible = True
+        self.charsets = ['ascii', 'ascii']
+        self.shift = 0
+        self.tabs = set(range(0, self.cols, 8))
+        self.last_char = ' '
+        self.reset_attributes()
+        self.saved = None
+        self.saved_screen = None
+        self.chars = [self.blank_chars() for _ in range(self.rows)]
+        self.attrs = [self.blank_attrs(DEFAULT_ATTRIBUTE) for _ in range(self.rows)]
+        self.damage_all()
+
+    def reset_attributes(self):
+        self.fg = 7
+        self.bg = 0
+        self.bold = False
+        self.dim = False
+        self.reverse = False
+        self.update_attribute()
+
+    def update_attribute(self):
+        """Pack the current colors and modes into the VGA attribute byte of new text"""
+        fg = self.fg | (8 if self.bold else 0)
+        if self.dim and fg == 7:
+            # the console shows dim text in dark grey
+            fg = 8
+        fg, bg = (self.bg, fg) if self.reverse else (fg, self.bg)
+        self.attr = (bg & 7) << 4 | fg & 15 | (0x80 if bg & 8 else 0)
+        # erasing fills with the background color
+        self.erase_attr = (self.bg & 7) << 4 | 7 | (0x80 if self.bg & 8 else 0)
+
+    def blank_chars(self):
+        return [' '] * self.cols
+
+    def blank_attrs(self, attr=None):
+        return bytearray([self.erase_attr if attr is None else attr]) * self.cols
+
+    def damage_all(self):
+        """Mark the whole screen changed"""
+        self.damage = [(0, self.cols - 1)] * self.rows
+        self.scrolled = 0
+        self.encoded = [None] * self.rows
+        self.encoded_attrs = [None] * self.rows
+
+    def touch(self, row, first, last):
+        """Mark cells first...last of a row changed"""
+        span = self.damage[row]
+        if span is not None:
+            first = min(first, span[0])
+            last = max(last, span[1])
+        self.damage[row] = (first, last)
+        self.encoded[row] = None
+        self.encoded_attrs[row] = None
+
+    def resize(self, rows, cols):
+        """Change the size of the screen, keeping the text that still fits"""
+        if (rows, cols) == (self.rows, self.cols):
+            return
+        chars = [(row + [' '] * cols)[:cols] for row in self.chars[:rows]]
+        attrs = [(row + bytearray([DEFAULT_ATTRIBUTE]) * cols)[:cols] for row in self.attrs[:rows]]
+        self.rows, self.cols = rows, cols
+        self.chars = chars + [self.blank_chars() for _ in range(rows - len(chars))]
+        self.attrs = attrs + [self.blank_attrs(DEFAULT_ATTRIBUTE) for _ in range(rows - len(attrs))]
+        self.saved_screen = None
+        self.top, self.bottom = 0, rows - 1
+        self.tabs = set(range(0, cols, 8))
+        self.goto(self.x, self.y)
+        self.damage_all()
+
+    def feed(self, data):
+        """Process output from the program"""
+        data = self.pending + data
+        self.pending = ''
+        pos = 0
+        end = len(data)
+        while pos < end:
+            match = TOKENS.match(data, pos)
+            if match is None:
+                # an escape sequence that hasn't been read completely, or a broken one
+                if INCOMPLETE.match(data, pos) and end - pos < MAX_PENDING:
+                    self.pending = data[pos:]
+                    break
+                pos += 1
+                continue
+            pos = match.end()
+            text = match.group('text')
+            if text is not None:
+                self.write(text)
+            elif match.group('final') is not None:
+                self.control_sequence(match.group('private'), match.group('params'),
+                                      match.group('intermediate'), match.group('final'))
+            elif match.group('control') is not None:
+                self.control(match.group('control'))
+            elif match.group('escfinal') is not None:
+                self.escape(match.group('escintermediate'), match.group('escfinal'))
+
+    def pop_replies(self):
+        """Return (and forget) the replies to queries, to be written back to the program"""
+        replies = ''.join(self.replies)
+        self.replies = []
+        return replies
+
+    def snapshot(self):
+        """Take a snapshot of the screen with the damage since the previous snapshot"""
+        for row in range(self.rows):
+            if self.encoded[row] is None:
+                self.encoded[row] = ''.join(self.chars[row]).encode(UTF32)
+        buffer = b''.join(self.encoded)
+        vcsa = None
+        if self.attributes:
+            # lay the attributes out like vcsa: a header and (character, attribute) pairs
+            for row in range(self.rows):
+                if self.encoded_attrs[row] is None:
+                    pairs = bytearray(2 * self.cols)
+                    pairs[1::2] = self.attrs[row]
+                    self.encoded_attrs[row] = bytes(pairs)
+            header = bytes(min(value, 255) for value in (self.rows, self.cols, self.x, self.y))
+            vcsa = header + b''.join(self.encoded_attrs)
+        snapshot = ScreenSnapshot(self.rows, self.cols, self.x, self.y, buffer, vcsa,
+                                  self.last, self.damage, self.scrolled)
+        self.last = snapshot
+        self.damage = [None] * self.rows
+        self.scrolled = 0
+        return snapshot
+
+    # text
+
+    def write(self, text):
+        """Write text at the cursor, wrapping at the right margin"""
+        if self.charsets[self.shift] == 'graphics':
+            text = text.translate(DEC_GRAPHICS)
+        cols = self.cols
+        while text:
+            if self.wrap_next:
+                self.wrap_next = False
+                self.x = 0
+                self.index()
+            x = self.x
+            chunk = text[:cols - x]
+            text = text[len(chunk):]
+            if text and not self.autowrap:
+                # without wrapping, the rest of the text overwrites the last column
+                chunk = chunk[:-1] + text[-1]
+                text = ''
+            count = len(chunk)
+            chars = self.chars[self.y]
+            attrs = self.attrs[self.y]
+            if self.insert:
+                chars[x:x] = chunk
+                del chars[cols:]
+                attrs[x:x] = bytes([self.attr]) * count
+                del attrs[cols:]
+                self.touch(self.y, x, cols - 1)
+            else:
+                chars[x:x + count] = chunk
+                attrs[x:x + count] = bytes([self.attr]) * count
+                self.touch(self.y, x, x + count - 1)
+            self.last_char = chunk[-1]
+            if x + count >= cols:
+                self.x = cols - 1
+                self.wrap_next = self.autowrap
+            else:
+                self.x = x + count
+
+    def erase(self, row, first, last):
+        """Blank cells first...last of a row"""
+        if first > last:
+            return
+        count = last - first + 1
+        self.chars[row][first:last + 1] = [' '] * count
+        self.attrs[row][first:last + 1] = bytes([self.erase_attr]) * count
+        self.touch(row, first, last)
+
+    # cursor movement
+
+    def goto(self, x, y):
+        """Move the cursor, keeping it on the screen"""
+        self.x = min(max(x, 0), self.cols - 1)
+        self.y = min(max(y, 0), self.rows - 1)
+        self.wrap_next = False
+
+    def move_vertically(self, count):
+        """Move the cursor up (negative) or down, stopping at the margins if it's inside them"""
+        y = self.y + count
+        if self.top <= self.y <= self.bottom:
+            y = min(max(y, self.top), self.bottom)
+        self.goto(self.x, y)
+
+    def tab(self, count=1):
+        """Move to the next (or previous with a negative count) tab stop"""
+        x = self.x
+        for _ in range(abs(count)):
+            stops = [stop for stop in self.tabs if (stop > x if count > 0 else stop < x)]
+            if not stops:
+                x = self.cols - 1 if count > 0 else 0
+                break
+            x = min(stops) if count > 0 else max(stops)
+        self.goto(x, self.y)
+
+    def save_cursor(self):
+        self.saved = (self.x, self.y, self.wrap_next, self.fg, self.bg, self.bold, self.dim, self.reverse,
+                      list(self.charsets), self.shift, self.origin)
+
+    def restore_cursor(self):
+        if self.saved is None:
+            self.reset_attributes()
+            self.goto(0, 0)
+            return
+        x, y, wrap_next, self.fg, self.bg, self.bold, self.dim, self.reverse, charsets, self.shift, self.origin = self.saved
+        self.charsets = list(charsets)
+        self.update_attribute()
+        self.goto(x, y)
+        self.wrap_next = wrap_next
+
+    # scrolling
+
+    def scroll_up(self, count, top=None, bottom=None):
+        """Scroll the lines top...bottom (the scrolling region by default) up"""
+        top = self.top if top is None else top
+        bottom = self.bottom if bottom is None else bottom
+        count = min(count, bottom - top + 1)
+        if count <= 0:
+            return
+        for rows in (self.chars, self.attrs, self.encoded, self.encoded_attrs, self.damage):
+            del rows[top:top + count]
+        self.insert_blank_rows(bottom - count + 1, count)
+        self.scrolled_rows(top, bottom, count)
+
+    def scroll_down(self, count, top=None, bottom=None):
+        """Scroll the lines top...bottom (the scrolling region by default) down"""
+        top = self.top if top is None else top
+        bottom = self.bottom if bottom is None else bottom
+        count = min(count, bottom - top + 1)
+        if count <= 0:
+            return
+        for rows in (self.chars, self.attrs, self.encoded, self.encoded_attrs, self.damage):
+            del rows[bottom - count + 1:bottom + 1]
+        self.insert_blank_rows(top, count)
+        self.scrolled_rows(top, bottom, -count)
+
+    def insert_blank_rows(self, row, count):
+        full = (0, self.cols - 1)
+        self.chars[row:row] = [self.blank_chars() for _ in range(count)]
+        self.attrs[row:row] = [self.blank_attrs() for _ in range(count)]
+        self.encoded[row:row] = [None] * count
+        self.encoded_attrs[row:row] = [None] * count
+        self.damage[row:row] = [full] * count
+
+    def scrolled_rows(self, top, bottom, count):
+        """Keep track of the damage after lines top...bottom moved up by count"""
+        if (top, bottom) == (0, self.rows - 1):
+            # the unchanged rows are still unchanged, they just moved
+            self.scrolled += count
+            if abs(self.scrolled) >= self.rows:
+                self.damage_all()
+        else:
+            for row in range(top, bottom + 1):
+                self.touch(row, 0, self.cols - 1)
+
+    def index(self):
+        """Move the cursor down, scrolling at the bottom margin"""
+        if self.y == self.bottom:
+            self.scroll_up(1)
+        elif self.y < self.rows - 1:
+            self.y += 1
+
+    def reverse_index(self):
+        """Move the cursor up, scrolling at the top margin"""
+        if self.y == self.top:
+            self.scroll_down(1)
+        elif self.y > 0:
+            self.y -= 1
+
+    # the alternate screen
+
+    def alternate_screen(self, enable, clear=True):
+        if enable == (self.saved_screen is not None):
+            return
+        if enable:
+            self.saved_screen = (self.chars, self.attrs)
+            self.chars = [self.blank_chars() for _ in range(self.rows)]
+            self.attrs = [self.blank_attrs(DEFAULT_ATTRIBUTE) for _ in range(self.rows)]
+        else:
+            self.chars, self.attrs = self.saved_screen
+            self.saved_screen = None
+        self.damage_all()
+
+    # control characters and sequences
+
+    def control(self, char):
+        if char == '\b':
+            self.goto(self.x - 1, self.y)
+        elif char == '\t':
+            self.tab()
+        elif char in '\n\v\f':
+            self.wrap_next = False
+            self.index()
+        elif char == '\r':
+            self.goto(0, self.y)
+        elif char == '\x0e':
+            self.shift = 1
+        elif char == '\x0f':
+            self.shift = 0
+
+    def escape(self, intermediate, final):
+        if intermediate in ('(', ')'):
+            self.charsets[intermediate == ')'] = 'graphics' if final == '0' else 'ascii'
+        elif intermediate == '#':
+            if final == '8':
+                # fill the screen with E's for aligning the screen
+                for row in range(self.rows):
+                    self.chars[row] = ['E'] * self.cols
+                    self.touch(row, 0, self.cols - 1)
+        elif intermediate:
+            return
+        elif final == '7':
+            self.save_cursor()
+        elif final == '8':
+            self.restore_cursor()
+        elif final == 'D':
+            self.wrap_next = False
+            self.index()
+        elif final == 'E':
+            self.goto(0, self.y)
+            self.index()
+        elif final == 'M':
+            self.wrap_next = False
+            self.reverse_index()
+        elif final == 'H':
+            self.tabs.add(self.x)
+        elif final == 'c':
+            self.reset()
+
+    def control_sequence(self, private, params, intermediate, final):
+        # subparameters (ie. 38:5:n) are handled like parameters
+        values = [int(value) if value else 0 for value in params.replace(':', ';').split(';')]
+        count = max(values[0], 1)
+        if intermediate:
+            if intermediate == '!' and final == 'p':
+                # soft reset
+                self.insert = self.origin = False
+                self.autowrap = self.cursor_visible = True
+                self.top, self.bottom = 0, self.rows - 1
+                self.charsets, self.shift = ['ascii', 'ascii'], 0
+                self.reset_attributes()
+            return
+        if private == '?':
+            if final in 'hl':
+                self.set_private_modes(values, final == 'h')
+            return
+        if private == '>':
+            if final == 'c':
+                self.replies.append(SECONDARY_ATTRIBUTES)
+            return
+        if private:
+            return
+        if final == 'm':
+            self.select_graphic_rendition(values)
+        elif final in 'Hf':
+            row = max(values[0], 1) - 1
+            col = max(values[1], 1) - 1 if len(values) > 1 else 0
+            if self.origin:
+                row = min(row + self.top, self.bottom)
+            self.goto(col, row)
+        elif final == 'A':
+            self.move_vertically(-count)
+        elif final in 'Be':
+            self.move_vertically(count)
+        elif final in 'Ca':
+            self.goto(self.x + count, self.y)
+        elif final == 'D':
+            self.goto(self.x - count, self.y)
+        elif final == 'E':
+            self.move_vertically(count)
+            self.goto(0, self.y)
+        elif final == 'F':
+            self.move_vertically(-count)
+            self.goto(0, self.y)
+        elif final in 'G`':
+            self.goto(count - 1, self.y)
+        elif final == 'd':
+            row = count - 1
+            if self.origin:
+                row = min(row + self.top, self.bottom)
+            self.goto(self.x, row)
+        elif final == 'J':
+            self.erase_display(values[0])
+        elif final == 'K':
+            self.erase_line(values[0])
+        elif final == 'X':
+            self.erase(self.y, self.x, min(self.x + count, self.cols) - 1)
+            self.wrap_next = False
+        elif final == '@':
+            self.insert_chars(count)
+        elif final == 'P':
+            self.delete_chars(count)
+        elif final == 'L':
+            if self.top <= self.y <= self.bottom:
+                self.scroll_down(count, self.y, self.bottom)
+                self.goto(0, self.y)
+        elif final == 'M':
+            if self.top <= self.y <= self.bottom:
+                self.scroll_up(count, self.y, self.bottom)
+                self.goto(0, self.y)
+        elif final == 'S':
+            self.scroll_up(count)
+        elif final == 'T':
+            self.scroll_down(count)
+        elif final == 'I':
+            self.tab(count)
+        elif final == 'Z':
+            self.tab(-count)
+        elif final == 'b':
+            # repeat the previous character
+            self.write(self.last_char * count)
+        elif final == 'g':
+            if values[0] == 0:
+                self.tabs.discard(self.x)
+            elif values[0] == 3:
+                self.tabs.clear()
+        elif final == 'r':
+            top = max(values[0], 1) - 1
+            bottom = (values[1] if len(values) > 1 and values[1] else self.rows) - 1
+            if top < bottom < self.rows:
+                self.top, self.bottom = top, bottom
+                self.goto(0, top if self.origin else 0)
+        elif final == 's':
+            self.save_cursor()
+        elif final == 'u':
+            self.restore_cursor()
+        elif final in 'hl':
+            for mode in values:
+                if mode == 4:
+                    self.insert = final == 'h'
+        elif final == 'c':
+            if values[0] == 0:
+                self.replies.append(PRIMARY_ATTRIBUTES)
+        elif final == 'n':
+            if values[0] == 5:
+                self.replies.append('\x1b[0n')
+            elif values[0] == 6:
+                row = self.y - self.top if self.origin else self.y
+                self.replies.append('\x1b[{};{}R'.format(row + 1, self.x + 1))
+
+    def set_private_modes(self, modes, enable):
+        for mode in modes:
+            if mode == 6:
+                self.origin = enable
+                self.goto(0, self.top if enable else 0)
+            elif mode == 7:
+                self.autowrap = enable
+            elif mode == 25:
+                self.cursor_visible = enable
+            elif mode in (47, 1047):
+                self.alternate_screen(enable)
+            elif mode == 1049:
+                # save the cursor and switch to a cleared alternate screen
+                if enable:
+                    self.save_cursor()
+                    self.alternate_screen(True)
+                else:
+                    self.alternate_screen(False)
+                    self.restore_cursor()
+
+    def erase_display(self, mode):
+        if mode == 0:
+            self.erase(self.y, self.x, self.cols - 1)
+            rows = range(self.y + 1, self.rows)
+        elif mode == 1:
+            self.erase(self.y, 0, self.x)
+            rows = range(self.y)
+        elif mode == 2:
+            rows = range(self.rows)
+        else:
+            return
+        for row in rows:
+            self.erase(row, 0, self.cols - 1)
+
+    def erase_line(self, mode):
+        if mode == 0:
+            self.erase(self.y, self.x, self.cols - 1)
+        elif mode == 1:
+            self.erase(self.y, 0, self.x)
+        elif mode == 2:
+            self.erase(self.y, 0, self.cols - 1)
+
+    def insert_chars(self, count):
+        count = min(count, self.cols - self.x)
+        chars = self.chars[self.y]
+        attrs = self.attrs[self.y]
+        chars[self.x:self.x] = [' '] * count
+        del chars[self.cols:]
+        attrs[self.x:self.x] = bytes([self.erase_attr]) * count
+        del attrs[self.cols:]
+        self.touch(self.y, self.x, self.cols - 1)
+        self.wrap_next = False
+
+    def delete_chars(self, count):
+        count = min(count, self.cols - self.x)
+        chars = self.chars[self.y]
+        attrs = self.attrs[self.y]
+        del chars[self.x:self.x + count]
+        chars.extend([' '] * count)
+        del attrs[self.x:self.x + count]
+        attrs.extend(bytes([self.erase_attr]) * count)
+        self.touch(self.y, self.x, self.cols - 1)
+        self.wrap_next = False
+
+    def select_graphic_rendition(self, values):
+        values = iter(values)
+        for value in values:
+            if value == 0:
+                self.fg, self.bg = 7, 0
+                self.bold = self.dim = self.reverse = False
+            elif value == 1:
+                self.bold = True
+            elif value == 2:
+                self.dim = True
+            elif value == 7:
+                self.reverse = True
+            elif value == 22:
+                self.bold = self.dim = False
+            elif value == 27:
+                self.reverse = False
+            elif 30 <= value <= 37:
+                self.fg = ANSI_TO_VGA[value - 30]
+            elif value == 39:
+                self.fg = 7
+            elif 40 <= value <= 47:
+                self.bg = ANSI_TO_VGA[value - 40]
+            elif value == 49:
+                self.bg = 0
+            elif 90 <= value <= 97:
+                self.fg = ANSI_TO_VGA[value - 90] | 8
+            elif 100 <= value <= 107:
+                self.bg = ANSI_TO_VGA[value - 100] | 8
+            elif value in (38, 48):
+                # 256 color and RGB colors are approximated with the 16 colors
+                kind = next(values, None)
+                if kind == 5:
+                    color = indexed_color(next(values, 0) & 255)
+                elif kind == 2:
+                    color = rgb_color(next(values, 0), next(values, 0), next(values, 0))
+                else:
+                    continue
+                color = ANSI_TO_VGA[color & 7] | color & 8
+                if value == 38:
+                    self.fg = color
+                else:
+                    self.bg = color
+        self.update_attribute()
+
+
+def spawn(command, rows, cols, term='xterm'):
+    """Run a command in a new pseudo-terminal of the given size, return its pid and
+       the file descriptor of the master side"""
+    pid, fd = pty.fork()
+    if pid == 0:
+        # set the size before the command starts, so it doesn't see a 0x0 terminal
+        fcntl.ioctl(pty.STDIN_FILENO, termios.TIOCSWINSZ, struct.pack("HHHH", rows, cols, 0, 0))
+        os.environ['TERM'] = term
+        try:
+            os.execvp(command[0], command)
+        except OSError as e:
+            print("Couldn't run {}: {}".format(command[0], e))
+        os._exit(127)
+    return pid, fd